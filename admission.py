@@ -0,0 +1,157 @@
+from typing import Deque, Optional
+from collections import deque
+from contextlib import contextmanager
+import asyncio
+import os
+import threading
+
+import metrics
+
+
+# 同時に実行できるツール呼び出しの数（anyioのスレッドプールの上限40より小さくする）
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 32))
+# 実行を待てるツール呼び出しの数（超えた分はすぐにoverloadedを返す）
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+# ツール呼び出しが実行を待つ時間の上限（秒）
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 5))
+# 同時に実行できるGoogle APIの呼び出しの数（全ユーザー・全スレッドの合計）
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", 16))
+# Google APIの呼び出しを待てる数と、待つ時間の上限（秒）
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", 64))
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SECONDS", 10))
+
+
+class OverloadedError(Exception):
+    """同時実行数の上限を超え、待ち行列にも入れなかった（または待ち時間の上限を過ぎた）"""
+
+    def __init__(self, limiter: str, reason: str, retry_after_seconds: float):
+        super().__init__(f"overloaded: {limiter} limit exceeded ({reason}); retry after {retry_after_seconds:g} seconds")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+
+    def as_dict(self):
+        return {
+            "error": "overloaded",
+            "message": str(self),
+            "retry_after_seconds": self.retry_after_seconds
+        }
+
+
+class _Waiter:
+    """待ち行列に並んでいる呼び出し（スレッドはEvent、イベントループはFutureで待つ）"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """同時実行数の上限と、上限に達したときの待ち行列（長さと待ち時間の上限つき）
+
+    空いた枠は待ち行列の先頭から順に渡す。スレッドからはslot()、イベントループからはacquire_async()で使う。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout_seconds: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        metrics.register_gauge(f'{name}_in_flight', lambda: self.in_flight)
+        metrics.register_gauge(f'{name}_queued', lambda: len(self._waiters))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str) -> OverloadedError:
+        metrics.increment(f'{self.name}_rejected', reason)
+        return OverloadedError(self.name, reason, self.queue_timeout_seconds)
+
+    def _enter(self, waiter_factory) -> Optional[_Waiter]:
+        """すぐに実行できる場合はNone、待つ場合は待ち行列に入れたWaiterを返す"""
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject('queue_full')
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter: _Waiter) -> bool:
+        """待ち終えたWaiterを片付け、枠を受け取っていたかどうかを返す"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire(self):
+        """枠が空くまで待つ（待ち時間の上限を過ぎた場合はOverloadedError）"""
+        waiter = self._enter(_Waiter)
+        if waiter is None:
+            return
+        waiter.event.wait(self.queue_timeout_seconds)
+        if not self._leave_queue(waiter):
+            raise self._reject('timeout')
+
+    async def acquire_async(self):
+        """イベントループをブロックせずに枠が空くまで待つ（待ち時間の上限を過ぎた場合はOverloadedError）"""
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(lambda: _Waiter(loop))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # 枠を受け取った直後にキャンセルされた場合は枠を返す
+            if self._leave_queue(waiter):
+                self.release()
+            raise
+        if not self._leave_queue(waiter):
+            raise self._reject('timeout')
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # 枠を減らさずに待ち行列の先頭に渡す
+                self._waiters.popleft().wake()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+tool_call_limiter = ConcurrencyLimiter(
+    'tool_calls', ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS
+)
+upstream_limiter = ConcurrencyLimiter(
+    'upstream_calls', UPSTREAM_MAX_CONCURRENCY, UPSTREAM_MAX_QUEUE, UPSTREAM_QUEUE_TIMEOUT_SECONDS
+)
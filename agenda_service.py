@@ -0,0 +1,142 @@
+from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta
+import os
+from models import get_db
+from google_api import get_google_services, AuthenticationRequiredException
+from admission import OverloadedError
+from compact import compact_items
+from search import index_items
+from todo_service import _fetch_todos
+from todo_cache import todo_list_cache
+from event_service import _list_window_events, _list_limited_events, _within_fill_limit, _prune_windows, _as_utc, LOCAL_TZ
+from event_cache import event_window_cache
+
+
+# アジェンダの items に返す項目（イベントと期限日のTODO）の最大数
+AGENDA_MAX_ITEMS = int(os.getenv("AGENDA_MAX_ITEMS", 100))
+
+
+def _due_at(todo: Dict) -> Optional[datetime]:
+    """TODOの期限日の開始時刻（ローカルタイムゾーン）を返す
+
+    Google Tasksの期限は日付のみで、時刻部分は常に00:00:00Zになっている。
+    """
+    due = todo.get('due')
+    if not due:
+        return None
+    return datetime.combine(date.fromisoformat(due[:10]), time.min, tzinfo=LOCAL_TZ)
+
+
+def _fetch_windows(calendar_service, user_id: str, windows: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime, List[Dict]]]:
+    """キャッシュで覆われていない期間のイベントを順に取得する（1つのサービスを複数のスレッドで共有しない）"""
+    return [(start, end, _list_window_events(calendar_service, user_id, start, end)) for start, end in windows]
+
+
+def get_agenda(user_id: str, start_date: datetime, end_date: datetime, compact: bool = False) -> Dict:
+    """指定期間のイベントと期限のある未完了のTODOを時刻順にまとめたアジェンダを返す
+
+    クレデンシャルの読み込みは1回だけ行い、Google TasksとGoogle Calendarからは同時に取得する。
+    キャッシュ済みの一覧や期間はそのまま使う。覆われていない期間がEVENT_CACHE_MAX_FILL_DAYSより長い場合は、
+    キャッシュに入れずにAGENDA_MAX_ITEMS件のイベントだけを1回で取得する。itemsはAGENDA_MAX_ITEMS件までにする。
+    """
+    from google.auth.exceptions import RefreshError
+
+    window_start, window_end = _as_utc(start_date), _as_utc(end_date)
+    todo_generation = todo_list_cache.generation(user_id)
+    event_generation = event_window_cache.generation(user_id)
+    todos = todo_list_cache.get(user_id, 'active')
+    events, uncovered = event_window_cache.lookup(user_id, window_start, window_end)
+    # 長い期間はキャッシュを埋めるために全件を取得せず、期間の先頭から上限件数だけを取得する
+    fill_cache = _within_fill_limit(uncovered)
+
+    if todos is None or uncovered:
+        # データベースセッションを取得（Credentials用）
+        db = next(get_db())
+
+        try:
+            tasks_service, calendar_service = get_google_services(user_id, db)
+            if tasks_service is None or calendar_service is None:
+                print(f"[ERROR] Google services not available for user {user_id}")
+                return {"error": "Google services not available (authentication may be expired)"}
+
+            # TasksとCalendarはそれぞれのサービス（HTTP接続）で同時に取得する
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='agenda') as executor:
+                todos_future = executor.submit(_fetch_todos, tasks_service, user_id, 'active') if todos is None else None
+                if not uncovered:
+                    events_future = None
+                elif fill_cache:
+                    events_future = executor.submit(_fetch_windows, calendar_service, user_id, uncovered)
+                else:
+                    events_future = executor.submit(_list_limited_events, calendar_service, user_id,
+                                                    window_start, window_end, AGENDA_MAX_ITEMS)
+                fetched_todos = todos_future.result() if todos_future else None
+                fetched_windows = events_future.result() if events_future and fill_cache else []
+                limited_events = events_future.result() if events_future and not fill_cache else None
+
+            # DBのセッションはスレッド間で共有できないので、キャッシュと検索インデックスの更新は呼び出し元のスレッドで行う
+            if fetched_todos is not None:
+                todos = fetched_todos
+                index_items(db, user_id, 'todo', todos)
+                todo_list_cache.store(user_id, 'active', todos, todo_generation)
+            if limited_events is not None:
+                # 期間の一部しか取得していないので、キャッシュには入れずにキャッシュ済みのイベントとも混ぜない
+                events = limited_events
+                index_items(db, user_id, 'event', events)
+            else:
+                fetched_events = []
+                for start, end, window_events in fetched_windows:
+                    event_window_cache.store(user_id, start, end, window_events, event_generation)
+                    fetched_events.extend(window_events)
+                index_items(db, user_id, 'event', fetched_events)
+                _prune_windows(db, user_id, fetched_windows)
+                events_by_id = {event['google_event_id']: event for event in events}
+                events_by_id.update((event['google_event_id'], event) for event in fetched_events)
+                events = list(events_by_id.values())
+        except (AuthenticationRequiredException, RefreshError) as e:
+            # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+            print(f"[ERROR] Authentication required for user {user_id}: {e}")
+            return {
+                "error": "authentication_required",
+                "message": str(e),
+                "action": "re-authenticate"
+            }
+        except OverloadedError as e:
+            # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+            print(f"[WARNING] {e} (user {user_id})")
+            return e.as_dict()
+        except Exception as e:
+            print(f"[ERROR] Google API error in get_agenda for user {user_id}: {type(e).__name__}: {e}")
+            if hasattr(e, 'resp') and e.resp:
+                print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+            return {"error": f"Google API error: {type(e).__name__}: {e}"}
+        finally:
+            # コネクションプールへ確実に返却する
+            db.close()
+
+    # 期限日が期間に重なるTODOをイベントと並べる（同じ時刻ではTODOを先にする）
+    entries = [(event['start_time'], 1, dict(event, type='event')) for event in events]
+    undated_todos = []
+    for todo in todos:
+        due_at = _due_at(todo)
+        if due_at is None:
+            undated_todos.append(todo)
+        elif due_at < window_end and due_at + timedelta(days=1) > window_start:
+            entries.append((due_at, 0, dict(todo, type='todo')))
+    entries.sort(key=lambda entry: entry[:2])
+    truncated = len(entries) > AGENDA_MAX_ITEMS
+    items = [item for _, _, item in entries[:AGENDA_MAX_ITEMS]]
+
+    print(f"[get_agenda] user_id: {user_id}, {len(events)} events, {len(entries) - len(events)} dated todos, "
+          f"{len(undated_todos)} undated todos (truncated: {truncated})")
+
+    if compact:
+        items = compact_items(items)
+        undated_todos = compact_items(undated_todos)
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'items': items,
+        'truncated': truncated,
+        'undated_todos': undated_todos,
+    }
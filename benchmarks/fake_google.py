@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Google Tasks / Google Calendar APIのローカルスタブサーバー
+
+ベンチマークや負荷試験でGoogleのAPIを呼ばずにサーバーを動かすためのもの。
+google_api.pyの GOOGLE_TASKS_API_ENDPOINT / GOOGLE_CALENDAR_API_ENDPOINT を
+このサーバーに向けて使う。
+
+    python -m benchmarks.fake_google --port 8900 --latency-ms 50
+"""
+
+import argparse
+import email.parser
+import json
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def _now_rfc3339() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z')
+
+
+# 回数（COUNT）が指定されていない定期的な予定を展開するインスタンスの数
+RECURRENCE_EXPAND_LIMIT = 10
+_FREQ_INTERVALS = {'DAILY': timedelta(days=1), 'WEEKLY': timedelta(weeks=1)}
+
+
+def _event_time(event: dict, key: str) -> str:
+    """イベントの開始・終了を比較用の文字列で返す（終日のイベントは日付）"""
+    return event[key].get('dateTime') or event[key].get('date')
+
+
+def _expand_recurrence(event: dict) -> list:
+    """singleEvents=trueの場合のように、定期的な予定（DAILY / WEEKLYのRRULE）をインスタンスに展開する"""
+    rrule = next((rule[len('RRULE:'):] for rule in event.get('recurrence') or [] if rule.startswith('RRULE:')), None)
+    if not rrule or not event['start'].get('dateTime'):
+        return [event]
+    parts = dict(part.split('=', 1) for part in rrule.split(';'))
+    interval = _FREQ_INTERVALS.get(parts.get('FREQ'))
+    if interval is None:
+        return [event]
+    start = datetime.fromisoformat(event['start']['dateTime'].replace('Z', '+00:00'))
+    end = datetime.fromisoformat(event['end']['dateTime'].replace('Z', '+00:00'))
+    instances = []
+    for i in range(int(parts.get('COUNT', RECURRENCE_EXPAND_LIMIT))):
+        instance = {key: value for key, value in event.items() if key != 'recurrence'}
+        instance_start = start + interval * i
+        instance['id'] = f"{event['id']}_{instance_start.strftime('%Y%m%dT%H%M%SZ')}"
+        instance['recurringEventId'] = event['id']
+        instance['start'] = {'dateTime': instance_start.isoformat().replace('+00:00', 'Z')}
+        instance['end'] = {'dateTime': (end + interval * i).isoformat().replace('+00:00', 'Z')}
+        instances.append(instance)
+    return instances
+
+
+class FakeGoogleStore:
+    """スタブサーバーが保持するタスクとイベントのインメモリストア"""
+
+    def __init__(self, seed_tasks: int = 20, seed_events: int = 20):
+        self.lock = threading.Lock()
+        self.tasklists = [{'id': 'default', 'title': 'My Tasks', 'updated': _now_rfc3339()}]
+        self.tasks: dict = {'default': {}}
+        self.events: dict = {'primary': {}}
+        # イベントの変更番号（同期トークンの代わりに使う）と、events().watchで登録されたチャンネル
+        self.change_counter = 0
+        self.event_changes: dict = {}
+        self.channels: dict = {}
+
+        for i in range(seed_tasks):
+            self.insert_task('default', {
+                'title': f"Seed task {i}",
+                'notes': f"Seed task description {i}",
+                'status': 'completed' if i % 3 == 0 else 'needsAction',
+            })
+
+        base = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        for i in range(seed_events):
+            start = base + timedelta(hours=i * 5)
+            self.insert_event('primary', {
+                'summary': f"Seed event {i}",
+                'description': f"Seed event description {i}",
+                'location': 'Tokyo',
+                'start': {'dateTime': start.isoformat().replace('+00:00', 'Z')},
+                'end': {'dateTime': (start + timedelta(hours=1)).isoformat().replace('+00:00', 'Z')},
+            })
+
+    def insert_task(self, tasklist: str, body: dict) -> dict:
+        task = dict(body)
+        task['id'] = uuid.uuid4().hex
+        task.setdefault('status', 'needsAction')
+        task['updated'] = _now_rfc3339()
+        with self.lock:
+            self.tasks.setdefault(tasklist, {})[task['id']] = task
+        return task
+
+    def delete_task(self, tasklist: str, task_id: str) -> bool:
+        """タスクを削除する（showDeletedで取得できるようdeletedとして残す）"""
+        with self.lock:
+            task = self.tasks.get(tasklist, {}).get(task_id)
+            if task is None or task.get('deleted'):
+                return False
+            task['deleted'] = True
+            task['updated'] = _now_rfc3339()
+        return True
+
+    def insert_event(self, calendar_id: str, body: dict) -> dict:
+        event = dict(body)
+        # 文字列比較で期間を絞り込めるよう、日時はUTCの'Z'表記にそろえる
+        for key in ('start', 'end'):
+            value = event.get(key, {}).get('dateTime')
+            if value:
+                parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                if parsed.tzinfo is None:
+                    parsed = parsed.replace(tzinfo=timezone(timedelta(hours=9)))
+                event[key] = {'dateTime': parsed.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')}
+        # クライアントがIDを指定した場合はそのIDで作成する（同じIDは409になる）
+        event['id'] = body.get('id') or uuid.uuid4().hex
+        event['created'] = event['updated'] = _now_rfc3339()
+        event.setdefault('status', 'confirmed')
+        with self.lock:
+            events = self.events.setdefault(calendar_id, {})
+            if event['id'] in events:
+                return None
+            events[event['id']] = event
+            self._record_change(calendar_id, event['id'])
+        self.notify(calendar_id)
+        return event
+
+    def delete_event(self, calendar_id: str, event_id: str) -> bool:
+        """イベントを削除する（同期トークンで差分を取得できるようcancelledとして残す）"""
+        with self.lock:
+            event = self.events.get(calendar_id, {}).get(event_id)
+            if event is None or event.get('status') == 'cancelled':
+                return False
+            event['status'] = 'cancelled'
+            event['updated'] = _now_rfc3339()
+            self._record_change(calendar_id, event_id)
+        self.notify(calendar_id)
+        return True
+
+    def _record_change(self, calendar_id: str, event_id: str):
+        self.change_counter += 1
+        self.event_changes[(calendar_id, event_id)] = self.change_counter
+
+    def changed_events(self, calendar_id: str, since: int) -> list:
+        with self.lock:
+            return [event for event in self.events.get(calendar_id, {}).values()
+                    if self.event_changes.get((calendar_id, event['id']), 0) > since]
+
+    def watch(self, calendar_id: str, body: dict) -> dict:
+        """チャンネルを登録し、Googleと同様に最初にsyncの通知を送る"""
+        ttl = int((body.get('params') or {}).get('ttl', 7 * 24 * 60 * 60))
+        channel = {
+            'kind': 'api#channel',
+            'id': body['id'],
+            'resourceId': uuid.uuid4().hex,
+            'resourceUri': f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events",
+            'token': body.get('token'),
+            'expiration': str(int((time.time() + ttl) * 1000)),
+        }
+        with self.lock:
+            self.channels[channel['id']] = dict(channel, calendar=calendar_id, address=body['address'], message_number=0)
+        self._post_notification(channel['id'], 'sync')
+        return channel
+
+    def stop_channel(self, channel_id: str, resource_id: str) -> bool:
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if channel is None or channel['resourceId'] != resource_id:
+                return False
+            del self.channels[channel_id]
+        return True
+
+    def notify(self, calendar_id: str):
+        """カレンダーを監視しているチャンネルに変更を通知する"""
+        with self.lock:
+            channel_ids = [c['id'] for c in self.channels.values() if c['calendar'] == calendar_id]
+        for channel_id in channel_ids:
+            self._post_notification(channel_id, 'exists')
+
+    def _post_notification(self, channel_id: str, state: str):
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                return
+            channel['message_number'] += 1
+            headers = {
+                'X-Goog-Channel-ID': channel['id'],
+                'X-Goog-Channel-Expiration': channel['expiration'],
+                'X-Goog-Resource-ID': channel['resourceId'],
+                'X-Goog-Resource-URI': channel['resourceUri'],
+                'X-Goog-Resource-State': state,
+                'X-Goog-Message-Number': str(channel['message_number']),
+            }
+            if channel['token']:
+                headers['X-Goog-Channel-Token'] = channel['token']
+            address = channel['address']
+
+        def post():
+            try:
+                request = urllib.request.Request(address, data=b'', headers=headers, method='POST')
+                urllib.request.urlopen(request, timeout=10).close()
+            except Exception as e:
+                print(f"[fake_google] Failed to post notification to {address}: {type(e).__name__}: {e}")
+
+        # Googleと同様に、APIのレスポンスとは非同期に通知する
+        threading.Thread(target=post, daemon=True).start()
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    """Google APIのURL体系を模したリクエストハンドラー"""
+
+    store: FakeGoogleStore = None
+    latency: float = 0.0
+
+    # (メソッド, パス正規表現, ハンドラー名)
+    routes = [
+        ('GET', r'^/tasks/v1/users/@me/lists$', 'list_tasklists'),
+        ('GET', r'^/tasks/v1/lists/(?P<tasklist>[^/]+)/tasks$', 'list_tasks'),
+        ('POST', r'^/tasks/v1/lists/(?P<tasklist>[^/]+)/tasks$', 'insert_task'),
+        ('GET', r'^/tasks/v1/lists/(?P<tasklist>[^/]+)/tasks/(?P<task>[^/]+)$', 'get_task'),
+        ('PATCH', r'^/tasks/v1/lists/(?P<tasklist>[^/]+)/tasks/(?P<task>[^/]+)$', 'patch_task'),
+        ('DELETE', r'^/tasks/v1/lists/(?P<tasklist>[^/]+)/tasks/(?P<task>[^/]+)$', 'delete_task'),
+        ('GET', r'^/calendar/v3/calendars/(?P<calendar>[^/]+)/events$', 'list_events'),
+        ('POST', r'^/calendar/v3/calendars/(?P<calendar>[^/]+)/events$', 'insert_event'),
+        ('POST', r'^/calendar/v3/calendars/(?P<calendar>[^/]+)/events/watch$', 'watch_events'),
+        ('GET', r'^/calendar/v3/calendars/(?P<calendar>[^/]+)/events/(?P<event>[^/]+)$', 'get_event'),
+        ('DELETE', r'^/calendar/v3/calendars/(?P<calendar>[^/]+)/events/(?P<event>[^/]+)$', 'delete_event'),
+        ('POST', r'^/calendar/v3/channels/stop$', 'stop_channel'),
+        ('POST', r'^/calendar/v3/freeBusy$', 'freebusy'),
+    ]
+
+    def log_message(self, format, *args):
+        # アクセスログは負荷試験の出力を汚すので抑制する
+        pass
+
+    def _dispatch(self, method: str):
+        if self.latency:
+            time.sleep(self.latency)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        path = urlparse(self.path).path
+        if method == 'POST' and re.match(r'^(/calendar/v3)?/batch(/.*)?$', path):
+            self._send_batch(raw_body)
+            return
+        status, payload = self._route(method, self.path, json.loads(raw_body) if raw_body else None)
+        self._send(status, payload)
+
+    def _route(self, method: str, target: str, body):
+        parsed = urlparse(target)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        for route_method, pattern, handler_name in self.routes:
+            if route_method != method:
+                continue
+            match = re.match(pattern, parsed.path)
+            if match:
+                return getattr(self, handler_name)(query, body, **match.groupdict())
+        return 404, {'error': {'code': 404, 'message': f"Not found: {method} {parsed.path}"}}
+
+    def _send_batch(self, raw_body: bytes):
+        """multipart/mixedのバッチリクエストを個々のリクエストとして処理する"""
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + raw_body
+        )
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request_text = part.get_payload()
+            head, _, body = request_text.replace('\r\n', '\n').partition('\n\n')
+            method, target = head.split('\n', 1)[0].split(' ')[:2]
+            status, payload = self._route(method, target, json.loads(body) if body.strip() else None)
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            response_body = json.dumps(payload)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\nContent-Length: {len(response_body.encode('utf-8'))}\r\n\r\n"
+                f"{response_body}\r\n"
+            )
+        data = (''.join(parts) + f"--{boundary}--\r\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/mixed; boundary={boundary}")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send(self, status: int, payload: dict):
+        if payload is None:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    # --- Google Tasks ---
+
+    def list_tasklists(self, query, body):
+        return 200, {'kind': 'tasks#taskLists', 'items': list(self.store.tasklists)}
+
+    def list_tasks(self, query, body, tasklist):
+        with self.store.lock:
+            items = list(self.store.tasks.get(tasklist, {}).values())
+        if query.get('showDeleted') != 'true':
+            items = [t for t in items if not t.get('deleted')]
+        # Googleと同様に、完了済みはデフォルトで含め、非表示（完了してクリアした）タスクは含めない
+        if query.get('showCompleted') == 'false':
+            items = [t for t in items if t.get('status') != 'completed']
+        if query.get('showHidden') != 'true':
+            items = [t for t in items if not t.get('hidden')]
+        if query.get('updatedMin'):
+            items = [t for t in items if t['updated'] >= query['updatedMin']]
+        max_results = int(query.get('maxResults', 100))
+        offset = int(query.get('pageToken', 0))
+        response = {'kind': 'tasks#tasks', 'items': items[offset:offset + max_results]}
+        if offset + max_results < len(items):
+            response['nextPageToken'] = str(offset + max_results)
+        return 200, response
+
+    def insert_task(self, query, body, tasklist):
+        return 200, self.store.insert_task(tasklist, body or {})
+
+    def get_task(self, query, body, tasklist, task):
+        with self.store.lock:
+            item = self.store.tasks.get(tasklist, {}).get(task)
+        if item is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        return 200, item
+
+    def patch_task(self, query, body, tasklist, task):
+        with self.store.lock:
+            item = self.store.tasks.get(tasklist, {}).get(task)
+            if item is None:
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            item.update(body or {})
+            item['updated'] = _now_rfc3339()
+            return 200, dict(item)
+
+    def delete_task(self, query, body, tasklist, task):
+        if not self.store.delete_task(tasklist, task):
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        return 204, None
+
+    # --- Google Calendar ---
+
+    def list_events(self, query, body, calendar):
+        sync_token = query.get('syncToken')
+        if sync_token is not None:
+            if not sync_token.isdigit() or int(sync_token) > self.store.change_counter:
+                return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid, a full sync is required.',
+                                       'errors': [{'reason': 'fullSyncRequired'}]}}
+            # 同期トークン以降に変更されたイベント（削除済みを含む）を返す
+            items = self.store.changed_events(calendar, int(sync_token))
+        else:
+            with self.store.lock:
+                items = list(self.store.events.get(calendar, {}).values())
+            if query.get('showDeleted') != 'true':
+                items = [e for e in items if e.get('status') != 'cancelled']
+        if query.get('updatedMin'):
+            items = [e for e in items if e['updated'] >= query['updatedMin']]
+        if query.get('singleEvents') == 'true':
+            items = [instance for event in items for instance in _expand_recurrence(event)]
+        time_min = query.get('timeMin')
+        time_max = query.get('timeMax')
+        if time_min:
+            items = [e for e in items if _event_time(e, 'end') > time_min]
+        if time_max:
+            items = [e for e in items if _event_time(e, 'start') < time_max]
+        items.sort(key=lambda e: _event_time(e, 'start'))
+
+        max_results = int(query.get('maxResults', 250))
+        offset = int(query.get('pageToken', 0))
+        response = {'kind': 'calendar#events', 'items': items[offset:offset + max_results]}
+        if offset + max_results < len(items):
+            response['nextPageToken'] = str(offset + max_results)
+        else:
+            response['nextSyncToken'] = str(self.store.change_counter)
+        return 200, response
+
+    def watch_events(self, query, body, calendar):
+        return 200, self.store.watch(calendar, body or {})
+
+    def delete_event(self, query, body, calendar, event):
+        if not self.store.delete_event(calendar, event):
+            return 410, {'error': {'code': 410, 'message': 'Resource has been deleted'}}
+        return 204, None
+
+    def stop_channel(self, query, body, **kwargs):
+        body = body or {}
+        if not self.store.stop_channel(body.get('id'), body.get('resourceId')):
+            return 404, {'error': {'code': 404, 'message': 'Channel not found'}}
+        return 204, None
+
+    def insert_event(self, query, body, calendar):
+        event = self.store.insert_event(calendar, body or {})
+        if event is None:
+            return 409, {'error': {'code': 409, 'message': 'The requested identifier already exists.'}}
+        return 200, event
+
+    def get_event(self, query, body, calendar, event):
+        with self.store.lock:
+            item = self.store.events.get(calendar, {}).get(event)
+        if item is None:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        return 200, item
+
+    def freebusy(self, query, body, **kwargs):
+        body = body or {}
+        time_min = body.get('timeMin', '')
+        time_max = body.get('timeMax', '9999')
+        calendars = {}
+        for item in body.get('items', []):
+            with self.store.lock:
+                events = list(self.store.events.get(item['id'], {}).values())
+            calendars[item['id']] = {'busy': [
+                {'start': e['start']['dateTime'], 'end': e['end']['dateTime']}
+                for e in sorted((e for e in events if e['start'].get('dateTime')), key=lambda e: e['start']['dateTime'])
+                if e['end']['dateTime'] > time_min and e['start']['dateTime'] < time_max
+            ]}
+        return 200, {'kind': 'calendar#freeBusy', 'timeMin': time_min, 'timeMax': time_max, 'calendars': calendars}
+
+
+def start_fake_google(host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0.0,
+                      store: FakeGoogleStore = None) -> ThreadingHTTPServer:
+    """スタブサーバーをバックグラウンドスレッドで起動して返す
+
+    port=0の場合は空いているポートが割り当てられる（server.server_portで取得可能）。
+    """
+    handler = type('BoundFakeGoogleHandler', (FakeGoogleHandler,), {
+        'store': store or FakeGoogleStore(),
+        'latency': latency_ms / 1000.0,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def endpoint_env(server: ThreadingHTTPServer) -> dict:
+    """MCPサーバーをスタブに向けるための環境変数を返す"""
+    host, port = server.server_address[:2]
+    base_url = f"http://{host}:{port}"
+    return {
+        'GOOGLE_TASKS_API_ENDPOINT': f"{base_url}/",
+        'GOOGLE_CALENDAR_API_ENDPOINT': f"{base_url}/calendar/v3/",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Google Tasks/Calendar APIのローカルスタブサーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="各レスポンスに加える遅延（ミリ秒）")
+    args = parser.parse_args()
+
+    server = start_fake_google(args.host, args.port, args.latency_ms)
+    for key, value in endpoint_env(server).items():
+        print(f"{key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
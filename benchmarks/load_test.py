@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""MCP SSEサーバーの負荷試験・ベンチマーク
+
+ローカルのGoogle APIスタブ（benchmarks/fake_google.py）に向けてmain.pyを起動し、
+N個の並行MCPクライアントからツール呼び出しを実行して
+レイテンシ（p50/p95/p99）、スループット、サーバーのメモリ使用量を計測する。
+結果はJSONで保存し、--compareで以前の結果と比較できる。
+
+    python -m benchmarks.load_test --clients 20 --requests 50
+    python -m benchmarks.load_test --compare benchmarks/results/20250601-120000.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from benchmarks.fake_google import start_fake_google, endpoint_env
+
+
+DEFAULT_MIX = "add_todo_endpoint=1,get_all_todos_endpoint=3,get_all_events_endpoint=3"
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+
+def parse_mix(mix: str) -> dict:
+    """"tool=weight,tool=weight" 形式の呼び出し比率を辞書に変換する"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values: list, pct: float) -> float:
+    """最近傍法でパーセンタイル値を求める"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize_latencies(latencies: list) -> dict:
+    """レイテンシ（秒）のリストから統計値（ミリ秒）を作成する"""
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def build_arguments(tool: str, user_id: str) -> dict:
+    """ツールごとの現実的な呼び出し引数を作成する"""
+    if tool == 'add_todo_endpoint':
+        return {'user_id': user_id, 'title': f"bench {random.randint(0, 1_000_000)}", 'description': 'load test'}
+    if tool == 'get_all_todos_endpoint':
+        return {'user_id': user_id, 'filter_status': random.choice(['all', 'active', 'completed'])}
+    if tool == 'get_all_events_endpoint':
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        days = random.choice([1, 3, 7])
+        return {
+            'user_id': user_id,
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=days)).isoformat(),
+        }
+    return {'user_id': user_id}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _read_rss_kb(pid: int) -> dict:
+    """/proc からプロセスの常駐メモリ（現在値とピーク値）を読む（Linuxのみ）"""
+    result = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    result[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return result
+
+
+def prepare_database(path: str, users: list):
+    """ベンチマーク用のSQLiteデータベースにダミーのクレデンシャルを作成する"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from models import Base, GoogleCredentials
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for user_id in users:
+        session.add(GoogleCredentials(user_id=user_id, token_json=json.dumps({
+            'token': 'bench-token',
+            'refresh_token': 'bench-refresh-token',
+            'token_uri': 'https://oauth2.googleapis.com/token',
+            'client_id': 'bench-client',
+            'client_secret': 'bench-secret',
+            'scopes': ['https://www.googleapis.com/auth/tasks', 'https://www.googleapis.com/auth/calendar'],
+        })))
+    session.commit()
+    session.close()
+    engine.dispose()
+
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    """main.pyをサブプロセスとして起動し、ポートが開くまで待つ"""
+    server_env = dict(os.environ)
+    server_env.update(env)
+    server_env['PORT'] = str(port)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, 'main.py')],
+        cwd=ROOT_DIR, env=server_env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited early with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server did not start within 30 seconds")
+
+
+async def run_client(url: str, user_id: str, requests: int, weights: dict, samples: dict, errors: dict):
+    """1つのMCPクライアントとして指定回数ツールを呼び出す"""
+    from fastmcp import Client
+    from fastmcp.client.transports import SSETransport
+
+    tools = list(weights.keys())
+    tool_weights = list(weights.values())
+    async with Client(SSETransport(url)) as client:
+        for _ in range(requests):
+            tool = random.choices(tools, tool_weights)[0]
+            started = time.perf_counter()
+            try:
+                await client.call_tool(tool, build_arguments(tool, user_id))
+            except Exception as e:
+                errors[tool] = errors.get(tool, 0) + 1
+                print(f"[load_test] {tool} failed: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            samples.setdefault(tool, []).append(time.perf_counter() - started)
+
+
+async def sample_memory(pid: int, memory: list, stop: asyncio.Event, interval: float = 0.25):
+    """負荷試験中のサーバーのメモリ使用量を定期的に記録する"""
+    while not stop.is_set():
+        rss = _read_rss_kb(pid)
+        if rss:
+            memory.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(url: str, pid: int, clients: int, requests: int, users: list, weights: dict) -> dict:
+    samples: dict = {}
+    errors: dict = {}
+    memory: list = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(pid, memory, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        run_client(url, users[i % len(users)], requests, weights, samples, errors)
+        for i in range(clients)
+    ])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    all_latencies = [value for values in samples.values() for value in values]
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'overall': summarize_latencies(all_latencies),
+        'tools': {tool: summarize_latencies(values) for tool, values in sorted(samples.items())},
+        'memory': {
+            'rss_start_mb': round(memory[0].get('VmRSS', 0) / 1024, 1) if memory else None,
+            'rss_end_mb': round(memory[-1].get('VmRSS', 0) / 1024, 1) if memory else None,
+            'rss_peak_mb': round(max(m.get('VmHWM', 0) for m in memory) / 1024, 1) if memory else None,
+        },
+    }
+
+
+def compare_results(previous: dict, current: dict) -> list:
+    """以前の結果と比較して差分の行を作成する"""
+    lines = []
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        before = previous.get('overall', {}).get(key)
+        after = current['overall'][key]
+        if before:
+            lines.append(f"  overall {key}: {before} -> {after} ({(after - before) / before * 100:+.1f}%)")
+    before = previous.get('throughput_rps')
+    if before:
+        after = current['throughput_rps']
+        lines.append(f"  throughput_rps: {before} -> {after} ({(after - before) / before * 100:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP SSEサーバーの負荷試験")
+    parser.add_argument('--clients', type=int, default=10, help="並行クライアント数")
+    parser.add_argument('--requests', type=int, default=20, help="クライアントあたりの呼び出し回数")
+    parser.add_argument('--users', type=int, default=5, help="ダミーユーザー数")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="ツール呼び出しの比率 (tool=weight,...)")
+    parser.add_argument('--upstream-latency-ms', type=float, default=20.0, help="スタブのレスポンス遅延")
+    parser.add_argument('--output', help="結果を保存するJSONファイル（省略時はbenchmarks/results/に保存）")
+    parser.add_argument('--compare', help="比較対象の以前の結果JSONファイル")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    weights = parse_mix(args.mix)
+    users = [f"bench_user_{i}" for i in range(args.users)]
+
+    fake_google = start_fake_google(latency_ms=args.upstream_latency_ms)
+    workdir = tempfile.mkdtemp(prefix='juiz-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    prepare_database(db_path, users)
+
+    port = _free_port()
+    env = endpoint_env(fake_google)
+    env['DATABASE_URL'] = f"sqlite:///{db_path}"
+    startup_started = time.perf_counter()
+    server = start_server(port, env)
+    server_startup_s = round(time.perf_counter() - startup_started, 3)
+    try:
+        results = asyncio.run(run_load(
+            f"http://127.0.0.1:{port}/sse", server.pid,
+            args.clients, args.requests, users, weights,
+        ))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        fake_google.shutdown()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'clients': args.clients,
+            'requests_per_client': args.requests,
+            'users': args.users,
+            'mix': weights,
+            'upstream_latency_ms': args.upstream_latency_ms,
+            'python': sys.version.split()[0],
+        },
+        'server_startup_s': server_startup_s,
+        **results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"[load_test] results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"[load_test] compared with {args.compare}:")
+        for line in compare_results(previous, report):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
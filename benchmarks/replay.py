@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""記録したMCPツール呼び出し（recorder.pyのJSONL）の再生
+
+記録時のタイミングを保ったまま、または--speedで倍速にしてツール呼び出しを再発行する。
+--urlを省略した場合はload_testと同じくローカルのGoogle APIスタブに向けたサーバーを起動し、
+記録に含まれる匿名化ユーザーIDのダミークレデンシャルを用意して再生する。
+
+    TOOL_CALL_RECORD_PATH=tool_calls.jsonl python main.py   # 記録
+    python -m benchmarks.replay tool_calls.jsonl --speed 4   # 4倍速で再生
+    python -m benchmarks.replay tool_calls.jsonl --url http://localhost:8000/sse --user-id test_user
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# プロジェクトのルートディレクトリをパスに追加
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from benchmarks.fake_google import start_fake_google, endpoint_env
+from benchmarks.load_test import (
+    RESULTS_DIR, _free_port, prepare_database, start_server, summarize_latencies,
+)
+
+
+def load_records(path: str) -> list:
+    """JSONLの記録を読み込み、開始時刻からのオフセット（秒）を付けて時刻順に並べる"""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r['timestamp'])
+    if records:
+        origin = datetime.fromisoformat(records[0]['timestamp'])
+        for record in records:
+            record['offset_s'] = (datetime.fromisoformat(record['timestamp']) - origin).total_seconds()
+    return records
+
+
+def schedule(records: list, speed: float = 1.0, copies: int = 1) -> list:
+    """再生スケジュール（オフセット秒, ツール名, 引数）を作成する
+
+    speedで時間軸を圧縮し、copiesで各呼び出しを別ユーザーとして複製して負荷を増やす。
+    """
+    plan = []
+    for record in records:
+        for copy in range(copies):
+            arguments = dict(record.get('arguments', {}))
+            if copies > 1 and 'user_id' in arguments:
+                arguments['user_id'] = f"{arguments['user_id']}_{copy}"
+            plan.append((record['offset_s'] / speed, record['tool'], arguments))
+    plan.sort(key=lambda item: item[0])
+    return plan
+
+
+async def replay(url: str, plan: list) -> dict:
+    """スケジュールどおりにツールを呼び出し、レイテンシと発行遅れを集計する"""
+    from fastmcp import Client
+    from fastmcp.client.transports import SSETransport
+
+    clients = {}
+    samples: dict = {}
+    lags = []
+    errors: dict = {}
+
+    async def get_client(user_id: str):
+        if user_id not in clients:
+            client = Client(SSETransport(url))
+            await client.__aenter__()
+            clients[user_id] = client
+        return clients[user_id]
+
+    async def issue(offset: float, tool: str, arguments: dict, origin: float):
+        delay = origin + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lags.append(max(0.0, time.perf_counter() - origin - offset))
+        started = time.perf_counter()
+        try:
+            client = await get_client(arguments.get('user_id', ''))
+            await client.call_tool(tool, arguments)
+        except Exception as e:
+            errors[tool] = errors.get(tool, 0) + 1
+            print(f"[replay] {tool} failed: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        samples.setdefault(tool, []).append(time.perf_counter() - started)
+
+    # クライアント接続を事前に確立して、接続時間がスケジュールを乱さないようにする
+    for user_id in {arguments.get('user_id', '') for _, _, arguments in plan}:
+        await get_client(user_id)
+
+    origin = time.perf_counter()
+    await asyncio.gather(*[issue(offset, tool, arguments, origin) for offset, tool, arguments in plan])
+    elapsed = time.perf_counter() - origin
+
+    for client in clients.values():
+        await client.__aexit__(None, None, None)
+
+    all_latencies = [value for values in samples.values() for value in values]
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'schedule_lag': summarize_latencies(lags),
+        'overall': summarize_latencies(all_latencies),
+        'tools': {tool: summarize_latencies(values) for tool, values in sorted(samples.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録したMCPツール呼び出しの再生")
+    parser.add_argument('record', help="recorder.pyが出力したJSONLファイル")
+    parser.add_argument('--url', help="再生先のSSEエンドポイント（省略時はスタブ付きでローカル起動）")
+    parser.add_argument('--speed', type=float, default=1.0, help="再生速度の倍率（2.0で2倍速）")
+    parser.add_argument('--copies', type=int, default=1, help="各呼び出しを別ユーザーとして複製する数")
+    parser.add_argument('--user-id', help="全ての呼び出しのuser_idをこの値に置き換える")
+    parser.add_argument('--upstream-latency-ms', type=float, default=20.0, help="スタブのレスポンス遅延")
+    parser.add_argument('--output', help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    records = load_records(args.record)
+    if args.user_id:
+        for record in records:
+            record.setdefault('arguments', {})['user_id'] = args.user_id
+    plan = schedule(records, args.speed, args.copies)
+    print(f"[replay] {len(plan)} calls over {plan[-1][0] if plan else 0:.1f}s (speed x{args.speed})")
+
+    server = fake_google = None
+    url = args.url
+    if not url:
+        fake_google = start_fake_google(latency_ms=args.upstream_latency_ms)
+        db_path = os.path.join(tempfile.mkdtemp(prefix='juiz-replay-'), 'replay.db')
+        prepare_database(db_path, sorted({arguments.get('user_id', '') for _, _, arguments in plan}))
+        port = _free_port()
+        env = endpoint_env(fake_google)
+        env['DATABASE_URL'] = f"sqlite:///{db_path}"
+        server = start_server(port, env)
+        url = f"http://127.0.0.1:{port}/sse"
+
+    try:
+        results = asyncio.run(replay(url, plan))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        if fake_google:
+            fake_google.shutdown()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {'record': args.record, 'speed': args.speed, 'copies': args.copies, 'url': args.url},
+        **results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"replay-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"[replay] results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""TODO/イベント辞書の作成とシリアライズのマイクロベンチマーク
+
+10,000件のGoogle Tasks/Calendarのレスポンスを模したデータで、
+_create_task_dict / _create_event_dict、RFC3339の解析方法、JSONエンコーダーを比較する。
+
+    python -m benchmarks.serialization_bench --items 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+# プロジェクトのルートディレクトリをパスに追加
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from event_service import _create_event_dict, _parse_rfc3339
+from todo_service import _create_task_dict
+
+
+def make_google_tasks(count: int) -> list:
+    return [{
+        'id': f"task{i}",
+        'title': f"Task {i}",
+        'notes': 'note ' * 10,
+        'status': 'completed' if i % 3 == 0 else 'needsAction',
+        'updated': '2025-06-05T00:00:00.000Z',
+    } for i in range(count)]
+
+
+def make_google_events(count: int) -> list:
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    events = []
+    for i in range(count):
+        start = base + timedelta(minutes=30 * i)
+        events.append({
+            'id': f"event{i}",
+            'summary': f"Event {i}",
+            'description': 'description ' * 5,
+            'location': 'Tokyo',
+            'start': {'dateTime': start.isoformat().replace('+00:00', 'Z')},
+            'end': {'dateTime': (start + timedelta(minutes=30)).isoformat().replace('+00:00', 'Z')},
+            'created': (base - timedelta(seconds=i)).isoformat().replace('+00:00', 'Z'),
+        })
+    return events
+
+
+def best_of(func, repeat: int) -> float:
+    """repeat回実行した中で最速の時間（ミリ秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def run(count: int, repeat: int) -> dict:
+    import pydantic_core
+
+    tasks = make_google_tasks(count)
+    events = make_google_events(count)
+    timestamps = [e['start']['dateTime'] for e in events] + [e['end']['dateTime'] for e in events]
+
+    @lru_cache(maxsize=4096)
+    def cached_parse(value):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+    task_dicts = [_create_task_dict(t, 'bench_user') for t in tasks]
+    event_dicts = [_create_event_dict(e, 'bench_user') for e in events]
+
+    return {
+        'items': count,
+        'create_task_dict_ms': best_of(lambda: [_create_task_dict(t, 'bench_user') for t in tasks], repeat),
+        'create_event_dict_ms': best_of(lambda: [_create_event_dict(e, 'bench_user') for e in events], repeat),
+        'parse_replace_fromisoformat_ms': best_of(
+            lambda: [datetime.fromisoformat(v.replace('Z', '+00:00')) for v in timestamps], repeat),
+        'parse_lru_cache_ms': best_of(lambda: (cached_parse.cache_clear(), [cached_parse(v) for v in timestamps]), repeat),
+        'parse_rfc3339_ms': best_of(lambda: [_parse_rfc3339(v) for v in timestamps], repeat),
+        # fastmcpはツールの戻り値をpydantic_coreでJSONにシリアライズする
+        'encode_tasks_pydantic_core_ms': best_of(lambda: pydantic_core.to_json(task_dicts), repeat),
+        'encode_events_pydantic_core_ms': best_of(lambda: pydantic_core.to_json(event_dicts), repeat),
+        'encode_events_json_dumps_ms': best_of(lambda: json.dumps(event_dicts, default=str), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TODO/イベント辞書のマイクロベンチマーク")
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        **run(args.items, args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,592 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""CSV / ICSファイルからのTODOとイベントの一括インポート
+
+他のツールからの移行のために、ファイルを1行（1コンポーネント）ずつ読みながら、
+GOOGLE_BATCH_LIMIT件ずつバッチリクエストでGoogleに作成する。ユーザーごとのリクエスト数は
+IMPORT_REQUESTS_PER_SECONDに抑え、Googleのレート制限で失敗した行は間隔を空けて再送する
+（失敗が返っても作成されていた行は、再送で二重に作成しない）。
+既にある（またはファイルの中で先に出てきた）同じタイトル・同じ日時のアイテムは作成せずにduplicateとする。
+
+    python bulk_import.py 1234 todos.csv
+    python bulk_import.py 1234 calendar.ics --report import_report.ndjson
+
+CSVは1行目を見出しとして、title（summary / subject）、description（notes）、completed、due、
+start（start_time）、end（end_time）、location の列を読む。start列がある場合はイベント、ない場合はTODOとする。
+ICSはVEVENTをイベント、VTODOをTODOとして読む（終日のイベントは対象外）。
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import get_db
+from google_api import get_google_services, new_batch_request, AuthenticationRequiredException, GOOGLE_BATCH_LIMIT
+from admission import OverloadedError
+from todo_service import _iter_todo_pages, _get_default_tasklist_id, _create_task_dict, TASK_FIELDS
+from todo_cache import todo_list_cache
+from event_service import (
+    _iter_window_event_pages, _build_event_body, _create_event_dict, _parse_rfc3339, _as_utc, _to_rfc3339_utc, EVENT_FIELDS,
+)
+from event_cache import event_window_cache
+from search import index_items
+
+
+# ユーザーごとのGoogle APIへのリクエスト数の上限（1秒あたり。バッチの中の個々のリクエストも1件と数える）
+IMPORT_REQUESTS_PER_SECOND = float(os.getenv("IMPORT_REQUESTS_PER_SECOND", 10))
+# レート制限やGoogleの一時的な障害で失敗した行を再送する回数と、再送の間隔（指数バックオフの初期値、秒）
+IMPORT_MAX_RETRIES = int(os.getenv("IMPORT_MAX_RETRIES", 3))
+IMPORT_RETRY_BASE_SECONDS = float(os.getenv("IMPORT_RETRY_BASE_SECONDS", 2))
+
+# 再送すれば成功する可能性があるHTTPステータス（403はレート制限の場合のみ）
+_RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+_CSV_COLUMNS = {
+    'title': ('title', 'summary', 'subject', 'name'),
+    'description': ('description', 'notes'),
+    'completed': ('completed', 'done', 'status'),
+    'due': ('due', 'due_date'),
+    'start_time': ('start', 'start_time', 'start_date'),
+    'end_time': ('end', 'end_time', 'end_date'),
+    'location': ('location',),
+}
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x', 'done', 'completed'}
+_ICS_DURATION = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+_ICS_ESCAPE = re.compile(r'\\([\\;,nN])')
+
+
+class RateLimiter:
+    """リクエスト数を1秒あたりrate件に抑える（rateが0以下の場合は制限しない）"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_at = time.monotonic()
+
+    def acquire(self, count: int = 1):
+        """count件のリクエストを送ってよくなるまで待つ"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+_user_limiters: Dict[str, RateLimiter] = {}
+_user_limiters_lock = threading.Lock()
+
+
+def _rate_limiter(user_id: str) -> RateLimiter:
+    """ユーザーごとのレートリミッター（同じプロセスで同じユーザーのインポートを同時に行っても上限を共有する）"""
+    with _user_limiters_lock:
+        limiter = _user_limiters.get(user_id)
+        if limiter is None or limiter.rate != IMPORT_REQUESTS_PER_SECOND:
+            limiter = _user_limiters[user_id] = RateLimiter(IMPORT_REQUESTS_PER_SECOND)
+        return limiter
+
+
+# --- CSV ---
+
+def _is_true(value: Optional[str]) -> bool:
+    return (value or '').strip().lower() in _TRUE_VALUES
+
+
+def _parse_due(value: str) -> str:
+    """期日（日付または日時）をGoogle TasksのdueのRFC3339形式にする（Google Tasksは日付だけを保存する）"""
+    return _parse_rfc3339(value.strip()).date().isoformat() + "T00:00:00.000Z"
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Dict]:
+    """CSVを1行ずつ読み、インポートする行の辞書（不正な行は 'error' を持つ）を順に返す"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in _CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    kind = 'event' if 'start_time' in columns else 'todo'
+
+    for values in reader:
+        row_number = reader.line_num
+        if not any(value.strip() for value in values):
+            continue
+        raw = {field: values[index].strip() if index < len(values) else '' for field, index in columns.items()}
+        row = {'row': row_number, 'kind': kind, 'title': raw.get('title', '')}
+        if not row['title']:
+            yield {**row, 'error': "title is required"}
+            continue
+        row['description'] = raw.get('description', '')
+        try:
+            if kind == 'todo':
+                row['completed'] = _is_true(raw.get('completed'))
+                row['due'] = _parse_due(raw['due']) if raw.get('due') else None
+            else:
+                row['start_time'] = _parse_rfc3339(raw['start_time'])
+                row['end_time'] = _parse_rfc3339(raw['end_time']) if raw.get('end_time') else None
+                row['location'] = raw.get('location', '')
+        except (TypeError, ValueError) as e:
+            yield {**row, 'error': f"invalid date: {e}"}
+            continue
+        if kind == 'event' and row['start_time'] is None:
+            yield {**row, 'error': "start is required"}
+            continue
+        yield row
+
+
+# --- ICS ---
+
+def _unfold(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """折り返された行（空白で始まる行）をつなげて (行番号, 論理行) を返す"""
+    current, current_number = None, 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current_number, current
+        current, current_number = line, number
+    if current:
+        yield current_number, current
+
+
+def _split_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    """'NAME;PARAM=VALUE:value' を (名前, パラメーター, 値) に分ける（引用符の中の ':' と ';' は区切りとしない）"""
+    parts, current, quoted = [], '', False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in ';:':
+            parts.append(current)
+            current = ''
+            if char == ':':
+                value = line[index + 1:]
+                break
+            continue
+        current += char
+    else:
+        parts.append(current)
+        value = ''
+    params = {}
+    for param in parts[1:]:
+        key, _, param_value = param.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return parts[0].upper(), params, value
+
+
+def _unescape(value: str) -> str:
+    return _ICS_ESCAPE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def _parse_ics_datetime(value: str, params: Dict[str, str]) -> Tuple[datetime, bool]:
+    """DTSTARTなどの値を (日時, 終日か) にする
+
+    UTC（末尾Z）はaware、TZIDがある場合はそのタイムゾーン、どちらもない場合はnaive（Asia/Tokyoとみなす）にする。
+    """
+    value = value.strip()
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.strptime(value, '%Y%m%d'), True
+    dt = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        return dt.replace(tzinfo=timezone.utc), False
+    if params.get('TZID'):
+        from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+        try:
+            return dt.replace(tzinfo=ZoneInfo(params['TZID'])), False
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return dt, False
+
+
+def _parse_ics_duration(value: str) -> timedelta:
+    match = _ICS_DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"invalid duration {value!r}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+
+def _ics_component_row(row_number: int, name: str, properties: List[Tuple[str, Dict[str, str], str]]) -> Dict:
+    """VEVENT / VTODOのプロパティからインポートする行の辞書を作る"""
+    values = {}
+    recurrence = []
+    for prop, params, value in properties:
+        if prop in ('RRULE', 'EXDATE', 'RDATE'):
+            recurrence.append(f"{prop}{''.join(f';{k}={v}' for k, v in params.items())}:{value}")
+        elif prop not in values:
+            values[prop] = (params, value)
+
+    def text(prop):
+        return _unescape(values[prop][1]).strip() if prop in values else ''
+
+    row = {'row': row_number, 'kind': 'event' if name == 'VEVENT' else 'todo', 'title': text('SUMMARY')}
+    if not row['title']:
+        return {**row, 'error': "SUMMARY is required"}
+    row['description'] = text('DESCRIPTION')
+    try:
+        if row['kind'] == 'todo':
+            row['completed'] = text('STATUS').upper() == 'COMPLETED' or 'COMPLETED' in values
+            due = _parse_ics_datetime(values['DUE'][1], values['DUE'][0])[0] if 'DUE' in values else None
+            row['due'] = due.date().isoformat() + "T00:00:00.000Z" if due else None
+            return row
+
+        if text('STATUS').upper() == 'CANCELLED':
+            return {**row, 'skipped': "cancelled event"}
+        if 'DTSTART' not in values:
+            return {**row, 'error': "DTSTART is required"}
+        start_time, all_day = _parse_ics_datetime(values['DTSTART'][1], values['DTSTART'][0])
+        if all_day:
+            return {**row, 'skipped': "all-day events are not supported"}
+        if 'DTEND' in values:
+            end_time = _parse_ics_datetime(values['DTEND'][1], values['DTEND'][0])[0]
+        elif 'DURATION' in values:
+            end_time = start_time + _parse_ics_duration(values['DURATION'][1])
+        else:
+            end_time = None
+    except ValueError as e:
+        return {**row, 'error': f"invalid date: {e}"}
+    row.update(start_time=start_time, end_time=end_time, location=text('LOCATION'), recurrence=recurrence)
+    return row
+
+
+def parse_ics(lines: Iterable[str]) -> Iterator[Dict]:
+    """ICS（iCalendar）を1行ずつ読み、VEVENT / VTODOごとにインポートする行の辞書を順に返す
+
+    VALARMなどの入れ子のコンポーネントのプロパティは読み飛ばす。行番号はコンポーネントのBEGINの行。
+    """
+    stack: List[str] = []
+    properties: List[Tuple[str, Dict[str, str], str]] = []
+    begin_line = 0
+    for number, line in _unfold(lines):
+        name, params, value = _split_property(line)
+        if name == 'BEGIN':
+            stack.append(value.strip().upper())
+            if stack[-1] in ('VEVENT', 'VTODO'):
+                properties, begin_line = [], number
+        elif name == 'END':
+            component = stack.pop() if stack else None
+            if component in ('VEVENT', 'VTODO'):
+                yield _ics_component_row(begin_line, component, properties)
+        elif stack and stack[-1] in ('VEVENT', 'VTODO'):
+            properties.append((name, params, value))
+
+
+# --- インポート ---
+
+def _todo_key(title: str, due: Optional[str]) -> tuple:
+    return ('todo', title.strip().casefold(), (due or '')[:10])
+
+
+def _event_key(title: str, start_time: datetime) -> tuple:
+    return ('event', title.strip().casefold(), _to_rfc3339_utc(start_time))
+
+
+def _http_status(exception: Exception) -> Optional[int]:
+    return getattr(getattr(exception, 'resp', None), 'status', None)
+
+
+def _is_retryable(exception: Exception) -> bool:
+    if isinstance(exception, OverloadedError):
+        return True
+    status = _http_status(exception)
+    if status in _RETRYABLE_HTTP_STATUSES:
+        return True
+    # Googleのレート制限は403（rateLimitExceeded / userRateLimitExceeded）で返ることもある
+    return status == 403 and b'ratelimitexceeded' in (getattr(exception, 'content', b'') or b'').lower()
+
+
+def _execute_batch(service, api: str, requests: List) -> List[Tuple[Optional[Dict], Optional[Exception]]]:
+    """リクエストを1つのバッチで送信し、リクエストの順に (レスポンス, 例外) を返す"""
+    responses = {}
+
+    def callback(request_id, response, exception):
+        responses[int(request_id)] = (response, exception)
+
+    batch = new_batch_request(service, api, callback)
+    for index, request in enumerate(requests):
+        batch.add(request, request_id=str(index))
+    try:
+        batch.execute()
+    except Exception as e:
+        # バッチ全体が失敗した場合は全ての行をその例外で失敗とする
+        return [(None, e)] * len(requests)
+    return [responses.get(index, (None, RuntimeError("No response in batch"))) for index in range(len(requests))]
+
+
+class _Importer:
+    """1人のユーザーへのインポートの状態（既存のアイテムのキー、送信待ちの行、結果）"""
+
+    def __init__(self, user_id: str, tasks_service, calendar_service, on_result: Optional[Callable[[Dict], None]]):
+        self.user_id = user_id
+        self.services = {'todo': tasks_service, 'event': calendar_service}
+        self.on_result = on_result
+        self.limiter = _rate_limiter(user_id)
+        self.keys: Dict[str, set] = {}
+        self.pending: Dict[str, List[Tuple[Dict, tuple]]] = {'todo': [], 'event': []}
+        self.results: List[Dict] = []
+        self.tasklist_id = None
+
+    def _result(self, row: Dict, status: str, **values):
+        result = {'row': row['row'], 'kind': row.get('kind'), 'title': row.get('title'), 'status': status, **values}
+        self.results.append(result)
+        if self.on_result:
+            self.on_result(result)
+
+    def _existing_keys(self, kind: str) -> set:
+        """既にあるTODOのキーと、ファイルの中で先に出てきた行のキーを返す
+
+        TODOは最初にTODOの行が出てきたときに1回だけ全件（非表示のタスクを含む）を取得する。
+        イベントは全期間を取得せず、送信するバッチごとに _drop_existing_events で確認する。
+        """
+        if kind not in self.keys:
+            keys = set()
+            if kind == 'todo':
+                for _, page in _iter_todo_pages(self.services[kind], self.user_id, 'all', show_hidden=True):
+                    keys.update(_todo_key(todo['title'], todo['due']) for todo in page)
+            self.keys[kind] = keys
+        return self.keys[kind]
+
+    def _drop_existing_events(self, pending: List[Tuple[Dict, tuple]]) -> List[Tuple[Dict, tuple]]:
+        """バッチの行の開始日時の範囲にある既存のイベントを取得し、同じイベントがある行をduplicateにする"""
+        starts = [row['start_time'] for row, _ in pending]
+        start, end = min(starts, key=_as_utc), max(starts, key=_as_utc) + timedelta(seconds=1)
+        existing = set()
+        for _, page in _iter_window_event_pages(self.services['event'], self.user_id, start, end):
+            existing.update(_event_key(event['title'], event['start_time']) for event in page)
+        remaining = []
+        for row, key in pending:
+            if key in existing:
+                self._result(row, 'duplicate')
+            else:
+                remaining.append((row, key))
+        return remaining
+
+    def _drop_created_todos(self, pending: List[Tuple[Dict, tuple]]) -> List[Tuple[Dict, tuple]]:
+        """再送する前にTODOを取得し直し、失敗が返ったが作成されていた行をcreatedにする
+
+        5xxなどで失敗が返っても作成されている場合があり、そのまま再送すると二重に作成される。
+        """
+        found = {}
+        for _, page in _iter_todo_pages(self.services['todo'], self.user_id, 'all', show_hidden=True):
+            for todo in page:
+                found.setdefault(_todo_key(todo['title'], todo['due']), todo)
+        created, remaining = [], []
+        for row, key in pending:
+            todo = found.get(key)
+            if todo is None:
+                remaining.append((row, key))
+            else:
+                created.append(todo)
+                self._result(row, 'created', id=todo['id'])
+        if created:
+            self._index('todo', created)
+        return remaining
+
+    def _get_created_event(self, row: Dict) -> Tuple[Optional[Dict], Optional[Exception]]:
+        """前回の送信で作成済みのイベント（再送したIDが409で衝突した）を取得する"""
+        self.limiter.acquire()
+        try:
+            response = self.services['event'].events().get(
+                calendarId='primary', eventId=row['event_id'], fields=EVENT_FIELDS
+            ).execute()
+            return response, None
+        except Exception as e:
+            return None, e
+
+    def add(self, row: Dict):
+        if 'error' in row:
+            self._result(row, 'invalid', error=row['error'])
+            return
+        if 'skipped' in row:
+            self._result(row, 'skipped', error=row['skipped'])
+            return
+        kind = row['kind']
+        if kind == 'event' and row.get('end_time') is None:
+            row['end_time'] = row['start_time'] + timedelta(hours=1)
+        key = _todo_key(row['title'], row['due']) if kind == 'todo' else _event_key(row['title'], row['start_time'])
+        keys = self._existing_keys(kind)
+        if key in keys:
+            self._result(row, 'duplicate')
+            return
+        keys.add(key)
+        if kind == 'event':
+            # 再送時に同じイベントが二重に作成されないよう、イベントIDをこちらで決めておく
+            row['event_id'] = uuid.uuid4().hex
+        self.pending[kind].append((row, key))
+        if len(self.pending[kind]) >= GOOGLE_BATCH_LIMIT:
+            self.flush(kind)
+
+    def _build_request(self, kind: str, row: Dict):
+        service = self.services[kind]
+        if kind == 'todo':
+            if self.tasklist_id is None:
+                self.tasklist_id = _get_default_tasklist_id(service)
+            body = {'title': row['title'], 'notes': row['description'] or ''}
+            if row['completed']:
+                body['status'] = 'completed'
+            if row['due']:
+                body['due'] = row['due']
+            return service.tasks().insert(tasklist=self.tasklist_id, body=body, fields=TASK_FIELDS)
+        body = _build_event_body(row['title'], row['start_time'], row['end_time'], row['description'], row['location'])
+        body['id'] = row['event_id']
+        if row.get('recurrence'):
+            body['recurrence'] = row['recurrence']
+        return service.events().insert(calendarId='primary', body=body, fields=EVENT_FIELDS)
+
+    def flush(self, kind: str):
+        """送信待ちの行をバッチで作成する（レート制限などで失敗した行は間隔を空けて再送する）
+
+        再送で二重に作成しないよう、イベントは同じIDで再送して409を作成済みとし、
+        TODOは再送する前に取得し直して作成されていた行を除く。
+        """
+        pending, self.pending[kind] = self.pending[kind], []
+        if kind == 'event' and pending:
+            pending = self._drop_existing_events(pending)
+        api = 'tasks' if kind == 'todo' else 'calendar'
+        attempt = 0
+        while pending:
+            if attempt and kind == 'todo':
+                pending = self._drop_created_todos(pending)
+                if not pending:
+                    break
+            self.limiter.acquire(len(pending))
+            responses = _execute_batch(self.services[kind], api, [self._build_request(kind, row) for row, _ in pending])
+            created, retry = [], []
+            for (row, key), (response, exception) in zip(pending, responses):
+                if exception is not None and kind == 'event' and attempt and _http_status(exception) == 409:
+                    # 前回の送信で作成済み（失敗が返ったが作成されていた）なので、作成済みのイベントを使う
+                    response, exception = self._get_created_event(row)
+                if exception is None:
+                    item = _create_task_dict(response, self.user_id) if kind == 'todo' else _create_event_dict(response, self.user_id)
+                    created.append(item)
+                    self._result(row, 'created', id=item['id'])
+                elif _is_retryable(exception) and attempt < IMPORT_MAX_RETRIES:
+                    retry.append((row, key))
+                else:
+                    # 作成できなかったので、ファイルの後の同じ行は作成を試みる
+                    self.keys[kind].discard(key)
+                    self._result(row, 'failed', error=f"{type(exception).__name__}: {exception}")
+            if created:
+                self._index(kind, created)
+            pending = retry
+            if retry:
+                attempt += 1
+                print(f"[WARNING] Retrying {len(retry)} {kind} rows for user {self.user_id} (attempt {attempt})")
+                time.sleep(IMPORT_RETRY_BASE_SECONDS * (2 ** (attempt - 1)))
+
+    def _index(self, kind: str, items: List[Dict]):
+        """作成したアイテムを検索インデックスに入れ、一覧のキャッシュを破棄する"""
+        (todo_list_cache if kind == 'todo' else event_window_cache).invalidate(self.user_id)
+        db = next(get_db())
+        try:
+            index_items(db, self.user_id, kind, items)
+        finally:
+            # コネクションプールへ確実に返却する
+            db.close()
+
+
+def import_rows(user_id: str, rows: Iterable[Dict], on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """parse_csv / parse_icsが返す行をGoogleに作成し、状態ごとの件数と行ごとの結果を返す
+
+    行ごとの結果の status は created / duplicate / skipped / invalid / failed のいずれか。
+    """
+    # データベースセッションを取得（Credentials用。サービスを作成したらすぐに返却する）
+    db = next(get_db())
+    try:
+        tasks_service, calendar_service = get_google_services(user_id, db)
+    except AuthenticationRequiredException as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+    if not tasks_service or not calendar_service:
+        return {"error": "Google services not available (authentication may be expired)"}
+
+    importer = _Importer(user_id, tasks_service, calendar_service, on_result)
+    try:
+        for row in rows:
+            importer.add(row)
+        for kind in ('todo', 'event'):
+            importer.flush(kind)
+    except Exception as e:
+        # 既存のアイテムの取得などに失敗した場合は、それまでの結果とともに返す
+        print(f"[ERROR] Import for user {user_id} stopped: {type(e).__name__}: {e}")
+        summary = _summarize(importer.results)
+        summary['error'] = f"{type(e).__name__}: {e}"
+        return summary
+    return _summarize(importer.results)
+
+
+def _summarize(results: List[Dict]) -> Dict:
+    summary = {status: 0 for status in ('created', 'duplicate', 'skipped', 'invalid', 'failed')}
+    for result in results:
+        summary[result['status']] += 1
+    summary['results'] = sorted(results, key=lambda result: result['row'])
+    return summary
+
+
+def import_file(user_id: str, path: str, fmt: Optional[str] = None,
+                on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """CSVまたはICSファイルをインポートする（形式を省略した場合は拡張子が .ics ならICS、それ以外はCSV）"""
+    fmt = fmt or ('ics' if path.lower().endswith(('.ics', '.ical', '.ifb')) else 'csv')
+    # ExcelなどのBOM付きのUTF-8にも対応する
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = parse_ics(f) if fmt == 'ics' else parse_csv(f)
+        return import_rows(user_id, rows, on_result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV / ICSファイルからのTODOとイベントの一括インポート")
+    parser.add_argument('user_id', help="インポート先のユーザー")
+    parser.add_argument('path', help="インポートするCSVまたはICSファイル")
+    parser.add_argument('--format', choices=('csv', 'ics'), help="ファイルの形式（省略時は拡張子から判定）")
+    parser.add_argument('--report', help="行ごとの結果を書き込むNDJSONファイル")
+    args = parser.parse_args()
+
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+
+    def on_result(result):
+        if report:
+            report.write(json.dumps(result, ensure_ascii=False) + '\n')
+        if result['status'] in ('invalid', 'failed'):
+            print(f"[import] row {result['row']} {result['status']}: {result.get('error')}")
+
+    try:
+        summary = import_file(args.user_id, args.path, args.format, on_result)
+    finally:
+        if report:
+            report.close()
+    if 'results' not in summary:
+        print(f"[ERROR] {summary.get('message') or summary['error']}")
+        sys.exit(2)
+    print(', '.join(f"{summary[status]} {status}" for status in ('created', 'duplicate', 'skipped', 'invalid', 'failed')))
+    if summary.get('error') or summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+from typing import List, Dict, Optional, Callable, Mapping, Tuple
+from datetime import datetime, timedelta
+import hmac
+import os
+import secrets
+import sys
+import threading
+import uuid
+from sqlalchemy.orm import Session
+from models import get_db, CalendarWatchChannel, SearchDocument
+from google_api import get_google_calendar_service, AuthenticationRequiredException
+from event_service import _create_event_dict, EVENT_FIELDS
+from search import index_items, remove_items
+import metrics
+
+
+# Googleからのプッシュ通知を受け取るURL（例: https://example.herokuapp.com/webhooks/calendar）
+# 未設定の場合はカレンダーの監視を行わない
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL")
+# チャンネルの有効期間（秒）と、期限切れ前に更新を始めるまでの余裕（秒）
+CALENDAR_WATCH_TTL_SECONDS = int(os.getenv("CALENDAR_WATCH_TTL_SECONDS", 7 * 24 * 60 * 60))
+CALENDAR_WATCH_RENEW_BEFORE_SECONDS = int(os.getenv("CALENDAR_WATCH_RENEW_BEFORE_SECONDS", 24 * 60 * 60))
+# チャンネルの更新を確認する間隔（秒）
+CALENDAR_WATCH_RENEW_INTERVAL = float(os.getenv("CALENDAR_WATCH_RENEW_INTERVAL", 60 * 60))
+
+# 差分同期で取得するフィールド（削除されたイベントを判別するためstatusも取得する）
+SYNC_EVENT_FIELDS = f"items({EVENT_FIELDS},status),nextPageToken,nextSyncToken"
+
+# カレンダーが変更されたときに呼ばれるコールバック（ユーザーID, カレンダーID）
+# イベントをキャッシュする機能はここに登録して無効化する
+_invalidation_listeners: List[Callable[[str, str], None]] = []
+
+# 同期中のカレンダー -> 同期中に再度通知を受けたかどうか
+_resync_state: Dict[tuple, bool] = {}
+_resync_lock = threading.Lock()
+
+metrics.register_gauge('calendar_resync_pending', lambda: len(_resync_state))
+
+
+def add_invalidation_listener(listener: Callable[[str, str], None]):
+    """カレンダーの変更通知を受けたときに呼ぶコールバックを登録する"""
+    _invalidation_listeners.append(listener)
+
+
+def _channel_dict(channel: CalendarWatchChannel) -> Dict:
+    return {
+        'user_id': channel.user_id,
+        'calendar_id': channel.calendar_id,
+        'channel_id': channel.channel_id,
+        'expiration': channel.expiration,
+        'last_synced_at': channel.last_synced_at,
+    }
+
+
+def _stop_channel(calendar_service, channel: CalendarWatchChannel):
+    """Google側のチャンネルを停止する（失敗しても期限切れで止まるので記録だけする）"""
+    try:
+        calendar_service.channels().stop(body={'id': channel.channel_id, 'resourceId': channel.resource_id}).execute()
+    except Exception as e:
+        print(f"[WARNING] Failed to stop calendar channel {channel.channel_id}: {type(e).__name__}: {e}")
+
+
+def watch_calendar(user_id: str, calendar_id: str = 'primary') -> Dict:
+    """カレンダーの変更のプッシュ通知を受け取るチャンネルを作成する（既存のチャンネルは置き換える）"""
+    if not CALENDAR_WEBHOOK_URL:
+        return {"error": "CALENDAR_WEBHOOK_URL is not configured"}
+
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        calendar_service = get_google_calendar_service(user_id, db)
+        if not calendar_service:
+            print(f"[ERROR] Google Calendar service not available for user {user_id}")
+            return {"error": "Google Calendar service not available (authentication may be expired)"}
+
+        existing = db.query(CalendarWatchChannel).filter(
+            CalendarWatchChannel.user_id == user_id,
+            CalendarWatchChannel.calendar_id == calendar_id
+        ).order_by(CalendarWatchChannel.id.desc()).all()
+
+        channel_id = str(uuid.uuid4())
+        token = secrets.token_hex(32)
+        response = calendar_service.events().watch(calendarId=calendar_id, body={
+            'id': channel_id,
+            'type': 'web_hook',
+            'address': CALENDAR_WEBHOOK_URL,
+            'token': token,
+            'params': {'ttl': str(CALENDAR_WATCH_TTL_SECONDS)},
+        }).execute()
+
+        channel = CalendarWatchChannel(
+            user_id=user_id,
+            calendar_id=calendar_id,
+            channel_id=channel_id,
+            resource_id=response['resourceId'],
+            token=token,
+            expiration=datetime.fromtimestamp(int(response['expiration']) / 1000),
+            # 同期トークンは引き継ぎ、更新時に全件を取得し直さないようにする
+            sync_token=next((c.sync_token for c in existing if c.sync_token), None),
+            last_message_number=0,
+            last_synced_at=next((c.last_synced_at for c in existing if c.last_synced_at), None)
+        )
+        db.add(channel)
+        for old_channel in existing:
+            _stop_channel(calendar_service, old_channel)
+            db.delete(old_channel)
+        db.commit()
+        print(f"[calendar_watch] user_id: {user_id}, calendar_id: {calendar_id}, channel {channel_id} until {channel.expiration}")
+        if channel.sync_token is None:
+            # 最初の同期で同期トークンを取得する（syncの通知がチャンネルの保存より先に届いた場合に備える）
+            _schedule_resync(user_id, calendar_id)
+        return _channel_dict(channel)
+    except AuthenticationRequiredException as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Failed to watch calendar {calendar_id} for user {user_id}: {type(e).__name__}: {e}")
+        if hasattr(e, 'resp') and e.resp:
+            print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+        return {"error": f"Failed to watch calendar: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def stop_watching_calendar(user_id: str, calendar_id: str = 'primary') -> Dict:
+    """カレンダーのプッシュ通知のチャンネルを停止する"""
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        channels = db.query(CalendarWatchChannel).filter(
+            CalendarWatchChannel.user_id == user_id,
+            CalendarWatchChannel.calendar_id == calendar_id
+        ).all()
+        if channels:
+            calendar_service = get_google_calendar_service(user_id, db)
+            for channel in channels:
+                if calendar_service:
+                    _stop_channel(calendar_service, channel)
+                db.delete(channel)
+            db.commit()
+        return {'user_id': user_id, 'calendar_id': calendar_id, 'stopped': len(channels)}
+    except AuthenticationRequiredException as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _list_event_changes(calendar_service, user_id: str, calendar_id: str,
+                        sync_token: Optional[str]) -> Tuple[Optional[str], List[Dict], List[str], set]:
+    """同期トークン以降に変更されたイベントを取得する（トークンがなければ全件を取得する）
+
+    (次の同期トークン, 変更されたイベント, 削除されたイベントID, 取得した全イベントID) を返す。
+    """
+    # 定期的な予定は検索インデックスと同じく展開したインスタンスで取得する（親イベントではなく）
+    params = {'calendarId': calendar_id, 'fields': SYNC_EVENT_FIELDS, 'maxResults': 250, 'singleEvents': True}
+    if sync_token:
+        params['syncToken'] = sync_token
+
+    changed, removed, seen = [], [], set()
+    page_token = None
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        response = calendar_service.events().list(**params).execute()
+        for google_event in response.get('items', []):
+            seen.add(google_event.get('id'))
+            if google_event.get('status') == 'cancelled':
+                removed.append(google_event.get('id'))
+            else:
+                changed.append(_create_event_dict(google_event, user_id))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return response.get('nextSyncToken'), changed, removed, seen
+
+
+def _indexed_event_ids(db: Session, user_id: str, calendar_id: str) -> set:
+    return {
+        row.item_id for row in db.query(SearchDocument.item_id).filter(
+            SearchDocument.user_id == user_id,
+            SearchDocument.item_type == 'event',
+            SearchDocument.calendar_id == calendar_id
+        )
+    }
+
+
+def resync_calendar(user_id: str, calendar_id: str = 'primary') -> Dict:
+    """通知を受けたカレンダーの変更を差分同期し、検索インデックスとキャッシュに反映する"""
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        channel = db.query(CalendarWatchChannel).filter(
+            CalendarWatchChannel.user_id == user_id,
+            CalendarWatchChannel.calendar_id == calendar_id
+        ).order_by(CalendarWatchChannel.id.desc()).first()
+        if channel is None:
+            return {"error": f"Calendar {calendar_id} is not watched"}
+
+        calendar_service = get_google_calendar_service(user_id, db)
+        if not calendar_service:
+            print(f"[ERROR] Google Calendar service not available for user {user_id}")
+            return {"error": "Google Calendar service not available (authentication may be expired)"}
+
+        full_sync = channel.sync_token is None
+        try:
+            sync_token, changed, removed, seen = _list_event_changes(calendar_service, user_id, calendar_id, channel.sync_token)
+        except Exception as e:
+            if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                raise
+            # 同期トークンが無効になった場合は全件を取得し直す
+            print(f"[calendar_watch] Sync token expired for user {user_id}, running a full sync")
+            full_sync = True
+            sync_token, changed, removed, seen = _list_event_changes(calendar_service, user_id, calendar_id, None)
+
+        if full_sync:
+            # 全件を取得した場合は、このカレンダーから取得できなかった（削除された）イベントを検索インデックスから取り除く
+            removed = list(set(removed) | (_indexed_event_ids(db, user_id, calendar_id) - seen))
+        index_items(db, user_id, 'event', changed, calendar_id=calendar_id)
+        remove_items(db, user_id, 'event', removed)
+
+        channel.sync_token = sync_token
+        channel.last_synced_at = datetime.now()
+        db.commit()
+    except AuthenticationRequiredException as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    for listener in _invalidation_listeners:
+        try:
+            listener(user_id, calendar_id)
+        except Exception as e:
+            print(f"[WARNING] Calendar invalidation listener failed: {type(e).__name__}: {e}")
+
+    print(f"[calendar_watch] user_id: {user_id}, calendar_id: {calendar_id}, "
+          f"{len(changed)} changed, {len(removed)} removed (full sync: {full_sync})")
+    return {'changed': len(changed), 'removed': len(removed), 'full_sync': full_sync}
+
+
+def _run_in_background(func: Callable[[], None]):
+    threading.Thread(target=func, name="calendar-resync", daemon=True).start()
+
+
+def _resync_loop(key: tuple):
+    """同期中に届いた通知はまとめて、同期が終わった後にもう一度だけ同期する"""
+    while True:
+        try:
+            resync_calendar(*key)
+        except Exception as e:
+            print(f"[WARNING] Calendar resync failed for user {key[0]}: {type(e).__name__}: {e}", file=sys.stderr)
+        with _resync_lock:
+            if not _resync_state[key]:
+                del _resync_state[key]
+                return
+            _resync_state[key] = False
+
+
+def _schedule_resync(user_id: str, calendar_id: str):
+    key = (user_id, calendar_id)
+    with _resync_lock:
+        if key in _resync_state:
+            _resync_state[key] = True
+            return
+        _resync_state[key] = False
+    _run_in_background(lambda: _resync_loop(key))
+
+
+def handle_notification(headers: Mapping[str, str]) -> int:
+    """Google Calendarのプッシュ通知を処理し、返すHTTPステータスコードを返す
+
+    通知を確認したらすぐに応答し、差分同期はバックグラウンドで行う。
+    """
+    headers = {key.lower(): value for key, value in headers.items()}
+    channel_id = headers.get('x-goog-channel-id')
+    if not channel_id:
+        return 400
+
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        channel = db.query(CalendarWatchChannel).filter(CalendarWatchChannel.channel_id == channel_id).first()
+        if channel is None:
+            return 404
+        if not hmac.compare_digest(headers.get('x-goog-channel-token', ''), channel.token) \
+                or headers.get('x-goog-resource-id') != channel.resource_id:
+            print(f"[WARNING] Rejected calendar notification for channel {channel_id}")
+            return 403
+
+        message_number = int(headers.get('x-goog-message-number') or 0)
+        if message_number and message_number <= channel.last_message_number:
+            # 再送された通知は処理済み
+            return 200
+        channel.last_message_number = max(channel.last_message_number, message_number)
+        db.commit()
+        user_id, calendar_id = channel.user_id, channel.calendar_id
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    # 'sync'はチャンネル作成直後の通知なので、最初の同期（同期トークンの取得）を行う
+    if headers.get('x-goog-resource-state') in ('sync', 'exists', 'not_exists'):
+        _schedule_resync(user_id, calendar_id)
+    return 200
+
+
+def _drop_expired_channels(user_id: str, calendar_id: str):
+    """更新できないまま期限が切れたチャンネルを削除する（Googleからの通知はもう届かない）"""
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        dropped = db.query(CalendarWatchChannel).filter(
+            CalendarWatchChannel.user_id == user_id,
+            CalendarWatchChannel.calendar_id == calendar_id,
+            CalendarWatchChannel.expiration < datetime.now()
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+    if dropped:
+        print(f"[WARNING] Dropped expired calendar channel for user {user_id}, calendar_id: {calendar_id} after failed renewals")
+
+
+def renew_channels() -> List[str]:
+    """期限切れが近いチャンネルを作り直し、更新したユーザーIDのリストを返す
+
+    更新に失敗したチャンネルは次の確認で再試行し、期限が切れるまで失敗し続けた場合は削除する。
+    """
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        threshold = datetime.now() + timedelta(seconds=CALENDAR_WATCH_RENEW_BEFORE_SECONDS)
+        expiring = {
+            (channel.user_id, channel.calendar_id)
+            for channel in db.query(CalendarWatchChannel).filter(CalendarWatchChannel.expiration < threshold)
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    renewed = []
+    for user_id, calendar_id in sorted(expiring):
+        result = watch_calendar(user_id, calendar_id)
+        if 'error' in result:
+            print(f"[WARNING] Failed to renew calendar channel for user {user_id}: {result['error']}")
+            _drop_expired_channels(user_id, calendar_id)
+        else:
+            renewed.append(user_id)
+    return renewed
+
+
+def run_channel_renewal(stop_event: Optional[threading.Event] = None, interval: float = CALENDAR_WATCH_RENEW_INTERVAL):
+    """チャンネルを定期的に更新するループ（stop_eventがセットされるまで実行する）"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            renew_channels()
+        except Exception as e:
+            print(f"[WARNING] Calendar channel renewal failed: {type(e).__name__}: {e}", file=sys.stderr)
+        stop_event.wait(interval)
+
+
+def start_channel_renewal(interval: float = CALENDAR_WATCH_RENEW_INTERVAL) -> threading.Thread:
+    """チャンネルの更新をバックグラウンドスレッドで開始する"""
+    thread = threading.Thread(target=run_channel_renewal, kwargs={'interval': interval}, name="calendar-watch-renewal", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,70 @@
+from typing import Any, Callable, Dict, Optional
+import functools
+import inspect
+import json
+import threading
+
+import metrics
+
+
+class _InFlightCall:
+    """実行中の呼び出し（後から来た同じ呼び出しは完了を待って結果を共有する）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+        self.waiters = 0
+
+
+# (ツール名, 正規化した引数) -> 実行中の呼び出し
+_in_flight: Dict[tuple, _InFlightCall] = {}
+_lock = threading.Lock()
+
+metrics.register_gauge('coalesce_in_flight', lambda: len(_in_flight))
+
+
+def _call_key(func: Callable, signature: inspect.Signature, args: tuple, kwargs: dict) -> tuple:
+    """デフォルト値を補った引数で呼び出しのキーを作る（省略した引数と明示した引数を同一視する）"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return func.__name__, json.dumps(bound.arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def coalesce_calls(func: Callable) -> Callable:
+    """同じ引数で同時に実行された呼び出しをまとめ、1回の実行結果を全ての呼び出し元に返すデコレーター
+
+    読み取り専用のツールにだけ使う。結果のオブジェクトは呼び出し元の間で共有される。
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = _call_key(func, signature, args, kwargs)
+        with _lock:
+            call = _in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _in_flight[key] = _InFlightCall()
+            else:
+                call.waiters += 1
+
+        if leader:
+            metrics.increment('coalesce_leader_calls', func.__name__)
+            try:
+                call.result = func(*args, **kwargs)
+            except BaseException as e:
+                call.exception = e
+            finally:
+                with _lock:
+                    del _in_flight[key]
+                call.done.set()
+        else:
+            metrics.increment('coalesce_coalesced_calls', func.__name__)
+            call.done.wait()
+
+        if call.exception is not None:
+            raise call.exception
+        return call.result
+
+    return wrapper
@@ -0,0 +1,22 @@
+from typing import Dict, List
+
+
+# コンパクト表示で説明文を切り詰める文字数
+COMPACT_DESCRIPTION_LIMIT = 200
+
+
+def compact_item(item: Dict, description_limit: int = COMPACT_DESCRIPTION_LIMIT) -> Dict:
+    """空のフィールドを除き、長い説明文を切り詰めた辞書を返す"""
+    compacted = {}
+    for key, value in item.items():
+        if value is None or value == '':
+            continue
+        if key == 'description' and isinstance(value, str) and len(value) > description_limit:
+            value = value[:description_limit] + '…'
+        compacted[key] = value
+    return compacted
+
+
+def compact_items(items: List[Dict], description_limit: int = COMPACT_DESCRIPTION_LIMIT) -> List[Dict]:
+    """リストの各アイテムをコンパクト表示に変換する"""
+    return [compact_item(item, description_limit) for item in items]
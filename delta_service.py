@@ -0,0 +1,165 @@
+from typing import List, Dict, Optional, Tuple, Callable
+from datetime import datetime
+import base64
+import binascii
+import json
+
+from models import get_db
+from google_api import get_google_tasks_service, get_google_calendar_service, AuthenticationRequiredException
+from admission import OverloadedError
+from compact import compact_items
+from search import index_items, remove_items
+from streaming import InvalidCursorError
+from todo_service import _create_task_dict, _get_default_tasklist_id, TASK_FIELDS, TASK_PAGE_SIZE
+from todo_cache import todo_list_cache
+from event_service import _create_event_dict, _to_rfc3339_utc, EVENT_FIELDS, EVENT_PAGE_SIZE
+from event_cache import event_window_cache
+
+
+# 差分の取得に使うフィールド（削除の判定と次のカーソルの計算に使うdeleted/status/updatedを加える）
+DELTA_TASK_FIELDS = f"items({TASK_FIELDS},deleted),nextPageToken"
+DELTA_EVENT_FIELDS = f"items({EVENT_FIELDS},status,updated),nextPageToken"
+
+
+def _encode_cursor(kind: str, updated_min: str) -> str:
+    raw = json.dumps({'kind': kind, 'updated_min': updated_min}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _updated_min(kind: str, since: Optional[datetime], cursor: Optional[str]) -> str:
+    """カーソル（優先）またはsinceから、Googleに渡すupdatedMin（RFC3339）を求める"""
+    if cursor:
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if position['kind'] == kind:
+                return position['updated_min']
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+            pass
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    if since is None:
+        raise InvalidCursorError("Either since or cursor is required")
+    return _to_rfc3339_utc(since)
+
+
+def _list_task_changes(tasks_service, user_id: str, updated_min: str) -> Tuple[List[Dict], List[Dict], Optional[str]]:
+    """updated_min以降に作成・更新・削除されたタスクを取得する
+
+    (変更されたTODO, 削除されたTODOのID, 取得したタスクの最新の更新日時) を返す。
+    """
+    tasklist_id = _get_default_tasklist_id(tasks_service)
+    # 完了して非表示になったタスクと削除されたタスクも含める
+    params = {
+        'tasklist': tasklist_id, 'updatedMin': updated_min, 'showDeleted': True, 'showHidden': True,
+        'maxResults': TASK_PAGE_SIZE, 'fields': DELTA_TASK_FIELDS,
+    }
+    changed, deleted, latest = [], [], None
+    while True:
+        response = tasks_service.tasks().list(**params).execute()
+        for google_task in response.get('items', []):
+            latest = max(latest or '', google_task.get('updated') or '') or None
+            if google_task.get('deleted'):
+                deleted.append({'id': f"google_{google_task.get('id')}", 'google_task_id': google_task.get('id')})
+            else:
+                changed.append(_create_task_dict(google_task, user_id))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return changed, deleted, latest
+        params['pageToken'] = page_token
+
+
+def _list_event_changes(calendar_service, user_id: str, updated_min: str) -> Tuple[List[Dict], List[Dict], Optional[str]]:
+    """updated_min以降に作成・更新・削除されたprimaryカレンダーのイベントを取得する
+
+    (変更されたイベント, 削除されたイベントのID, 取得したイベントの最新の更新日時) を返す。
+    変更されたイベントは、他の一覧と同じく日時が指定されたイベントのみ。
+    """
+    params = {
+        'calendarId': 'primary', 'updatedMin': updated_min, 'showDeleted': True, 'singleEvents': True,
+        'maxResults': EVENT_PAGE_SIZE, 'fields': DELTA_EVENT_FIELDS,
+    }
+    changed, deleted, latest = [], [], None
+    while True:
+        response = calendar_service.events().list(**params).execute()
+        for google_event in response.get('items', []):
+            latest = max(latest or '', google_event.get('updated') or '') or None
+            if google_event.get('status') == 'cancelled':
+                deleted.append({'id': f"google_{google_event.get('id')}", 'google_event_id': google_event.get('id')})
+            elif google_event.get('start', {}).get('dateTime') and google_event.get('end', {}).get('dateTime'):
+                changed.append(_create_event_dict(google_event, user_id))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return changed, deleted, latest
+        params['pageToken'] = page_token
+
+
+def _get_changes(user_id: str, kind: str, since: Optional[datetime], cursor: Optional[str], compact: bool,
+                 get_service: Callable, list_changes: Callable, cache) -> Dict:
+    """差分を取得して検索インデックスとキャッシュに反映し、次のカーソルとともに返す"""
+    from google.auth.exceptions import RefreshError
+
+    item_type = 'todo' if kind == 'todos' else 'event'
+    id_key = 'google_task_id' if kind == 'todos' else 'google_event_id'
+    try:
+        updated_min = _updated_min(kind, since, cursor)
+    except InvalidCursorError as e:
+        return {"error": str(e)}
+
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        service = get_service(user_id, db)
+        if not service:
+            print(f"[ERROR] Google service not available for user {user_id}")
+            return {"error": "Google service not available (authentication may be expired)"}
+        changed, deleted, latest = list_changes(service, user_id, updated_min)
+
+        # 変更を検索インデックスに反映し、古くなった一覧のキャッシュを破棄する
+        index_items(db, user_id, item_type, changed)
+        remove_items(db, user_id, item_type, [item[id_key] for item in deleted])
+        if changed or deleted:
+            cache.invalidate(user_id)
+    except (AuthenticationRequiredException, RefreshError) as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
+    except Exception as e:
+        print(f"[ERROR] Google API error in get_{kind}_changed_since for user {user_id}: {type(e).__name__}: {e}")
+        if hasattr(e, 'resp') and e.resp:
+            print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+        return {"error": f"Google API error: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    print(f"[get_{kind}_changed_since] user_id: {user_id}, since {updated_min}: {len(changed)} changed, {len(deleted)} deleted")
+    return {
+        'changed': compact_items(changed) if compact else changed,
+        'deleted': deleted,
+        # 変更がなかった場合は同じ位置から、あった場合は最新の更新日時から次の差分を取得する
+        'cursor': _encode_cursor(kind, latest or updated_min),
+    }
+
+
+def get_todos_changed_since(user_id: str, since: Optional[datetime] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """指定日時（または前回のカーソル）以降に作成・更新・削除されたTODOだけを返す
+
+    次の呼び出しには返されたcursorを渡す。カーソルの境界の更新日時のTODOは次の呼び出しでも返ることがある。
+    """
+    return _get_changes(user_id, 'todos', since, cursor, compact, get_google_tasks_service, _list_task_changes, todo_list_cache)
+
+
+def get_events_changed_since(user_id: str, since: Optional[datetime] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """指定日時（または前回のカーソル）以降に作成・更新・削除されたprimaryカレンダーのイベントだけを返す
+
+    次の呼び出しには返されたcursorを渡す。カーソルの境界の更新日時のイベントは次の呼び出しでも返ることがある。
+    """
+    return _get_changes(user_id, 'events', since, cursor, compact, get_google_calendar_service, _list_event_changes, event_window_cache)
@@ -0,0 +1,153 @@
+from typing import List, Dict, Tuple, Callable
+from collections import OrderedDict
+from datetime import datetime
+import itertools
+import os
+import threading
+import time
+
+import metrics
+
+
+# キャッシュした期間の有効期間（秒）。0以下の場合はキャッシュしない
+EVENT_CACHE_MAX_AGE_SECONDS = float(os.getenv("EVENT_CACHE_MAX_AGE_SECONDS", 60))
+# 全ユーザー合計でキャッシュする期間の数（超えた分は最近使われていないものから削除する）
+EVENT_CACHE_MAX_WINDOWS = int(os.getenv("EVENT_CACHE_MAX_WINDOWS", 1000))
+# 世代番号を保持するユーザーの数（超えた分は最近無効化されていないユーザーから削除する）
+EVENT_CACHE_MAX_GENERATIONS = int(os.getenv("EVENT_CACHE_MAX_GENERATIONS", 10000))
+
+
+class _Window:
+    """取得済みの期間 [start, end) と、その期間に重なる全てのイベント"""
+
+    def __init__(self, start: datetime, end: datetime, events: List[Dict]):
+        self.start = start
+        self.end = end
+        self.events = events
+        self.fetched_at = time.monotonic()
+
+
+def _overlaps(event: Dict, start: datetime, end: datetime) -> bool:
+    return event['start_time'] < end and event['end_time'] > start
+
+
+class EventWindowCache:
+    """ユーザーごとに取得済みの期間とイベントを保持する期間キャッシュ
+
+    要求された期間のうち、キャッシュした期間で覆われていない部分だけをGoogleから取得できるようにする。
+    期間は最近使われた順（LRU）と取得してからの経過時間で削除する。
+    """
+
+    def __init__(self, max_windows: int = EVENT_CACHE_MAX_WINDOWS, max_age_seconds: float = EVENT_CACHE_MAX_AGE_SECONDS,
+                 max_generations: int = EVENT_CACHE_MAX_GENERATIONS):
+        self.max_windows = max_windows
+        self.max_age_seconds = max_age_seconds
+        self._windows: "OrderedDict[Tuple[str, int], _Window]" = OrderedDict()
+        self._ids = itertools.count()
+        # 取得中に無効化された場合に古い結果を保存しないための世代番号（全ユーザーで単調に増える値）。
+        # 無効化したユーザーだけをLRUで保持し、保持していないユーザーは削除した値の最大値（_floor）とする
+        self.max_generations = max_generations
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._generation_counter = itertools.count(1)
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._invalidation_listeners: List[Callable[[str], None]] = []
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]):
+        """ユーザーのキャッシュを破棄したとき（イベントが変更されたとき）に呼ぶコールバックを登録する"""
+        self._invalidation_listeners.append(listener)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_seconds > 0 and self.max_windows > 0
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def generation(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, self._floor)
+
+    def lookup(self, user_id: str, start: datetime, end: datetime, record_metrics: bool = True) -> Tuple[List[Dict], List[Tuple[datetime, datetime]]]:
+        """期間 [start, end) に重なるキャッシュ済みのイベントと、キャッシュで覆われていない期間のリストを返す
+
+        record_metrics=Falseの場合はヒット率のメトリクスに数えない（先読みの照合など）。
+        """
+        if not self.enabled:
+            return [], [(start, end)]
+
+        expires_before = time.monotonic() - self.max_age_seconds
+        events = {}
+        covered = []
+        with self._lock:
+            for key in [key for key in self._windows if key[0] == user_id]:
+                window = self._windows[key]
+                if window.fetched_at < expires_before:
+                    del self._windows[key]
+                    continue
+                if window.start >= end or window.end <= start:
+                    continue
+                self._windows.move_to_end(key)
+                covered.append((max(window.start, start), min(window.end, end)))
+                for event in window.events:
+                    if _overlaps(event, start, end):
+                        events[event['google_event_id']] = event
+
+        # 覆われていない期間を求める
+        uncovered = []
+        cursor = start
+        for covered_start, covered_end in sorted(covered):
+            if covered_start > cursor:
+                uncovered.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            uncovered.append((cursor, end))
+
+        if record_metrics:
+            if not uncovered:
+                metrics.increment('event_cache_requests', 'hit')
+            elif covered:
+                metrics.increment('event_cache_requests', 'partial')
+            else:
+                metrics.increment('event_cache_requests', 'miss')
+        return list(events.values()), uncovered
+
+    def store(self, user_id: str, start: datetime, end: datetime, events: List[Dict], generation: int):
+        """期間 [start, end) の全てのイベントを保存する（取得中に無効化された場合は保存しない）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(user_id, self._floor) != generation:
+                return
+            self._windows[(user_id, next(self._ids))] = _Window(start, end, events)
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """ユーザーのキャッシュを削除する（イベントの追加や変更の通知を受けたとき）"""
+        with self._lock:
+            self._generations[user_id] = next(self._generation_counter)
+            self._generations.move_to_end(user_id)
+            while len(self._generations) > self.max_generations:
+                # 削除したユーザーの取得中の結果も保存しないよう、保持していないユーザーの世代番号を引き上げる
+                _, removed = self._generations.popitem(last=False)
+                self._floor = max(self._floor, removed)
+            for key in [key for key in self._windows if key[0] == user_id]:
+                del self._windows[key]
+        for listener in self._invalidation_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                print(f"[WARNING] Cache invalidation listener failed: {type(e).__name__}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._generations.clear()
+            # 取得中の結果を保存しないよう、全てのユーザーの世代番号を引き上げる
+            self._floor = next(self._generation_counter)
+
+
+event_window_cache = EventWindowCache()
+
+metrics.register_gauge('event_cache_windows', lambda: len(event_window_cache))
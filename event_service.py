@@ -1,44 +1,79 @@
-from typing import List, Dict, Optional
-from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Iterator, Optional, Tuple
+from datetime import datetime, timezone, timedelta, time
+import os
+import sys
 
-from google.auth.exceptions import RefreshError
 from models import get_db
 from google_api import get_google_calendar_service, AuthenticationRequiredException
+from admission import OverloadedError
+from compact import compact_items
+from schemas import EventResult
+from search import index_items, prune_items
+from event_cache import event_window_cache
+from streaming import collect_pages, decode_cursor, InvalidCursorError
+
+
+# Python 3.11以降のfromisoformatはRFC3339の'Z'をそのまま解析できる
+_FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+# naive datetimeや勤務時間の解釈に使うローカルタイムゾーン（Asia/Tokyo）
+LOCAL_TZ = timezone(timedelta(hours=9))
+
+
+# Google Calendarから取得するフィールド（_create_event_dictで使うものだけに絞る）
+EVENT_FIELDS = "id,summary,description,location,start/dateTime,end/dateTime,created"
+EVENT_LIST_FIELDS = f"items({EVENT_FIELDS})"
+
+# get_all_eventsが返すイベントの最大数
+EVENT_LIST_LIMIT = 10
+# 期間を指定してキャッシュ用に全件を取得する場合の1ページあたりの件数
+EVENT_PAGE_SIZE = 250
+# キャッシュを埋めるために全件を取得する期間の長さの上限（日）。これより長い期間はキャッシュに入れず、EVENT_LIST_LIMIT件だけを取得する
+EVENT_CACHE_MAX_FILL_DAYS = float(os.getenv("EVENT_CACHE_MAX_FILL_DAYS", 31))
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        # naive datetimeはローカルタイムゾーン（Asia/Tokyo）と仮定
+        dt = dt.replace(tzinfo=LOCAL_TZ)
+    return dt.astimezone(timezone.utc)
 
 
 def _to_rfc3339_utc(dt: Optional[datetime]) -> Optional[str]:
     if dt is None:
         return None
-    if dt.tzinfo is None:
-        # naive datetimeはローカルタイムゾーン（Asia/Tokyo）と仮定
-        dt = dt.replace(tzinfo=timezone(timedelta(hours=9)))
-    return dt.astimezone(timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z')
+    return _as_utc(dt).isoformat(timespec='seconds').replace('+00:00', 'Z')
 
 
-def _create_event_dict(google_event: Dict, user_id: str) -> Dict:
+def _parse_rfc3339(value: Optional[str]) -> Optional[datetime]:
+    """RFC3339形式の日時文字列を解析する（末尾の'Z'にも対応）"""
+    if not value:
+        return None
+    if _FROMISOFORMAT_ACCEPTS_Z:
+        return datetime.fromisoformat(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _create_event_dict(google_event: Dict, user_id: str) -> EventResult:
     """Google CalendarイベントからEvent辞書を作成するヘルパー関数"""
     # 開始時刻と終了時刻を解析
-    start_time_str = google_event.get('start', {}).get('dateTime')
-    end_time_str = google_event.get('end', {}).get('dateTime')
-
-    start_time = None
-    end_time = None
-    if start_time_str:
-        start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-    if end_time_str:
-        end_time = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
+    start = google_event.get('start')
+    end = google_event.get('end')
+    start_time = _parse_rfc3339(start.get('dateTime')) if start else None
+    end_time = _parse_rfc3339(end.get('dateTime')) if end else None
 
     # 作成日時を解析
     created_at_str = google_event.get('created')
     created_at_dt = None
     if created_at_str:
         try:
-            created_at_dt = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
+            created_at_dt = _parse_rfc3339(created_at_str)
         except ValueError:
             print(f"Warning: Could not parse google_event created_at: {created_at_str}")
 
+    event_id = google_event.get('id')
     return {
-        'id': f"google_{google_event.get('id')}",
+        'id': f"google_{event_id}",
         'user_id': user_id,
         'title': google_event.get('summary', ''),
         'description': google_event.get('description', ''),
@@ -47,9 +82,29 @@ def _create_event_dict(google_event: Dict, user_id: str) -> Dict:
         'location': google_event.get('location', ''),
         'created_at': created_at_dt,
         'source': 'google_calendar',
-        'google_event_id': google_event.get('id')
+        'google_event_id': event_id
+    }
+
+
+def _build_event_body(title: str, start_time: datetime, end_time: datetime, description: str = None, location: str = None) -> Dict:
+    """Google Calendarのイベント作成用のリクエストボディを作成するヘルパー関数"""
+    event_body = {
+        'summary': title,
+        'description': description or '',
+        'start': {
+            'dateTime': start_time.isoformat(),
+            'timeZone': 'Asia/Tokyo',
+        },
+        'end': {
+            'dateTime': end_time.isoformat(),
+            'timeZone': 'Asia/Tokyo',
+        },
     }
 
+    if location:
+        event_body['location'] = location
+    return event_body
+
 
 def add_event(user_id: str, title: str, start_time: datetime, end_time: datetime = None, description: str = None, location: str = None, sync_to_google: bool = True) -> Dict:
     """Google Calendarにカレンダーイベントを追加する"""
@@ -63,30 +118,19 @@ def add_event(user_id: str, title: str, start_time: datetime, end_time: datetime
     try:
         calendar_service = get_google_calendar_service(user_id, db)
         if calendar_service:
-            # イベントボディを作成
-            event_body = {
-                'summary': title,
-                'description': description or '',
-                'start': {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': 'Asia/Tokyo',
-                },
-                'end': {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': 'Asia/Tokyo',
-                },
-            }
-
-            if location:
-                event_body['location'] = location
+            event_body = _build_event_body(title, start_time, end_time, description, location)
 
             # Google Calendarにイベントを追加
             result = calendar_service.events().insert(
                 calendarId='primary',
-                body=event_body
+                body=event_body,
+                fields=EVENT_FIELDS
             ).execute()
 
-            return _create_event_dict(result, user_id)
+            event = _create_event_dict(result, user_id)
+            index_items(db, user_id, 'event', [event])
+            event_window_cache.invalidate(user_id)
+            return event
         print(f"[ERROR] Google Calendar service not available for user {user_id}")
         return {"error": "Google Calendar service not available (authentication may be expired)"}
     except AuthenticationRequiredException as e:
@@ -97,11 +141,18 @@ def add_event(user_id: str, title: str, start_time: datetime, end_time: datetime
             "message": str(e),
             "action": "re-authenticate"
         }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
     except Exception as e:
         print(f"[ERROR] Google Calendar API error for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
         return {"error": f"Google Calendar API error: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
 
 
 def get_event(user_id: str, event_id: str) -> Dict:
@@ -118,7 +169,8 @@ def get_event(user_id: str, event_id: str) -> Dict:
             # 指定されたIDのイベントを取得
             google_event = calendar_service.events().get(
                 calendarId='primary',
-                eventId=google_event_id
+                eventId=google_event_id,
+                fields=EVENT_FIELDS
             ).execute()
 
             return _create_event_dict(google_event, user_id)
@@ -132,49 +184,170 @@ def get_event(user_id: str, event_id: str) -> Dict:
             "message": str(e),
             "action": "re-authenticate"
         }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
     except Exception as e:
         print(f"[ERROR] Failed to get event {event_id} for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
         return {"error": f"Event with ID {event_id} not found: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _iter_window_event_pages(calendar_service, user_id: str, start: Optional[datetime], end: Optional[datetime], page_token: Optional[str] = None) -> Iterator[Tuple[Optional[str], List[Dict]]]:
+    """期間 [start, end) に重なるイベントを1ページずつ取得する（日時が指定されたイベントのみ）
+
+    (そのページを取得したページトークン, ページのイベント) を順に返す。メモリに持つのは取得中の1ページだけ。
+    """
+    request_params = {
+        'calendarId': 'primary',
+        'maxResults': EVENT_PAGE_SIZE,
+        'singleEvents': True,
+        'orderBy': 'startTime',
+        'fields': f"{EVENT_LIST_FIELDS},nextPageToken",
+    }
+    if start is not None:
+        request_params['timeMin'] = _to_rfc3339_utc(start)
+    if end is not None:
+        request_params['timeMax'] = _to_rfc3339_utc(end)
+    while True:
+        if page_token:
+            request_params['pageToken'] = page_token
+        google_events = calendar_service.events().list(**request_params).execute()
+        page = [
+            _create_event_dict(google_event, user_id) for google_event in google_events.get('items', [])
+            if google_event.get('start', {}).get('dateTime') and google_event.get('end', {}).get('dateTime')
+        ]
+        yield page_token, page
+        page_token = google_events.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _list_window_events(calendar_service, user_id: str, start: datetime, end: datetime) -> List[Dict]:
+    """期間 [start, end) に重なる全てのイベントをページングして取得する（日時が指定されたイベントのみ）"""
+    events = []
+    for _, page in _iter_window_event_pages(calendar_service, user_id, start, end):
+        events.extend(page)
+    return events
+
+
+def _fetch_uncovered(db, calendar_service, user_id: str, uncovered: List[Tuple[datetime, datetime]], generation: int) -> List[Dict]:
+    """キャッシュで覆われていない期間を取得してキャッシュと検索インデックスに入れる"""
+    fetched = []
+    fetched_windows = []
+    for sub_start, sub_end in uncovered:
+        print(f"[get_all_events] user_id: {user_id}, fetching {_to_rfc3339_utc(sub_start)} - {_to_rfc3339_utc(sub_end)}")
+        window_events = _list_window_events(calendar_service, user_id, sub_start, sub_end)
+        event_window_cache.store(user_id, sub_start, sub_end, window_events, generation)
+        fetched.extend(window_events)
+        fetched_windows.append((sub_start, sub_end, window_events))
+
+    # 検索インデックスを更新（最後まで取得した期間にないイベントはGoogleで削除されたので取り除く）
+    index_items(db, user_id, 'event', fetched)
+    _prune_windows(db, user_id, fetched_windows)
+    return fetched
+
+
+def _prune_windows(db, user_id: str, windows: List[Tuple[datetime, datetime, List[Dict]]]):
+    """最後まで取得した期間ごとに、取得したイベントにない検索ドキュメントを取り除く"""
+    for start, end, events in windows:
+        prune_items(db, user_id, 'event', [event['google_event_id'] for event in events], start, end)
+
+
+def _within_fill_limit(uncovered: List[Tuple[datetime, datetime]]) -> bool:
+    """覆われていない期間の合計が、キャッシュを埋めるために全件を取得してよい長さ（EVENT_CACHE_MAX_FILL_DAYS）以内か"""
+    uncovered_span = sum((sub_end - sub_start for sub_start, sub_end in uncovered), timedelta())
+    return uncovered_span <= timedelta(days=EVENT_CACHE_MAX_FILL_DAYS)
+
+
+def _list_limited_events(calendar_service, user_id: str, start_date: datetime, end_date: Optional[datetime],
+                         limit: int = EVENT_LIST_LIMIT) -> List[Dict]:
+    """期間のイベントを開始時刻順に最大limit件だけ、1回のリクエストで取得する（日時が指定されたイベントのみ）"""
+    request_params = {'calendarId': 'primary', 'maxResults': limit, 'singleEvents': True, 'orderBy': 'startTime', 'fields': EVENT_LIST_FIELDS}
+
+    time_min_val = _to_rfc3339_utc(start_date)
+    if time_min_val:
+        request_params['timeMin'] = time_min_val
+
+    time_max_val = _to_rfc3339_utc(end_date)
+    if time_max_val:
+        request_params['timeMax'] = time_max_val
+
+    print(f"[get_all_events] user_id: {user_id}, time_min: {time_min_val}, time_max: {time_max_val}")
+
+    google_events = calendar_service.events().list(**request_params).execute()
+
+    # 取得したイベント数をログ出力
+    items = google_events.get('items', [])
+    print(f"[get_all_events] user_id: {user_id}, fetched {len(items)} events from Google Calendar")
 
+    result = []
+    for google_event in items:
+        event_dict = _create_event_dict(google_event, user_id)
+        print(f"[get_all_events] event: {event_dict.get('title')} | start: {event_dict.get('start_time')} | end: {event_dict.get('end_time')}")
 
-def get_all_events(user_id: str, start_date: datetime, end_date: Optional[datetime] = None, include_google_calendar: bool = True) -> List[Dict]:
-    """Google Calendarからユーザーの全てのイベントアイテムを取得する"""
-    # データベースセッションを取得（Credentials用）
-    db = next(get_db())
+        # 開始時刻と終了時刻が存在するイベントのみ追加
+        if google_event.get('start', {}).get('dateTime') and google_event.get('end', {}).get('dateTime'):
+            result.append(event_dict)
+    return result
 
-    result = []
 
-    try:
-        calendar_service = get_google_calendar_service(user_id, db)
-        if calendar_service:
-            # Google Calendarからイベントを取得
-            request_params = {'calendarId': 'primary', 'maxResults': 10, 'singleEvents': True, 'orderBy': 'startTime'}
+def _finish_events(result: List[Dict], compact: bool) -> List[Dict]:
+    # 開始時刻でソート
+    result.sort(key=lambda x: x.get('start_time') or datetime.min)
+    result = result[:EVENT_LIST_LIMIT]
 
-            time_min_val = _to_rfc3339_utc(start_date)
-            if time_min_val:
-                request_params['timeMin'] = time_min_val
+    print(f"[get_all_events] Returning {len(result)} events after filtering and sorting")
 
-            time_max_val = _to_rfc3339_utc(end_date)
-            if time_max_val:
-                request_params['timeMax'] = time_max_val
+    if compact:
+        return compact_items(result)
+    return result
 
-            print(f"[get_all_events] user_id: {user_id}, time_min: {time_min_val}, time_max: {time_max_val}")
 
-            google_events = calendar_service.events().list(**request_params).execute()
+def get_all_events(user_id: str, start_date: datetime, end_date: Optional[datetime] = None, include_google_calendar: bool = True, compact: bool = False) -> List[Dict]:
+    """Google Calendarからユーザーの全てのイベントアイテムを取得する
 
-            # 取得したイベント数をログ出力
-            items = google_events.get('items', [])
-            print(f"[get_all_events] user_id: {user_id}, fetched {len(items)} events from Google Calendar")
+    終了日時が指定された場合は期間キャッシュを使い、キャッシュで覆われていない期間だけをGoogleから取得する。
+    覆われていない期間がEVENT_CACHE_MAX_FILL_DAYSより長い場合は、キャッシュに入れずにEVENT_LIST_LIMIT件だけを取得する。
+    """
+    from google.auth.exceptions import RefreshError
 
-            for google_event in google_events.get('items', []):
-                event_dict = _create_event_dict(google_event, user_id)
-                print(f"[get_all_events] event: {event_dict.get('title')} | start: {event_dict.get('start_time')} | end: {event_dict.get('end_time')}")
+    use_cache = end_date is not None and event_window_cache.enabled
+    if use_cache:
+        window_start, window_end = _as_utc(start_date), _as_utc(end_date)
+        generation = event_window_cache.generation(user_id)
+        cached_events, uncovered = event_window_cache.lookup(user_id, window_start, window_end)
+        if not uncovered:
+            print(f"[get_all_events] user_id: {user_id}, served {len(cached_events)} events from cache")
+            return _finish_events(cached_events, compact)
+        # 覆われていない期間が長い場合は、キャッシュを埋めるために全件を取得せず、上限件数だけを1回で取得する
+        use_cache = _within_fill_limit(uncovered)
 
-                # 開始時刻と終了時刻が存在するイベントのみ追加
-                if google_event.get('start', {}).get('dateTime') and google_event.get('end', {}).get('dateTime'):
-                    result.append(event_dict)
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    result = []
+
+    try:
+        calendar_service = get_google_calendar_service(user_id, db)
+        if calendar_service and use_cache:
+            # キャッシュで覆われていない期間だけを取得し、キャッシュ済みのイベントと合わせる
+            events_by_id = {event['google_event_id']: event for event in cached_events}
+            fetched = _fetch_uncovered(db, calendar_service, user_id, uncovered, generation)
+            events_by_id.update((event['google_event_id'], event) for event in fetched)
+            result = list(events_by_id.values())
+            print(f"[get_all_events] user_id: {user_id}, {len(cached_events)} cached + {len(fetched)} fetched events")
+        elif calendar_service:
+            # Google Calendarからイベントを取得
+            result = _list_limited_events(calendar_service, user_id, start_date, end_date)
+
+            # 検索インデックスを更新
+            index_items(db, user_id, 'event', result)
 
     except AuthenticationRequiredException as e:
         # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
@@ -192,15 +365,233 @@ def get_all_events(user_id: str, start_date: datetime, end_date: Optional[dateti
             "message": str(e),
             "action": "re-authenticate"
         }]
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return [e.as_dict()]
     except Exception as e:
         # その他のGoogle API呼び出しでエラーが発生した場合、ログに記録するが処理は継続
         print(f"[ERROR] Google Calendar API error in get_all_events for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
 
-    # 開始時刻でソート
-    result.sort(key=lambda x: x.get('start_time') or datetime.min)
+    return _finish_events(result, compact)
 
-    print(f"[get_all_events] Returning {len(result)} events after filtering and sorting")
 
-    return result
\ No newline at end of file
+def warm_event_window(user_id: str, start_date: datetime, end_date: datetime) -> int:
+    """期間 [start_date, end_date) のイベントを先読みして期間キャッシュに入れ、取得した期間の数を返す
+
+    キャッシュのヒット率に数えないよう、先読みの照合はメトリクスに記録しない。
+    """
+    if not event_window_cache.enabled:
+        return 0
+    window_start, window_end = _as_utc(start_date), _as_utc(end_date)
+    generation = event_window_cache.generation(user_id)
+    _, uncovered = event_window_cache.lookup(user_id, window_start, window_end, record_metrics=False)
+    if not uncovered:
+        return 0
+
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        calendar_service = get_google_calendar_service(user_id, db)
+        if not calendar_service:
+            return 0
+        _fetch_uncovered(db, calendar_service, user_id, uncovered, generation)
+        return len(uncovered)
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def stream_events(user_id: str, start_date: datetime, end_date: Optional[datetime] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """Google Calendarから期間のイベントをページごとに取得し、件数の上限なしに1回の応答の大きさの上限まで返す
+
+    一覧全体をメモリに持たないように、期間キャッシュと検索インデックスは使わない。
+    続きがある場合はnext_cursorを返すので、同じ期間で次の呼び出しのcursorに渡す。
+    """
+    from google.auth.exceptions import RefreshError
+
+    try:
+        page_token, offset = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        return {"error": str(e)}
+
+    # データベースセッションを取得（Credentials用。サービスを作成したらすぐに返却する）
+    db = next(get_db())
+
+    try:
+        calendar_service = get_google_calendar_service(user_id, db)
+    except (AuthenticationRequiredException, RefreshError) as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+    if not calendar_service:
+        return {"error": "Google Calendar service not available"}
+
+    try:
+        pages = _iter_window_event_pages(calendar_service, user_id, start_date, end_date, page_token)
+        result = collect_pages(pages, offset, compact, label='events')
+    except RefreshError as e:
+        print(f"[ERROR] RefreshError for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
+    except Exception as e:
+        print(f"[ERROR] Google Calendar API error in stream_events for user {user_id}: {type(e).__name__}: {e}")
+        if hasattr(e, 'resp') and e.resp:
+            print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+        return {"error": f"Google API error: {type(e).__name__}: {e}"}
+
+    print(f"[stream_events] user_id: {user_id}, returning {len(result['items'])} events from {result['pages']} pages ({result['bytes']} bytes)")
+    return result
+
+
+def _merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[List[datetime]]:
+    """重なり合う・隣接する区間を開始時刻順に併合する"""
+    merged: List[List[datetime]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _compute_free_slots(
+    busy: List[Tuple[datetime, datetime]],
+    window_start: datetime,
+    window_end: datetime,
+    work_start: time,
+    work_end: time,
+    min_duration: timedelta,
+    include_weekends: bool = False
+) -> List[Tuple[datetime, datetime]]:
+    """予定の区間から、勤務時間内で最小時間以上の空き区間を求める（スイープライン）"""
+    merged = _merge_intervals(busy)
+    slots = []
+    index = 0
+    day = window_start.astimezone(LOCAL_TZ).date()
+    last_day = window_end.astimezone(LOCAL_TZ).date()
+
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            day_start = max(window_start, datetime.combine(day, work_start, LOCAL_TZ))
+            day_end = min(window_end, datetime.combine(day, work_end, LOCAL_TZ))
+            if day_start < day_end:
+                # この日の開始前に終わっている予定は以降の日にも関係しないので読み飛ばす
+                while index < len(merged) and merged[index][1] <= day_start:
+                    index += 1
+                cursor = day_start
+                position = index
+                while position < len(merged) and merged[position][0] < day_end:
+                    busy_start, busy_end = merged[position]
+                    if busy_start > cursor and busy_start - cursor >= min_duration:
+                        slots.append((cursor, busy_start))
+                    cursor = max(cursor, busy_end)
+                    position += 1
+                if day_end > cursor and day_end - cursor >= min_duration:
+                    slots.append((cursor, day_end))
+        day += timedelta(days=1)
+
+    return slots
+
+
+def find_free_slots(
+    user_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    min_duration_minutes: int = 30,
+    working_hours_start: str = "09:00",
+    working_hours_end: str = "18:00",
+    include_weekends: bool = False,
+    calendar_ids: Optional[List[str]] = None
+) -> List[Dict]:
+    """Google Calendarのfree/busy情報から空き時間を求める
+
+    イベント本体は取得せず、freebusy().queryで予定の入っている区間だけを取得する。
+    """
+    from google.auth.exceptions import RefreshError
+
+    try:
+        work_start = time.fromisoformat(working_hours_start)
+        work_end = time.fromisoformat(working_hours_end)
+    except ValueError as e:
+        return [{"error": f"Invalid working hours: {e}"}]
+    if work_start >= work_end:
+        return [{"error": "working_hours_start must be earlier than working_hours_end"}]
+
+    window_start = start_date if start_date.tzinfo else start_date.replace(tzinfo=LOCAL_TZ)
+    window_end = end_date if end_date.tzinfo else end_date.replace(tzinfo=LOCAL_TZ)
+    calendar_ids = calendar_ids or ['primary']
+
+    # データベースセッションを取得（Credentials用）
+    db = next(get_db())
+
+    try:
+        calendar_service = get_google_calendar_service(user_id, db)
+        if not calendar_service:
+            print(f"[ERROR] Google Calendar service not available for user {user_id}")
+            return [{"error": "Google Calendar service not available (authentication may be expired)"}]
+
+        freebusy = calendar_service.freebusy().query(body={
+            'timeMin': _to_rfc3339_utc(window_start),
+            'timeMax': _to_rfc3339_utc(window_end),
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+        }).execute()
+
+        busy = []
+        for calendar_id, calendar in freebusy.get('calendars', {}).items():
+            for error in calendar.get('errors', []):
+                print(f"[WARNING] freebusy error for calendar {calendar_id}: {error.get('reason')}")
+            for period in calendar.get('busy', []):
+                busy.append((_parse_rfc3339(period['start']), _parse_rfc3339(period['end'])))
+        print(f"[find_free_slots] user_id: {user_id}, {len(busy)} busy periods in {len(calendar_ids)} calendars")
+    except (AuthenticationRequiredException, RefreshError) as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return [{
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }]
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return [e.as_dict()]
+    except Exception as e:
+        print(f"[ERROR] Google Calendar API error in find_free_slots for user {user_id}: {type(e).__name__}: {e}")
+        if hasattr(e, 'resp') and e.resp:
+            print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+        return [{"error": f"Google Calendar API error: {type(e).__name__}: {e}"}]
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    slots = _compute_free_slots(
+        busy, window_start, window_end, work_start, work_end,
+        timedelta(minutes=min_duration_minutes), include_weekends
+    )
+    return [{
+        'start_time': slot_start.astimezone(LOCAL_TZ),
+        'end_time': slot_end.astimezone(LOCAL_TZ),
+        'duration_minutes': int((slot_end - slot_start).total_seconds() // 60),
+    } for slot_start, slot_end in slots]
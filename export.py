@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ユーザーのTODOとイベントの一括エクスポート（NDJSON / Parquet）
+
+バックアップや分析のために、指定したユーザー（省略時は失効していない全てのユーザー）のTODOとイベントを
+Googleから1ページずつ取得し、そのままファイルに書き込む。メモリに持つのはワーカーごとに取得中の1ページだけ。
+(ユーザー, 種類) ごとの進み具合を出力先のチェックポイントファイルに保存するので、中断した場合は
+同じ出力先で再実行すると完了したものは飛ばし、NDJSONは途中のページから続きを書き込む。
+
+    python export.py --output exports                       # 全ユーザーをNDJSONで
+    python export.py --output exports --user-id 1234 --format parquet
+    python export.py --output exports --restart             # チェックポイントを破棄して最初から
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from models import GoogleCredentials, get_db
+from google_api import get_google_tasks_service, get_google_calendar_service, AuthenticationRequiredException
+from todo_service import _get_default_tasklist_id, _create_task_dict, TASK_FIELDS, TASK_PAGE_SIZE
+from event_service import _create_event_dict, _to_rfc3339_utc, EVENT_PAGE_SIZE
+
+
+EXPORT_KINDS = ('todos', 'events')
+# 同時にエクスポートする (ユーザー, 種類) の数（Google APIの同時呼び出し数の上限を超えないようにする）
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", 4))
+CHECKPOINT_FILE = '_checkpoint.json'
+
+# バックアップなので、非表示（完了してクリアした）のタスクと終日のイベントも取得する
+EXPORT_TASK_FIELDS = f"items({TASK_FIELDS},hidden),nextPageToken"
+EXPORT_EVENT_FIELDS = "items(id,summary,description,location,start(date,dateTime),end(date,dateTime),created),nextPageToken"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Checkpoint:
+    """(種類, ユーザー) ごとのエクスポートの進み具合をJSONファイルに保存する
+
+    各エントリは page_token（次に取得するページ）、offset（それまでに書き込んだバイト数）、
+    count（書き込んだ件数）、done（完了したか）を持つ。エクスポートの条件が異なるチェックポイントからは再開しない。
+    """
+
+    def __init__(self, path: str, options: Dict, restart: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if not restart and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('options') != options:
+                raise ValueError(
+                    f"Checkpoint {path} was written with different options {saved.get('options')}; "
+                    "use another output directory or --restart"
+                )
+            self._entries = saved.get('entries', {})
+        self._options = options
+
+    def get(self, key: str) -> Dict:
+        with self._lock:
+            return dict(self._entries.get(key, {}))
+
+    def update(self, key: str, **values):
+        with self._lock:
+            self._entries.setdefault(key, {}).update(values)
+            # 書き込み途中で止まっても壊れたチェックポイントが残らないように置き換える
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'options': self._options, 'entries': self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+class NdjsonWriter:
+    """1行に1件のJSONを書き込む（チェックポイントのバイト数まで切り詰めて続きから追記できる）"""
+
+    extension = 'ndjson'
+    resumable = True
+
+    def __init__(self, path: str, kind: str, offset: int = 0):
+        if offset:
+            self._file = open(path, 'r+b')
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        else:
+            self._file = open(path, 'wb')
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def write_page(self, items: List[Dict]):
+        self._file.write(b''.join(
+            json.dumps(item, ensure_ascii=False, default=_json_default).encode('utf-8') + b'\n' for item in items
+        ))
+        self._file.flush()
+
+    def close(self, complete: bool = True):
+        self._file.close()
+
+
+def _parquet_schema(pa, kind: str):
+    string_fields = ['id', 'user_id', 'title', 'description']
+    if kind == 'todos':
+        fields = [(name, pa.string()) for name in string_fields] + [
+            ('completed', pa.bool_()), ('created_at', pa.string()), ('due', pa.string()),
+            ('source', pa.string()), ('google_task_id', pa.string()), ('hidden', pa.bool_()),
+        ]
+    else:
+        timestamp = pa.timestamp('us', tz='UTC')
+        fields = [(name, pa.string()) for name in string_fields] + [
+            ('start_time', timestamp), ('end_time', timestamp), ('location', pa.string()),
+            ('created_at', timestamp), ('source', pa.string()), ('google_event_id', pa.string()),
+            ('all_day', pa.bool_()),
+        ]
+    return pa.schema(fields)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+class ParquetWriter:
+    """1ページを1つの行グループとしてParquetに書き込む（pyarrowが必要）
+
+    Parquetは追記できないため、途中で止まったファイルは再開せずに最初から書き直す。
+    書き込み中は .part に書き、完了したら本来の名前に変える。
+    """
+
+    extension = 'parquet'
+    resumable = False
+
+    def __init__(self, path: str, kind: str, offset: int = 0):
+        pa, pq = _import_pyarrow()
+        self._pa = pa
+        self._path = path
+        self._schema = _parquet_schema(pa, kind)
+        self._writer = pq.ParquetWriter(f"{path}.part", self._schema)
+
+    def tell(self) -> int:
+        return 0
+
+    def write_page(self, items: List[Dict]):
+        if items:
+            self._writer.write_table(self._pa.Table.from_pylist(items, schema=self._schema))
+
+    def close(self, complete: bool = True):
+        self._writer.close()
+        if complete:
+            os.replace(f"{self._path}.part", self._path)
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+def _all_user_ids() -> List[str]:
+    """クレデンシャルが失効していない全てのユーザーID"""
+    db = next(get_db())
+    try:
+        rows = db.query(GoogleCredentials.user_id).filter(
+            GoogleCredentials.revoked == False  # noqa: E712
+        ).order_by(GoogleCredentials.user_id).all()
+        return [row.user_id for row in rows]
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _get_service(kind: str, user_id: str):
+    # データベースセッションを取得（Credentials用。サービスを作成したらすぐに返却する）
+    db = next(get_db())
+    try:
+        if kind == 'todos':
+            return get_google_tasks_service(user_id, db)
+        return get_google_calendar_service(user_id, db)
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _iter_todo_pages(tasks_service, user_id: str, page_token: Optional[str] = None) -> Iterator[Tuple[Optional[str], List[Dict]]]:
+    """非表示のものを含む全てのタスクを1ページずつ取得する
+
+    (そのページを取得したページトークン, ページのTODO) を順に返す。
+    """
+    tasklist_id = _get_default_tasklist_id(tasks_service)
+    params = {'tasklist': tasklist_id, 'maxResults': TASK_PAGE_SIZE, 'fields': EXPORT_TASK_FIELDS,
+              'showCompleted': True, 'showHidden': True}
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        response = tasks_service.tasks().list(**params).execute()
+        page = []
+        for google_task in response.get('items', []):
+            todo = _create_task_dict(google_task, user_id)
+            todo['hidden'] = bool(google_task.get('hidden'))
+            page.append(todo)
+        yield page_token, page
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _all_day_time(value: Dict) -> datetime:
+    return datetime.combine(datetime.strptime(value['date'], '%Y-%m-%d').date(), time.min, tzinfo=timezone.utc)
+
+
+def _export_event_dict(google_event: Dict, user_id: str) -> Dict:
+    """終日のイベントは日付の0時（UTC）を開始・終了日時にして all_day を立てる"""
+    event = _create_event_dict(google_event, user_id)
+    start, end = google_event.get('start') or {}, google_event.get('end') or {}
+    event['all_day'] = 'date' in start
+    if event['all_day']:
+        event['start_time'] = _all_day_time(start)
+        event['end_time'] = _all_day_time(end) if 'date' in end else None
+    return event
+
+
+def _iter_window_event_pages(calendar_service, user_id: str, start: Optional[datetime], end: datetime,
+                             page_token: Optional[str] = None) -> Iterator[Tuple[Optional[str], List[Dict]]]:
+    """期間 [start, end) に重なる全てのイベント（終日のイベントを含む）を1ページずつ取得する
+
+    (そのページを取得したページトークン, ページのイベント) を順に返す。
+    """
+    params = {'calendarId': 'primary', 'maxResults': EVENT_PAGE_SIZE, 'singleEvents': True, 'orderBy': 'startTime',
+              'fields': EXPORT_EVENT_FIELDS, 'timeMax': _to_rfc3339_utc(end)}
+    if start is not None:
+        params['timeMin'] = _to_rfc3339_utc(start)
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        response = calendar_service.events().list(**params).execute()
+        yield page_token, [_export_event_dict(google_event, user_id) for google_event in response.get('items', [])]
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def export_user(user_id: str, kind: str, output_dir: str, writer_class, checkpoint: Checkpoint,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                on_progress: Optional[Callable[[str, str, int, int], None]] = None) -> Dict:
+    """1人のユーザーのTODOまたはイベントをページごとにファイルへ書き込む
+
+    ページを書き込む前に、そのページから再開できる位置をチェックポイントに保存する。
+    {'user_id', 'kind', 'path', 'count', 'pages'}（完了済みで飛ばした場合は 'skipped': True）を、
+    失敗した場合は 'error' を返す。
+    """
+    key = f"{kind}/{user_id}"
+    path = os.path.join(output_dir, kind, f"{quote(user_id, safe='')}.{writer_class.extension}")
+    result = {'user_id': user_id, 'kind': kind, 'path': path}
+    state = checkpoint.get(key)
+    if state.get('done'):
+        return {**result, 'count': state.get('count', 0), 'pages': 0, 'skipped': True}
+
+    page_token, offset, count = state.get('page_token'), state.get('offset', 0), state.get('count', 0)
+    if not writer_class.resumable or not os.path.exists(path) or os.path.getsize(path) < offset:
+        page_token, offset, count = None, 0, 0
+
+    try:
+        service = _get_service(kind, user_id)
+    except AuthenticationRequiredException as e:
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {**result, 'error': 'authentication_required'}
+    if not service:
+        return {**result, 'error': f"Google {kind} service not available"}
+
+    if kind == 'todos':
+        pages = _iter_todo_pages(service, user_id, page_token)
+    else:
+        pages = _iter_window_event_pages(service, user_id, start, end, page_token)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writer = writer_class(path, kind, offset)
+    pages_written = 0
+    try:
+        for token, page in pages:
+            checkpoint.update(key, page_token=token, offset=writer.tell(), count=count)
+            writer.write_page(page)
+            count += len(page)
+            pages_written += 1
+            if on_progress:
+                on_progress(user_id, kind, count, pages_written)
+    except Exception as e:
+        # 書き込み済みのページはチェックポイントから再開できるように残す
+        writer.close(complete=False)
+        print(f"[ERROR] Export of {key} failed after {count} {kind}: {type(e).__name__}: {e}")
+        return {**result, 'count': count, 'pages': pages_written, 'error': f"{type(e).__name__}: {e}"}
+    finally:
+        pages.close()
+    offset = writer.tell()
+    writer.close()
+    checkpoint.update(key, page_token=None, offset=offset, count=count, done=True)
+    return {**result, 'count': count, 'pages': pages_written}
+
+
+def run_export(output_dir: str, user_ids: Optional[Iterable[str]] = None, fmt: str = 'ndjson',
+               kinds: Iterable[str] = EXPORT_KINDS, concurrency: int = EXPORT_CONCURRENCY,
+               start: Optional[datetime] = None, end: Optional[datetime] = None, restart: bool = False,
+               on_progress: Optional[Callable[[str, str, int, int], None]] = None) -> Dict:
+    """ユーザーのTODOとイベントを最大concurrency件ずつ並行してエクスポートする
+
+    終わりのない定期的な予定があるため、イベントをエクスポートする場合はendが必要。
+    {'results'': 各 (ユーザー, 種類) の結果, 'count': 書き込んだ件数の合計, 'errors': 失敗した数} を返す。
+    失敗したものは同じ出力先で再実行するとチェックポイントから続きを書き込む。
+    """
+    writer_class = WRITERS[fmt]
+    if writer_class is ParquetWriter:
+        # ワーカーを起動する前にpyarrowがあるか確認する
+        _import_pyarrow()
+    kinds = list(kinds)
+    if 'events' in kinds and end is None:
+        raise ValueError("Exporting events requires an end (--end), because recurring events may never end")
+    os.makedirs(output_dir, exist_ok=True)
+    options = {
+        'format': fmt,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+    }
+    checkpoint = Checkpoint(os.path.join(output_dir, CHECKPOINT_FILE), options, restart)
+    user_ids = list(user_ids) if user_ids else _all_user_ids()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='export') as executor:
+        futures = [
+            executor.submit(export_user, user_id, kind, output_dir, writer_class, checkpoint, start, end, on_progress)
+            for user_id in user_ids for kind in kinds
+        ]
+        for future in as_completed(futures):
+            results.append(future.result())
+    results.sort(key=lambda r: (r['user_id'], r['kind']))
+    return {
+        'results': results,
+        'count': sum(r.get('count', 0) for r in results),
+        'errors': sum(1 for r in results if 'error' in r),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユーザーのTODOとイベントの一括エクスポート")
+    parser.add_argument('--output', default='exports', help="出力先のディレクトリ（チェックポイントもここに保存する）")
+    parser.add_argument('--user-id', action='append', help="エクスポートするユーザー（複数指定可。省略時は全ユーザー）")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='ndjson', help="出力形式（parquetはpyarrowが必要）")
+    parser.add_argument('--kinds', default=','.join(EXPORT_KINDS), help="エクスポートする種類（カンマ区切り）")
+    parser.add_argument('--concurrency', type=int, default=EXPORT_CONCURRENCY, help="同時にエクスポートする数")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="この日時以降に終わるイベントに絞る")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="この日時より前に始まるイベントに絞る（イベントをエクスポートする場合は必須）")
+    parser.add_argument('--restart', action='store_true', help="チェックポイントを破棄して最初からエクスポートする")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = set(kinds) - set(EXPORT_KINDS)
+    if unknown:
+        parser.error(f"unknown kinds: {', '.join(sorted(unknown))}")
+
+    def on_progress(user_id, kind, count, pages):
+        print(f"[export] {kind}/{user_id}: {count} {kind} ({pages} pages)")
+
+    try:
+        summary = run_export(args.output, args.user_id, args.format, kinds, args.concurrency,
+                             args.start, args.end, args.restart, on_progress)
+    except (RuntimeError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(2)
+    for result in summary['results']:
+        status = 'skipped (already exported)' if result.get('skipped') else result.get('error', 'ok')
+        print(f"{result['kind']}/{result['user_id']}: {result.get('count', 0)} -> {result['path']} [{status}]")
+    print(f"Exported {summary['count']} items, {summary['errors']} errors")
+    if summary['errors']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,50 @@
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, List, Tuple, TYPE_CHECKING
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from models import GoogleCredentials
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google.auth.exceptions import RefreshError
+from models import GoogleCredentials, get_replica_db
+from admission import upstream_limiter
 import json
+import os
+import threading
+import time
+
+# google.auth / googleapiclientは読み込みが重いため、使用する関数内で遅延インポートする
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+# APIエンドポイントの上書き（ベンチマーク用のローカルスタブなどに向ける場合に指定）
+GOOGLE_TASKS_API_ENDPOINT = os.getenv("GOOGLE_TASKS_API_ENDPOINT")
+GOOGLE_CALENDAR_API_ENDPOINT = os.getenv("GOOGLE_CALENDAR_API_ENDPOINT")
+
+# google-api-python-clientに同梱されている静的なディスカバリードキュメント（API名.バージョン -> JSON文字列）
+_discovery_documents: Dict[str, str] = {}
+
+# ウォームアップで事前に作成したサービスオブジェクト（(API名, ユーザーID, アクセストークン) -> サービス）
+# httplib2は複数スレッドで共有できないため、各サービスは一度だけ払い出す
+_prebuilt_services: Dict[tuple, object] = {}
+_prebuilt_lock = threading.Lock()
+
+# クレデンシャルがない・失効したユーザーのネガティブキャッシュ（ユーザーID -> (有効期限, 理由)）
+# 毎回DBを読んだりOAuthの更新に失敗したりせずにすぐ失敗させる。save_google_credentialsで消去する
+CREDENTIALS_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("CREDENTIALS_NEGATIVE_CACHE_TTL_SECONDS", 60))
+_negative_cache: Dict[str, tuple] = {}
+_negative_cache_lock = threading.Lock()
+
+# レプリカを使う場合、書き込んだユーザーのクレデンシャルをプライマリから読む期間（秒）。レプリカの遅延より長くする
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 30))
+_primary_pins: Dict[str, float] = {}
+_primary_pins_lock = threading.Lock()
+# 有効期限までこの時間を切ったトークンは、レプリカの行ではなくプライマリの最新の行で更新の要否を判断する
+CREDENTIALS_EXPIRY_MARGIN = timedelta(minutes=5)
+
+# 1回のバッチリクエストにまとめる呼び出し数の上限（Calendar APIの推奨値に合わせる）
+GOOGLE_BATCH_LIMIT = 50
+
+# 上流の同時呼び出し数を制限するHttpRequest/BatchHttpRequestのサブクラス（クラス名 -> サブクラス）
+_limited_request_classes: Dict[str, type] = {}
+# APIごとのバッチリクエストの送信先（API名 -> URI）
+_batch_uris: Dict[str, str] = {}
 
 
 class AuthenticationRequiredException(Exception):
@@ -14,12 +52,140 @@ class AuthenticationRequiredException(Exception):
     pass
 
 
-def get_google_credentials(user_id: str, db: Session) -> Optional[Credentials]:
+def _remember_missing_credentials(user_id: str, reason: str):
+    if CREDENTIALS_NEGATIVE_CACHE_TTL_SECONDS <= 0:
+        return
+    with _negative_cache_lock:
+        _negative_cache[user_id] = (time.monotonic() + CREDENTIALS_NEGATIVE_CACHE_TTL_SECONDS, reason)
+
+
+def _cached_missing_credentials(user_id: str) -> Optional[str]:
+    """ネガティブキャッシュに有効なエントリがあれば理由（'missing' / 'revoked'）を返す"""
+    with _negative_cache_lock:
+        entry = _negative_cache.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _negative_cache[user_id]
+            return None
+        return entry[1]
+
+
+def clear_negative_cache(user_id: Optional[str] = None):
+    """ネガティブキャッシュを消去する（user_idを省略した場合は全ユーザー分）"""
+    with _negative_cache_lock:
+        if user_id is None:
+            _negative_cache.clear()
+        else:
+            _negative_cache.pop(user_id, None)
+
+
+def _parse_expiry(value: Optional[str]) -> Optional[datetime]:
+    """Credentials.to_json()のexpiry（UTCの'Z'付きISO形式）をgoogle-authが扱うnaiveなUTC日時に変換する"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        return None
+
+
+def _store_token(cred_record: GoogleCredentials, token_json: str):
+    """トークンのJSONと、有効期限・スコープの列を合わせて更新する（失効フラグは解除する）"""
+    token = json.loads(token_json)
+    scopes = token.get('scopes')
+    cred_record.token_json = token_json
+    cred_record.expiry = _parse_expiry(token.get('expiry'))
+    cred_record.scopes = ' '.join(scopes) if isinstance(scopes, list) else scopes
+    cred_record.revoked = False
+    cred_record.updated_at = datetime.now()
+
+
+def find_expiring_credentials(db: Session, within_seconds: float = 300, limit: int = 100) -> List[str]:
+    """有効期限がwithin_seconds以内に切れる（切れている）失効していないユーザーのIDを期限の早い順に返す
+
+    列とインデックスだけで判定するので、token_jsonを読み込まない。
+    """
+    deadline = datetime.utcnow() + timedelta(seconds=within_seconds)
+    rows = db.query(GoogleCredentials.user_id).filter(
+        GoogleCredentials.revoked == False,  # noqa: E712
+        GoogleCredentials.expiry <= deadline
+    ).order_by(GoogleCredentials.expiry).limit(limit)
+    return [row.user_id for row in rows]
+
+
+def _pin_to_primary(user_id: str):
+    """書き込んだユーザーのクレデンシャルを、レプリカに反映されるまでの間プライマリから読むようにする"""
+    if READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    with _primary_pins_lock:
+        _primary_pins[user_id] = time.monotonic() + READ_YOUR_WRITES_SECONDS
+
+
+def _pinned_to_primary(user_id: str) -> bool:
+    with _primary_pins_lock:
+        deadline = _primary_pins.get(user_id)
+        if deadline is None:
+            return False
+        if deadline <= time.monotonic():
+            del _primary_pins[user_id]
+            return False
+        return True
+
+
+def _primary_credentials_record(user_id: str, db: Session) -> Optional[GoogleCredentials]:
+    return db.query(GoogleCredentials).filter(GoogleCredentials.user_id == user_id).first()
+
+
+def _read_credentials_record(user_id: str, db: Session) -> Tuple[Optional[GoogleCredentials], bool]:
+    """クレデンシャルの行を読み、(行, プライマリから読んだかどうか) を返す
+
+    レプリカが設定されている場合は、直前にこのプロセスで書き込んだユーザー以外はレプリカから読む。
+    レプリカにない場合は、作成直後でまだ反映されていない可能性があるのでプライマリを確認する。
+    """
+    if not _pinned_to_primary(user_id):
+        replica = next(get_replica_db())
+        if replica is not None:
+            try:
+                cred_record = replica.query(GoogleCredentials).filter(GoogleCredentials.user_id == user_id).first()
+                if cred_record is not None:
+                    replica.expunge(cred_record)
+                    return cred_record, False
+            finally:
+                # コネクションプールへ確実に返却する
+                replica.close()
+    return _primary_credentials_record(user_id, db), True
+
+
+def _expires_soon(cred_record: GoogleCredentials) -> bool:
+    """有効期限の列から、トークンの更新が必要になりそうかどうかを判定する（token_jsonは読まない）"""
+    return cred_record.expiry is not None and cred_record.expiry <= datetime.utcnow() + CREDENTIALS_EXPIRY_MARGIN
+
+
+def get_google_credentials(user_id: str, db: Session) -> Optional["Credentials"]:
     """データベースからGoogleクレデンシャルを取得してCredentialsオブジェクトを作成"""
-    cred_record = db.query(GoogleCredentials).filter(GoogleCredentials.user_id == user_id).first()
+    cached_reason = _cached_missing_credentials(user_id)
+    if cached_reason == 'revoked':
+        raise AuthenticationRequiredException(f"Google認証の有効期限が切れています。再度認証を行ってください。")
+    if cached_reason == 'missing':
+        return None
+
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    from google.auth.exceptions import RefreshError
+
+    cred_record, from_primary = _read_credentials_record(user_id, db)
+    if not from_primary and (cred_record.revoked or _expires_soon(cred_record)):
+        # レプリカの行は遅れている可能性があるので、失効や更新の判断はプライマリの最新の行で行う
+        cred_record, from_primary = _primary_credentials_record(user_id, db), True
     if not cred_record or not cred_record.token_json:
         print(f"[ERROR] No valid credentials found for user {user_id}")
+        _remember_missing_credentials(user_id, 'missing')
         return None
+    if cred_record.revoked:
+        # 以前の更新で失効が分かっている場合は、token_jsonを読まずに再認証を求める
+        _remember_missing_credentials(user_id, 'revoked')
+        raise AuthenticationRequiredException(f"Google認証の有効期限が切れています。再度認証を行ってください。")
     
     try:
         credentials_dict = json.loads(cred_record.token_json)
@@ -30,24 +196,37 @@ def get_google_credentials(user_id: str, db: Session) -> Optional[Credentials]:
             token_uri=credentials_dict['token_uri'],
             client_id=credentials_dict['client_id'],
             client_secret=credentials_dict['client_secret'],
-            scopes=credentials_dict['scopes']
+            scopes=credentials_dict['scopes'],
+            # 有効期限がないと期限切れを判定できず、更新が必要かどうかが分からない
+            expiry=_parse_expiry(credentials_dict.get('expiry'))
         )
     except json.JSONDecodeError as e:
         print(f"[ERROR] Failed to decode token_json for user {user_id}: {e}")
         print(f"[ERROR] Invalid JSON content: {cred_record.token_json[:100]}...")  # 最初の100文字のみ表示
+        _remember_missing_credentials(user_id, 'missing')
         return None
     
     # トークンが期限切れの場合は更新
     if creds.expired and creds.refresh_token:
+        if not from_primary:
+            # 更新したトークンはプライマリに書き込む
+            cred_record = _primary_credentials_record(user_id, db)
         try:
             creds.refresh(Request())
             # 更新されたトークンをデータベースに保存
-            cred_record.token_json = creds.to_json()
-            cred_record.updated_at = datetime.now()
+            _store_token(cred_record, creds.to_json())
             db.commit()
+            _pin_to_primary(user_id)
         except RefreshError as e:
+            if not _is_permanent_refresh_error(e):
+                # トークンエンドポイントの一時的な障害では失効扱いにせず、次の呼び出しで再び更新を試みる
+                print(f"[ERROR] Transient RefreshError for user {user_id}: {e}")
+                return None
             print(f"[ERROR] RefreshError for user {user_id}: {e}")
             print(f"[ERROR] Token has been expired or revoked. Re-authentication required.")
+            _remember_missing_credentials(user_id, 'revoked')
+            _mark_revoked(cred_record, db)
+            _pin_to_primary(user_id)
             # RefreshErrorの場合は再認証が必要
             raise AuthenticationRequiredException(f"Google認証の有効期限が切れています。再度認証を行ってください。")
         except Exception as e:
@@ -60,30 +239,133 @@ def get_google_credentials(user_id: str, db: Session) -> Optional[Credentials]:
     return creds
 
 
-def save_google_credentials(user_id: str, creds: Credentials, db: Session):
+# 再認証しない限り更新できないことを示すOAuthのエラーコード
+PERMANENT_REFRESH_ERRORS = ('invalid_grant', 'invalid_client', 'unauthorized_client')
+
+
+def _is_permanent_refresh_error(e: "RefreshError") -> bool:
+    """リフレッシュトークンの失効など、再試行しても成功しないRefreshErrorかどうか"""
+    if getattr(e, 'retryable', False):
+        return False
+    return any(code in str(e) for code in PERMANENT_REFRESH_ERRORS)
+
+
+def _mark_revoked(cred_record: GoogleCredentials, db: Session):
+    """更新に失敗したクレデンシャルに失効フラグを立てる（失敗しても認証エラーの応答には影響させない）"""
+    try:
+        cred_record.revoked = True
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[WARNING] Failed to mark credentials as revoked for user {cred_record.user_id}: {type(e).__name__}: {e}")
+
+
+def save_google_credentials(user_id: str, creds: "Credentials", db: Session):
     """Googleクレデンシャルをデータベースに保存"""
     cred_record = db.query(GoogleCredentials).filter(GoogleCredentials.user_id == user_id).first()
     
     token_data_json = creds.to_json() # CredentialsオブジェクトをJSON文字列に変換
 
-    if cred_record:
-        # 既存のレコードを更新
-        cred_record.token_json = token_data_json
-        cred_record.updated_at = datetime.now()
-    else:
+    if not cred_record:
         # 新しいレコードを作成
-        cred_record = GoogleCredentials(
-            user_id=user_id,
-            token_json=token_data_json,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
+        cred_record = GoogleCredentials(user_id=user_id, created_at=datetime.now())
         db.add(cred_record)
+    _store_token(cred_record, token_data_json)
     
     db.commit()
+    _pin_to_primary(user_id)
+    # 新しいトークンが保存されたので、すぐに使えるようにする
+    clear_negative_cache(user_id)
     return cred_record
 
 
+def _client_options(api_endpoint: Optional[str]) -> Optional[Dict]:
+    """エンドポイントの上書き指定があればbuild()に渡すclient_optionsを返す"""
+    if not api_endpoint:
+        return None
+    return {"api_endpoint": api_endpoint}
+
+
+def _get_discovery_document(api: str, version: str) -> str:
+    """同梱のディスカバリードキュメントを読み込む（プロセス内で一度だけ読み込んでキャッシュする）"""
+    key = f"{api}.{version}"
+    document = _discovery_documents.get(key)
+    if document is None:
+        from googleapiclient import discovery_cache
+        document = discovery_cache.get_static_doc(api, version)
+        if document is None:
+            raise ValueError(f"Static discovery document not found: {key}")
+        _discovery_documents[key] = document
+    return document
+
+
+def _limited_request_class(name: str) -> type:
+    """execute()がupstream_limiterの枠を取ってから送信するgoogleapiclient.httpのリクエストクラスを返す
+
+    上限を超えて待ち時間も過ぎた場合はadmission.OverloadedErrorを送出する。
+    googleapiclientの読み込みを遅らせるため、初めて使うときにサブクラスを作成する。
+    """
+    request_class = _limited_request_classes.get(name)
+    if request_class is None:
+        from googleapiclient import http
+        base = getattr(http, name)
+
+        def execute(self, *args, **kwargs):
+            with upstream_limiter.slot():
+                return base.execute(self, *args, **kwargs)
+        request_class = _limited_request_classes[name] = type(f"Limited{name}", (base,), {'execute': execute})
+    return request_class
+
+
+def _build_service(api: str, version: str, creds: "Credentials", api_endpoint: Optional[str]):
+    """キャッシュしたディスカバリードキュメントからサービスオブジェクトを作成"""
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(
+        _get_discovery_document(api, version),
+        credentials=creds,
+        client_options=_client_options(api_endpoint),
+        requestBuilder=_limited_request_class('HttpRequest')
+    )
+
+
+def _take_prebuilt_service(api: str, user_id: str, creds: "Credentials"):
+    """ウォームアップで作成済みのサービスがあれば取り出す"""
+    with _prebuilt_lock:
+        return _prebuilt_services.pop((api, user_id, creds.token), None)
+
+
+def warm_up_services(db: Session, recent_users: int = 10) -> List[str]:
+    """起動直後のウォームアップ
+
+    重いモジュールとディスカバリードキュメントを読み込み、最近アクティブなユーザーの
+    サービスオブジェクトを事前に作成しておく。作成できたユーザーIDのリストを返す。
+    """
+    _get_discovery_document('tasks', 'v1')
+    _get_discovery_document('calendar', 'v3')
+
+    warmed = []
+    if recent_users <= 0:
+        return warmed
+
+    records = db.query(GoogleCredentials).filter(
+        GoogleCredentials.revoked == False  # noqa: E712
+    ).order_by(GoogleCredentials.updated_at.desc()).limit(recent_users).all()
+    for record in records:
+        try:
+            creds = get_google_credentials(record.user_id, db)
+            if not creds:
+                continue
+            tasks_service = _build_service('tasks', 'v1', creds, GOOGLE_TASKS_API_ENDPOINT)
+            calendar_service = _build_service('calendar', 'v3', creds, GOOGLE_CALENDAR_API_ENDPOINT)
+            with _prebuilt_lock:
+                _prebuilt_services[('tasks', record.user_id, creds.token)] = tasks_service
+                _prebuilt_services[('calendar', record.user_id, creds.token)] = calendar_service
+            warmed.append(record.user_id)
+        except Exception as e:
+            print(f"[WARNING] Failed to warm up services for user {record.user_id}: {type(e).__name__}: {e}")
+    return warmed
+
+
 def get_google_calendar_service(user_id: str, db: Session):
     """Google Calendar APIサービスを取得"""
     creds = get_google_credentials(user_id, db)
@@ -92,12 +374,31 @@ def get_google_calendar_service(user_id: str, db: Session):
         return None
     
     try:
-        return build('calendar', 'v3', credentials=creds)
+        return (_take_prebuilt_service('calendar', user_id, creds)
+                or _build_service('calendar', 'v3', creds, GOOGLE_CALENDAR_API_ENDPOINT))
     except Exception as e:
         print(f"[ERROR] Failed to build Google Calendar service for user {user_id}: {type(e).__name__}: {e}")
         return None
 
 
+def new_batch_request(service, api: str, callback=None):
+    """サービスのバッチリクエストを作成する
+
+    エンドポイントが上書きされている場合は、ディスカバリードキュメントのrootUrlではなく
+    上書き先の配下のbatchに送る。callbackは(request_id, response, exception)で呼ばれる。
+    """
+    api_endpoint = GOOGLE_TASKS_API_ENDPOINT if api == 'tasks' else GOOGLE_CALENDAR_API_ENDPOINT
+    if api_endpoint:
+        batch_uri = api_endpoint.rstrip('/') + '/batch'
+    else:
+        batch_uri = _batch_uris.get(api)
+        if batch_uri is None:
+            # サービスのnew_batch_http_request()と同じく、ディスカバリードキュメントのrootUrlとbatchPathから作る
+            root = json.loads(_get_discovery_document(api, 'v1' if api == 'tasks' else 'v3'))
+            batch_uri = _batch_uris[api] = root['rootUrl'] + root.get('batchPath', 'batch')
+    return _limited_request_class('BatchHttpRequest')(callback=callback, batch_uri=batch_uri)
+
+
 def get_google_tasks_service(user_id: str, db: Session):
     """Google Tasks APIサービスを取得"""
     creds = get_google_credentials(user_id, db)
@@ -106,7 +407,30 @@ def get_google_tasks_service(user_id: str, db: Session):
         return None
     
     try:
-        return build('tasks', 'v1', credentials=creds)
+        return (_take_prebuilt_service('tasks', user_id, creds)
+                or _build_service('tasks', 'v1', creds, GOOGLE_TASKS_API_ENDPOINT))
     except Exception as e:
         print(f"[ERROR] Failed to build Google Tasks service for user {user_id}: {type(e).__name__}: {e}")
         return None
+
+
+def get_google_services(user_id: str, db: Session) -> Tuple[Optional[object], Optional[object]]:
+    """1回のクレデンシャルの読み込みでGoogle TasksとGoogle Calendarのサービスを取得する
+
+    2つのサービスはそれぞれ別のHTTP接続を持つので、別々のスレッドから同時に使える
+    （1つのサービスを複数のスレッドで共有してはいけない）。取得できない場合は(None, None)を返す。
+    """
+    creds = get_google_credentials(user_id, db)
+    if not creds:
+        print(f"[WARNING] No valid credentials found for user {user_id}")
+        return None, None
+
+    try:
+        tasks_service = (_take_prebuilt_service('tasks', user_id, creds)
+                         or _build_service('tasks', 'v1', creds, GOOGLE_TASKS_API_ENDPOINT))
+        calendar_service = (_take_prebuilt_service('calendar', user_id, creds)
+                            or _build_service('calendar', 'v3', creds, GOOGLE_CALENDAR_API_ENDPOINT))
+    except Exception as e:
+        print(f"[ERROR] Failed to build Google services for user {user_id}: {type(e).__name__}: {e}")
+        return None, None
+    return tasks_service, calendar_service
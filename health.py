@@ -0,0 +1,184 @@
+from typing import List, Dict, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+
+import metrics
+from models import engine, get_db
+from admission import tool_call_limiter, upstream_limiter
+from outbox import outbox_status
+
+
+# この割合以上のDB接続が使用中の場合は準備未完了とする
+READY_MAX_DB_POOL_USAGE = float(os.getenv("READY_MAX_DB_POOL_USAGE", 0.9))
+# 受付制限の待ち行列がこの割合以上埋まっている場合は準備未完了とする
+READY_MAX_QUEUE_USAGE = float(os.getenv("READY_MAX_QUEUE_USAGE", 0.8))
+# イベントループの遅延（直近の最大値、秒）がこれ以上の場合は準備未完了とする
+READY_MAX_LOOP_LAG_SECONDS = float(os.getenv("READY_MAX_LOOP_LAG_SECONDS", 0.5))
+# このプロセスでアウトボックスのワーカーが動いている場合、送信の遅れがこれ以上なら準備未完了とする
+READY_MAX_OUTBOX_LAG_SECONDS = float(os.getenv("READY_MAX_OUTBOX_LAG_SECONDS", 300))
+# DBを使う項目の確認を待つ時間の上限（秒）
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", 2))
+
+# DBを使う確認は専用のスレッドで行う（ツール呼び出しでスレッドプールが埋まっていても応答できるようにする）
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='health')
+
+
+class LoopLagMonitor:
+    """一定間隔でスリープし、予定より遅れて再開した時間をイベントループの遅延として記録する"""
+
+    def __init__(self, interval: float = 0.25, window_seconds: float = 60):
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self._samples: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        """実行中のイベントループで計測を開始する（開始済みの場合は何もしない）"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._samples.clear()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self._samples.append((now, max(0.0, now - expected)))
+            while self._samples and self._samples[0][0] < now - self.window_seconds:
+                self._samples.popleft()
+
+    def snapshot(self) -> Dict:
+        samples = [lag for _, lag in self._samples]
+        return {
+            'last_seconds': round(samples[-1], 4) if samples else None,
+            'max_seconds': round(max(samples), 4) if samples else None,
+            'samples': len(samples),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def _db_pool() -> Dict:
+    """models.engineのコネクションプールの使用状況"""
+    pool = engine.pool
+    report = {'class': type(pool).__name__}
+    if not hasattr(pool, 'checkedout'):
+        return report
+    capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+    checked_out = pool.checkedout()
+    report.update({
+        'size': pool.size(),
+        'capacity': capacity,
+        'checked_out': checked_out,
+        'overflow': max(pool.overflow(), 0),
+        'usage': round(checked_out / capacity, 3) if capacity > 0 else None,
+    })
+    return report
+
+
+def _cache_hit_ratios() -> Dict:
+    counters = metrics.snapshot()['counters']
+    report = {}
+    for name, counter in (('events', 'event_cache_requests'), ('todos', 'todo_cache_requests')):
+        requests = counters.get(counter, {})
+        total = sum(requests.values())
+        report[name] = {
+            'requests': total,
+            'hit_ratio': round(requests.get('hit', 0) / total, 3) if total else None,
+        }
+        if 'partial' in requests:
+            report[name]['partial_ratio'] = round(requests['partial'] / total, 3)
+    return report
+
+
+def _limiters() -> Dict:
+    """受付制限の状態（上限に達している場合はsaturated、待ち行列が一杯の場合はshedding）"""
+    counters = metrics.snapshot()['counters']
+    report = {}
+    for limiter in (tool_call_limiter, upstream_limiter):
+        if limiter.max_queue and limiter.queued >= limiter.max_queue:
+            state = 'shedding'
+        elif limiter.in_flight >= limiter.max_concurrency:
+            state = 'saturated'
+        else:
+            state = 'ok'
+        report[limiter.name] = {
+            'state': state,
+            'in_flight': limiter.in_flight,
+            'max_in_flight': limiter.max_concurrency,
+            'queued': limiter.queued,
+            'max_queued': limiter.max_queue,
+            'rejected': counters.get(f'{limiter.name}_rejected', {}),
+        }
+    return report
+
+
+def _outbox() -> Dict:
+    db = next(get_db())
+    try:
+        return outbox_status(db)
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+async def collect_health() -> Dict:
+    """ヘルスチェックの項目を集める（DBを使う項目は専用スレッドで時間の上限つきで確認する）"""
+    loop_lag_monitor.ensure_started()
+    gauges = metrics.snapshot()['gauges']
+    started = time.perf_counter()
+    try:
+        outbox = await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(_executor, _outbox), HEALTH_CHECK_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        outbox = {'error': 'timeout'}
+    except Exception as e:
+        outbox = {'error': f"{type(e).__name__}: {e}"}
+    return {
+        'db_pool': _db_pool(),
+        'db_check_ms': round((time.perf_counter() - started) * 1000, 1),
+        'caches': _cache_hit_ratios(),
+        'limiters': _limiters(),
+        'workers': {
+            'outbox': outbox,
+            'prefetch_pending': gauges.get('prefetch_pending', 0),
+            'calendar_resync_pending': gauges.get('calendar_resync_pending', 0),
+        },
+        'event_loop_lag': loop_lag_monitor.snapshot(),
+    }
+
+
+def degraded_reasons(report: Dict) -> List[str]:
+    """ヘルスチェックの結果から、トラフィックを他のワーカーに回すべき理由を返す（空なら正常）"""
+    reasons = []
+    usage = report['db_pool'].get('usage')
+    if usage is not None and usage >= READY_MAX_DB_POOL_USAGE:
+        reasons.append(f"db_pool usage {usage:.0%}")
+    for name, limiter in report['limiters'].items():
+        if limiter['max_queued'] and limiter['queued'] >= limiter['max_queued'] * READY_MAX_QUEUE_USAGE:
+            reasons.append(f"{name} queue {limiter['queued']}/{limiter['max_queued']}")
+    max_lag = report['event_loop_lag']['max_seconds']
+    if max_lag is not None and max_lag >= READY_MAX_LOOP_LAG_SECONDS:
+        reasons.append(f"event loop lag {max_lag:.3f}s")
+    outbox = report['workers']['outbox']
+    if 'error' in outbox:
+        reasons.append(f"outbox check failed: {outbox['error']}")
+    elif outbox['worker_running'] and outbox['lag_seconds'] >= READY_MAX_OUTBOX_LAG_SECONDS:
+        reasons.append(f"outbox lag {outbox['lag_seconds']:.0f}s")
+    return reasons
+
+
+async def check_readiness() -> Tuple[bool, Dict]:
+    """準備完了かどうかと、理由を含むヘルスチェックの結果を返す"""
+    report = await collect_health()
+    reasons = degraded_reasons(report)
+    report['status'] = 'degraded' if reasons else 'ok'
+    report['reasons'] = reasons
+    return not reasons, report
@@ -0,0 +1,221 @@
+from typing import Dict, Callable, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+import time
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from models import get_db, IdempotencyKey
+
+
+# 冪等キーの有効期間（秒）。この期間内の同じキーの再実行は最初の結果を返す
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60))
+# メモリ上にキャッシュする冪等キーの数
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+# 実行中のまま結果が保存されない予約（プロセスが落ちた場合など）を引き継ぐまでの秒数
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 120))
+# 期限切れのキーをDBから削除する間隔（秒）
+IDEMPOTENCY_PURGE_INTERVAL = 600
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# (ユーザーID, キー) -> (有効期限, リクエストのハッシュ, 結果)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# 同じプロセスで実行中のキー（後から来た同じキーのリクエストは完了を待つ）
+_in_flight: Dict[tuple, threading.Event] = {}
+_in_flight_lock = threading.Lock()
+
+_last_purge = 0.0
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _request_hash(tool: str, arguments: Dict) -> str:
+    data = json.dumps({'tool': tool, 'arguments': arguments}, sort_keys=True, ensure_ascii=False, default=_json_default)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _is_error(result) -> bool:
+    return isinstance(result, dict) and 'error' in result
+
+
+def _cache_get(cache_key: tuple) -> Optional[tuple]:
+    with _cache_lock:
+        entry = _cache.get(cache_key)
+        if entry is None:
+            return None
+        if entry[0] <= datetime.now():
+            del _cache[cache_key]
+            return None
+        _cache.move_to_end(cache_key)
+        return entry
+
+
+def _cache_put(cache_key: tuple, expires_at: datetime, request_hash: str, result):
+    with _cache_lock:
+        _cache[cache_key] = (expires_at, request_hash, result)
+        _cache.move_to_end(cache_key)
+        while len(_cache) > IDEMPOTENCY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _purge_expired(db: Session):
+    """期限切れの冪等キーを定期的にDBから削除する"""
+    global _last_purge
+    if time.monotonic() - _last_purge < IDEMPOTENCY_PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= datetime.now()).delete(synchronize_session=False)
+    db.commit()
+
+
+def _reserve(user_id: str, key: str, tool: str, request_hash: str) -> Tuple[str, Optional[IdempotencyKey]]:
+    """キーを予約する。('reserved' | 'replay' | 'mismatch' | 'in_progress', 保存済みのレコード) を返す"""
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        _purge_expired(db)
+        for _ in range(2):
+            now = datetime.now()
+            record = db.query(IdempotencyKey).filter(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key
+            ).first()
+            if record is not None:
+                stale = record.result is None and record.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+                if record.expires_at > now and not stale:
+                    if record.request_hash != request_hash:
+                        return 'mismatch', None
+                    if record.result is None:
+                        return 'in_progress', None
+                    db.expunge(record)
+                    return 'replay', record
+                # 期限切れ、または実行中のまま放置された予約は引き継ぐ
+                db.delete(record)
+                db.flush()
+
+            db.add(IdempotencyKey(
+                user_id=user_id,
+                key=key,
+                tool=tool,
+                request_hash=request_hash,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            ))
+            try:
+                db.commit()
+                return 'reserved', None
+            except IntegrityError:
+                # 他のプロセスが同時に予約した場合は、その予約を読み直す
+                db.rollback()
+        return 'in_progress', None
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _complete(user_id: str, key: str, result) -> Optional[datetime]:
+    """予約したキーに結果を保存する（エラーの場合は予約を取り消して再実行できるようにする）"""
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        query = db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        if result is None or _is_error(result):
+            query.delete(synchronize_session=False)
+            db.commit()
+            return None
+        record = query.first()
+        if record is None:
+            return None
+        record.result = json.dumps(result, ensure_ascii=False, default=_json_default)
+        db.commit()
+        return record.expires_at
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[WARNING] Failed to store idempotency key for user {user_id}: {type(e).__name__}: {e}")
+        return None
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _run_reserved(user_id: str, key: str, tool: str, request_hash: str, func: Callable[[], Dict]) -> Dict:
+    cache_key = (user_id, key)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached[2] if cached[1] == request_hash else _mismatch_error(key)
+
+    try:
+        state, record = _reserve(user_id, key, tool, request_hash)
+    except SQLAlchemyError as e:
+        print(f"[ERROR] Idempotency check failed for user {user_id}: {type(e).__name__}: {e}")
+        return {"error": f"Idempotency check failed: {type(e).__name__}: {e}"}
+
+    if state == 'mismatch':
+        return _mismatch_error(key)
+    if state == 'in_progress':
+        return {
+            "error": "idempotency_key_in_progress",
+            "message": f"同じ冪等キー（{key}）のリクエストを処理中です。しばらくしてから再試行してください。"
+        }
+    if state == 'replay':
+        result = json.loads(record.result)
+        _cache_put(cache_key, record.expires_at, request_hash, result)
+        return result
+
+    result = None
+    try:
+        result = func()
+    finally:
+        # 例外やエラーの場合は予約を取り消す
+        expires_at = _complete(user_id, key, result)
+    if expires_at is not None:
+        _cache_put(cache_key, expires_at, request_hash, result)
+    return result
+
+
+def _mismatch_error(key: str) -> Dict:
+    return {
+        "error": "idempotency_key_reused",
+        "message": f"冪等キー（{key}）は異なる引数のリクエストで使用済みです。"
+    }
+
+
+def run_idempotent(user_id: str, idempotency_key: Optional[str], tool: str, arguments: Dict, func: Callable[[], Dict]) -> Dict:
+    """冪等キーを指定して処理を実行する
+
+    有効期間内に同じキーで再実行された場合は、funcを呼ばずに最初の結果を返す。
+    キーが指定されていない場合はそのままfuncを実行する。エラーの結果は保存しない。
+    """
+    if not idempotency_key:
+        return func()
+    if len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return {"error": f"idempotency_key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}
+
+    request_hash = _request_hash(tool, arguments)
+    cache_key = (user_id, idempotency_key)
+
+    # 同じプロセスで同じキーが同時に実行された場合は、先のリクエストの完了を待つ
+    while True:
+        with _in_flight_lock:
+            in_flight = _in_flight.get(cache_key)
+            if in_flight is None:
+                _in_flight[cache_key] = threading.Event()
+                break
+        in_flight.wait(IDEMPOTENCY_LOCK_SECONDS)
+
+    try:
+        return _run_reserved(user_id, idempotency_key, tool, request_hash, func)
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(cache_key).set()
@@ -1,23 +1,141 @@
+import time
+
+# 起動時間の計測（インポート時間を含めるため最初に記録する）
+_startup_started = time.perf_counter()
+
 from fastmcp.server import FastMCP
+from fastmcp.server.middleware import Middleware
+from fastmcp.exceptions import ToolError, ResourceError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
 import sys
 import os
+import threading
+import hmac
 
 # Import service modules
-from todo_service import add_todo, get_all_todos, get_todo, update_todo_status
-from event_service import add_event, get_event, get_all_events
+from models import get_db
+from google_api import warm_up_services
+from todo_service import add_todo, get_all_todos, get_todo, update_todo_status, stream_todos
+from event_service import add_event, get_event, get_all_events, find_free_slots, stream_events
+from search import search
+from agenda_service import get_agenda
+from delta_service import get_todos_changed_since, get_events_changed_since
+from outbox import enqueue_add_todo, enqueue_add_event, get_outbox_operation, start_outbox_worker
+from idempotency import run_idempotent
+from calendar_watch import (
+    watch_calendar, stop_watching_calendar, handle_notification, start_channel_renewal, add_invalidation_listener,
+    CALENDAR_WEBHOOK_URL
+)
+from event_cache import event_window_cache
+from todo_cache import todo_list_cache
+from resource_updates import resource_subscriptions, TODOS_URI, EVENTS_URI
+from recorder import record_tool_call
+from coalesce import coalesce_calls
+from prefetch import observe_tool_calls
+import profiler
+from profiler import profile_tool_calls, PROFILE_ADMIN_TOKEN
+from admission import tool_call_limiter, OverloadedError
+from health import check_readiness
+import metrics
+
+# 起動時間の内訳（ミリ秒）
+startup_timing = {'import_ms': round((time.perf_counter() - _startup_started) * 1000, 1)}
 
 # Create an MCP server
 mcp = FastMCP("Todo")
 
 
+class AdmissionMiddleware(Middleware):
+    """同時に実行するツール呼び出しの数を制限するミドルウェア
+
+    スレッドプールに渡す前にイベントループ上で枠を待つので、Googleの遅延時にも待ち行列の長さと待ち時間が上限を超えない。
+    上限を超えた呼び出しにはすぐにoverloadedのエラーを返す。
+    """
+
+    async def on_call_tool(self, context, call_next):
+        try:
+            await tool_call_limiter.acquire_async()
+        except OverloadedError as e:
+            print(f"[WARNING] Rejected tool call {context.message.name}: {e}")
+            raise ToolError(str(e))
+        try:
+            return await call_next(context)
+        finally:
+            tool_call_limiter.release()
+
+
+mcp.add_middleware(AdmissionMiddleware())
+
+
+def _invalidate_event_cache(user_id: str, calendar_id: str):
+    # get_all_eventsはprimaryカレンダーのみをキャッシュする
+    if calendar_id == 'primary':
+        event_window_cache.invalidate(user_id)
+
+
+add_invalidation_listener(_invalidate_event_cache)
+
+# TODO/イベントの変更（キャッシュの破棄）をtodos:// / events://リソースの購読者に通知する
+resource_subscriptions.install(mcp._mcp_server)
+todo_list_cache.add_invalidation_listener(lambda user_id: resource_subscriptions.notify_user_changed(user_id, 'todos'))
+event_window_cache.add_invalidation_listener(lambda user_id: resource_subscriptions.notify_user_changed(user_id, 'events'))
+
+
+def tool(coalesce: bool = False):
+    """共通のラッパー（呼び出し記録など）を適用してMCPツールとして登録するデコレーター
+
+    coalesce=Trueの場合、同じ引数で同時に実行された呼び出しをまとめて1回だけ実行する（読み取り専用のツール用）。
+    PREFETCH_ENABLED=1の場合は呼び出しを監視し、次に呼ばれそうな読み取りを先読みする。
+    PROFILE_TOOLSに含まれるツールは、一定の割合の呼び出しをプロファイルする（集約された呼び出しは実行した1回だけ）。
+    """
+    def decorator(func):
+        func = profile_tool_calls(func)
+        if coalesce:
+            func = coalesce_calls(func)
+        return mcp.tool()(record_tool_call(observe_tool_calls(func)))
+    return decorator
+
+
 @mcp.resource("echo://{message}")
 def echo_resource(message: str) -> str:
     """Echo a message as a resource"""
     return f"Resource echo: {message}"
 
 
+def _resource_json(items: List[Dict]) -> str:
+    # エラーの場合はツールと同じ内容をリソースのエラーとして返す
+    if items and 'error' in items[0]:
+        raise ResourceError(items[0].get('message') or items[0]['error'])
+    return json.dumps(items, ensure_ascii=False, default=str)
+
+
+@mcp.resource(TODOS_URI, mime_type="application/json")
+def todos_resource(user_id: str) -> str:
+    """ユーザーの全てのTODO（JSON）
+
+    購読すると、TODOが変更されたとき（ツールでの追加・更新、アウトボックスの送信、差分の取得など）にresources/updatedを通知する。
+    """
+    return _resource_json(get_all_todos(user_id))
+
+
+@mcp.resource(EVENTS_URI, mime_type="application/json")
+def events_resource(user_id: str, date: str) -> str:
+    """ユーザーの指定日（YYYY-MM-DD、Asia/Tokyo）のイベント（JSON）
+
+    購読すると、イベントが変更されたとき（ツールでの追加、カレンダーのプッシュ通知、差分の取得など）にresources/updatedを通知する。
+    """
+    try:
+        start = datetime.fromisoformat(date)
+    except ValueError:
+        raise ResourceError(f"Invalid date: {date} (expected YYYY-MM-DD)")
+    return _resource_json(get_all_events(user_id, start, start + timedelta(days=1)))
+
+
 @mcp.tool()
 def echo_tool(message: str) -> str:
     """Echo a message as a tool"""
@@ -31,36 +149,64 @@ def echo_prompt(message: str) -> str:
 
 
 # TODO関連のエンドポイント
-@mcp.tool()
-def add_todo_endpoint(user_id: str, title: str, description: str = None) -> Dict:
+@tool()
+def add_todo_endpoint(user_id: str, title: str, description: str = None, async_write: bool = False, idempotency_key: Optional[str] = None) -> Dict:
     """Google TasksにTODOアイテムを追加する
     
     Args:
         user_id: ユーザーID
         title: TODOのタイトル
         description: TODOの詳細説明（オプション）
+        async_write: Trueの場合、Googleへの送信を待たずに受け付けて後からバックグラウンドで送信する
+        idempotency_key: 冪等キー（オプション）。タイムアウト後の再試行などで同じキーを指定すると、
+            TODOを重複して作成せずに最初の結果を返す
         
     Returns:
-        追加されたTODOアイテム
+        追加されたTODOアイテム（async_writeの場合はoutbox_で始まるIDの受付結果）
     """
-    return add_todo(user_id, title, description)
+    def run():
+        if async_write:
+            return enqueue_add_todo(user_id, title, description)
+        return add_todo(user_id, title, description)
 
+    arguments = {'title': title, 'description': description, 'async_write': async_write}
+    return run_idempotent(user_id, idempotency_key, 'add_todo', arguments, run)
 
-@mcp.tool()
-def get_all_todos_endpoint(user_id: str, filter_status: str = "all") -> List[Dict]:
+
+@tool(coalesce=True)
+def get_all_todos_endpoint(user_id: str, filter_status: str = "all", compact: bool = False) -> List[Dict]:
     """ユーザーの全てのTODOアイテムをGoogle Tasksから取得する
     
     Args:
         user_id: ユーザーID
         filter_status: フィルターオプション。'completed'または'active'を指定可能
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
     
     Returns:
         TODOアイテムのリスト
     """
-    return get_all_todos(user_id, filter_status)
+    return get_all_todos(user_id, filter_status, compact)
 
 
-@mcp.tool()
+@tool()
+def stream_todos_endpoint(user_id: str, filter_status: str = "all", cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """TODOアイテムの大きな一覧をページごとに取得する（1回の応答はSTREAM_MAX_RESPONSE_BYTESまで）
+
+    ページを取得するたびに進捗を通知する。next_cursorがnullになるまで、cursorに前回のnext_cursorを渡して呼び出す。
+
+    Args:
+        user_id: ユーザーID
+        filter_status: フィルターオプション。'completed'または'active'を指定可能
+        cursor: 前回の呼び出しで返されたnext_cursor（最初の呼び出しでは省略）
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
+
+    Returns:
+        items（TODOアイテムのリスト）とnext_cursor（続きがない場合はnull）を含む辞書
+    """
+    return stream_todos(user_id, filter_status, cursor, compact)
+
+
+@tool(coalesce=True)
 def get_todo_endpoint(user_id: str, todo_id: str) -> Dict:
     """指定されたIDのTODOアイテムを取得する
     
@@ -74,7 +220,7 @@ def get_todo_endpoint(user_id: str, todo_id: str) -> Dict:
     return get_todo(user_id, todo_id)
 
 
-@mcp.tool()
+@tool()
 def update_todo_status_endpoint(user_id: str, todo_id: str, completed: bool) -> Dict:
     """TODOの完了状態を更新する
     
@@ -90,7 +236,7 @@ def update_todo_status_endpoint(user_id: str, todo_id: str, completed: bool) ->
 
 
 # イベント関連のエンドポイント
-@mcp.tool()
+@tool()
 def add_event_endpoint(
     user_id: str, 
     title: str, 
@@ -98,7 +244,9 @@ def add_event_endpoint(
     end_time: str | None = None,
     description: str | None = None, 
     location: str | None = None, 
-    sync_to_google: bool = True
+    sync_to_google: bool = True,
+    async_write: bool = False,
+    idempotency_key: str | None = None
 ) -> Dict:
     """カレンダーイベントを追加する
     
@@ -110,19 +258,32 @@ def add_event_endpoint(
         description: イベントの詳細説明（オプション）
         location: 場所（オプション）
         sync_to_google: Google CalendarAPIとの同期を行うかどうか
+        async_write: Trueの場合、Googleへの送信を待たずに受け付けて後からバックグラウンドで送信する
+        idempotency_key: 冪等キー（オプション）。タイムアウト後の再試行などで同じキーを指定すると、
+            イベントを重複して作成せずに最初の結果を返す
         
     Returns:
-        追加されたイベントアイテム
+        追加されたイベントアイテム（async_writeの場合はoutbox_で始まるIDの受付結果）
     """
     # Convert string datetimes to datetime objects
     start_dt = datetime.fromisoformat(start_time)
     end_dt = None
     if end_time:
         end_dt = datetime.fromisoformat(end_time)
-    return add_event(user_id, title, start_dt, end_dt, description, location, sync_to_google)
 
+    def run():
+        if async_write:
+            return enqueue_add_event(user_id, title, start_dt, end_dt, description, location)
+        return add_event(user_id, title, start_dt, end_dt, description, location, sync_to_google)
 
-@mcp.tool()
+    arguments = {
+        'title': title, 'start_time': start_time, 'end_time': end_time, 'description': description,
+        'location': location, 'sync_to_google': sync_to_google, 'async_write': async_write
+    }
+    return run_idempotent(user_id, idempotency_key, 'add_event', arguments, run)
+
+
+@tool(coalesce=True)
 def get_event_endpoint(user_id: str, event_id: str) -> Dict:
     """指定されたIDのイベントアイテムをGoogle Calendarから取得する
 
@@ -136,8 +297,8 @@ def get_event_endpoint(user_id: str, event_id: str) -> Dict:
     return get_event(user_id, event_id)
 
 
-@mcp.tool()
-def get_all_events_endpoint(user_id: str, start_date: str, end_date: Optional[str] = None, include_google_calendar: bool = True) -> List[Dict]:
+@tool(coalesce=True)
+def get_all_events_endpoint(user_id: str, start_date: str, end_date: Optional[str] = None, include_google_calendar: bool = True, compact: bool = False) -> List[Dict]:
     """ユーザーの全てのイベントアイテムを取得する
     
     Args:
@@ -145,6 +306,7 @@ def get_all_events_endpoint(user_id: str, start_date: str, end_date: Optional[st
         start_date: この日時以降のイベントをフィルター (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
         end_date: この日時以前のイベントをフィルター (ISO形式文字列: YYYY-MM-DDTHH:MM:SS, オプション)
         include_google_calendar: Google Calendarからのイベントも含めるかどうか
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
     
     Returns:
         イベントアイテムのリスト
@@ -152,12 +314,285 @@ def get_all_events_endpoint(user_id: str, start_date: str, end_date: Optional[st
     # Convert string datetimes to datetime objects
     start_dt = datetime.fromisoformat(start_date)
     end_dt = datetime.fromisoformat(end_date) if end_date else None
-    return get_all_events(user_id, start_dt, end_dt, include_google_calendar)
+    return get_all_events(user_id, start_dt, end_dt, include_google_calendar, compact)
+
+
+@tool()
+def stream_events_endpoint(user_id: str, start_date: str, end_date: Optional[str] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """期間のイベントを件数の上限なしにページごとに取得する（1回の応答はSTREAM_MAX_RESPONSE_BYTESまで）
+
+    ページを取得するたびに進捗を通知する。next_cursorがnullになるまで、同じ期間とcursorに前回のnext_cursorを渡して呼び出す。
+
+    Args:
+        user_id: ユーザーID
+        start_date: この日時以降のイベントを取得 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
+        end_date: この日時以前のイベントを取得 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS, オプション)
+        cursor: 前回の呼び出しで返されたnext_cursor（最初の呼び出しでは省略）
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
+
+    Returns:
+        items（イベントアイテムのリスト）とnext_cursor（続きがない場合はnull）を含む辞書
+    """
+    start_dt = datetime.fromisoformat(start_date)
+    end_dt = datetime.fromisoformat(end_date) if end_date else None
+    return stream_events(user_id, start_dt, end_dt, cursor, compact)
+
+
+@tool()
+def get_todos_changed_since_endpoint(user_id: str, since: Optional[str] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """指定日時以降に作成・更新・削除されたTODOだけを取得する（定期的な確認で全件を取得し直さないために使う）
+
+    Args:
+        user_id: ユーザーID
+        since: この日時以降の変更を取得 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)。cursorを指定する場合は省略
+        cursor: 前回の呼び出しで返されたcursor（sinceより優先）
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
+
+    Returns:
+        changed（作成・更新されたTODO）、deleted（削除されたTODOのID）、cursor（次の呼び出しに渡す）を含む辞書
+    """
+    since_dt = datetime.fromisoformat(since) if since else None
+    return get_todos_changed_since(user_id, since_dt, cursor, compact)
+
+
+@tool()
+def get_events_changed_since_endpoint(user_id: str, since: Optional[str] = None, cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """指定日時以降に作成・更新・削除されたイベントだけを取得する（定期的な確認で全件を取得し直さないために使う）
+
+    Args:
+        user_id: ユーザーID
+        since: この日時以降の変更を取得 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)。cursorを指定する場合は省略
+        cursor: 前回の呼び出しで返されたcursor（sinceより優先）
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
+
+    Returns:
+        changed（作成・更新されたイベント）、deleted（削除されたイベントのID）、cursor（次の呼び出しに渡す）を含む辞書
+    """
+    since_dt = datetime.fromisoformat(since) if since else None
+    return get_events_changed_since(user_id, since_dt, cursor, compact)
+
+
+@tool(coalesce=True)
+def find_free_slots_endpoint(
+    user_id: str,
+    start_date: str,
+    end_date: str,
+    min_duration_minutes: int = 30,
+    working_hours_start: str = "09:00",
+    working_hours_end: str = "18:00",
+    include_weekends: bool = False,
+    calendar_ids: Optional[List[str]] = None
+) -> List[Dict]:
+    """指定期間の空き時間を取得する（勤務時間内で最小時間以上の区間）
+    
+    Args:
+        user_id: ユーザーID
+        start_date: 検索開始日時 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
+        end_date: 検索終了日時 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
+        min_duration_minutes: 空き時間として扱う最小の長さ（分）
+        working_hours_start: 勤務開始時刻 (HH:MM, Asia/Tokyo)
+        working_hours_end: 勤務終了時刻 (HH:MM, Asia/Tokyo)
+        include_weekends: 土日も含めるかどうか
+        calendar_ids: 予定を確認するカレンダーIDのリスト（省略時はprimary）
+    
+    Returns:
+        空き時間（start_time, end_time, duration_minutes）のリスト
+    """
+    start_dt = datetime.fromisoformat(start_date)
+    end_dt = datetime.fromisoformat(end_date)
+    return find_free_slots(
+        user_id, start_dt, end_dt, min_duration_minutes,
+        working_hours_start, working_hours_end, include_weekends, calendar_ids
+    )
+
+
+@tool(coalesce=True)
+def get_agenda_endpoint(user_id: str, start_date: str, end_date: str, compact: bool = False) -> Dict:
+    """指定期間のイベントと期限のある未完了のTODOを時刻順にまとめたアジェンダを取得する
+
+    get_all_todos_endpointとget_all_events_endpointを別々に呼ぶ代わりに、1回の呼び出しで両方を同時に取得する。
+
+    Args:
+        user_id: ユーザーID
+        start_date: 期間の開始日時 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
+        end_date: 期間の終了日時 (ISO形式文字列: YYYY-MM-DDTHH:MM:SS)
+        compact: Trueの場合、空のフィールドを除き長い説明文を切り詰めて返す
+
+    Returns:
+        items（typeが'event'または'todo'の項目を時刻順に並べたリスト。TODOは期限日の先頭に置く。最大AGENDA_MAX_ITEMS件）、
+        truncated（itemsを上限で切り詰めた場合はTrue）と undated_todos（期限のない未完了のTODO）
+    """
+    start_dt = datetime.fromisoformat(start_date)
+    end_dt = datetime.fromisoformat(end_date)
+    return get_agenda(user_id, start_dt, end_dt, compact)
+
+
+@tool(coalesce=True)
+def search_endpoint(user_id: str, query: str, item_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """同期済みのTODOとイベントをタイトル・説明・場所で全文検索する
+    
+    TODO/イベントの一覧取得や追加で同期されたデータが検索対象になる。
+    
+    Args:
+        user_id: ユーザーID
+        query: 検索語（空白区切りで複数指定するとAND検索）
+        item_type: 'todo'または'event'で対象を絞り込む（オプション）
+        limit: 返す件数の上限
+    
+    Returns:
+        関連度の高い順に並んだ検索結果のリスト
+    """
+    return search(user_id, query, item_type, limit)
+
+
+@tool()
+def get_outbox_operation_endpoint(user_id: str, outbox_id: str) -> Dict:
+    """async_writeで受け付けた書き込みの送信状況を取得する
+    
+    Args:
+        user_id: ユーザーID
+        outbox_id: 受付結果のID（outbox_で始まるID）
+    
+    Returns:
+        送信状況（status: pending/processing/done/failed）と、送信済みの場合は作成されたTODO/イベント
+    """
+    return get_outbox_operation(user_id, outbox_id)
+
+
+@tool()
+def watch_calendar_endpoint(user_id: str, calendar_id: str = "primary") -> Dict:
+    """Google Calendarの変更のプッシュ通知の受信を開始する
+    
+    変更の通知を受けると、イベントを差分同期して検索インデックスなどに反映する。
+    チャンネルは期限切れの前に自動で更新される。
+    
+    Args:
+        user_id: ユーザーID
+        calendar_id: 監視するカレンダーID（省略時はprimary）
+    
+    Returns:
+        作成したチャンネルの情報（channel_id, expiration）
+    """
+    return watch_calendar(user_id, calendar_id)
+
+
+@tool()
+def stop_watching_calendar_endpoint(user_id: str, calendar_id: str = "primary") -> Dict:
+    """Google Calendarの変更のプッシュ通知の受信を停止する
+    
+    Args:
+        user_id: ユーザーID
+        calendar_id: 監視を停止するカレンダーID（省略時はprimary）
+    
+    Returns:
+        停止したチャンネルの数
+    """
+    return stop_watching_calendar(user_id, calendar_id)
+
+
+def profiling_admin_endpoint(
+    admin_token: str,
+    action: str = "status",
+    tools: Optional[List[str]] = None,
+    sample_rate: Optional[float] = None,
+    top_n: int = 20,
+    tool_name: Optional[str] = None,
+    sort_by: str = "cumulative"
+) -> Dict:
+    """
+    ツール呼び出しのプロファイルを管理する（PROFILE_ADMIN_TOKENが設定されている場合のみ登録される管理用ツール）
+
+    Args:
+        admin_token: 管理用トークン（PROFILE_ADMIN_TOKEN）
+        action: "status"（現在の設定）、"start"（プロファイルの開始・設定の変更）、"stop"（停止）、"top"（時間のかかっている関数）、"reset"（集計の破棄）
+        tools: startの場合にプロファイルするツール名のリスト（"*"は全てのツール）
+        sample_rate: startの場合にプロファイルする呼び出しの割合（0〜1）
+        top_n: topの場合に返す関数の数
+        tool_name: topの場合に対象とするツール名（省略時は全ツールの合計）
+        sort_by: topの並び順（"cumulative"は呼び出し先を含む累積時間、"total"は関数自体の実行時間）
+
+    Returns:
+        現在の設定、またはtopの場合は時間のかかっている関数の一覧
+    """
+    if not PROFILE_ADMIN_TOKEN or not hmac.compare_digest(str(admin_token), PROFILE_ADMIN_TOKEN):
+        return {"error": "forbidden"}
+    if action == "start":
+        profiler.configure(tools if tools is not None else ["*"], sample_rate)
+    elif action == "stop":
+        profiler.configure([])
+    elif action == "reset":
+        profiler.reset()
+    elif action == "top":
+        return {"tool": tool_name, "functions": profiler.top_functions(tool_name, top_n, sort_by)}
+    elif action != "status":
+        return {"error": f"Unknown action: {action}"}
+    return profiler.status()
+
+
+# 管理用トークンが設定されている場合のみ、プロファイルの管理用ツールを公開する
+if PROFILE_ADMIN_TOKEN:
+    mcp.tool()(profiling_admin_endpoint)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> Response:
+    """サーバー内部のメトリクス（カウンターとゲージ）をJSONで返す"""
+    return JSONResponse(metrics.snapshot())
+
+
+@mcp.custom_route("/healthz", methods=["GET"])
+async def healthz(request: Request) -> Response:
+    """プロセスが応答できるかどうか（常に200）と、DBプール・キャッシュ・受付制限・ワーカー・イベントループの状態を返す"""
+    _, report = await check_readiness()
+    return JSONResponse(report)
+
+
+@mcp.custom_route("/readyz", methods=["GET"])
+async def readyz(request: Request) -> Response:
+    """トラフィックを受けられる場合は200、劣化している場合は理由とともに503を返す"""
+    ready, report = await check_readiness()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+
+@mcp.custom_route("/webhooks/calendar", methods=["POST"])
+async def calendar_webhook(request: Request) -> Response:
+    """Google Calendarのプッシュ通知（events().watch）を受け取る"""
+    status = await run_in_threadpool(handle_notification, dict(request.headers))
+    return Response(status_code=status)
+
+
+def run_warmup():
+    """起動直後のウォームアップ（重いモジュールの読み込みと最近のユーザーのサービス作成）"""
+    started = time.perf_counter()
+    db = next(get_db())
+    try:
+        warmed = warm_up_services(db, int(os.environ.get("WARMUP_RECENT_USERS", 10)))
+    except Exception as e:
+        print(f"[WARNING] Warm-up failed: {type(e).__name__}: {e}", file=sys.stderr)
+        warmed = []
+    finally:
+        db.close()
+    startup_timing['warmup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    startup_timing['warmup_users'] = len(warmed)
+    print(f"[startup] warm-up: {startup_timing['warmup_ms']}ms ({len(warmed)} users)", file=sys.stderr)
 
 
 if __name__ == "__main__":
     # Initialize and run the server
     print(f"Using Python: {sys.executable}", file=sys.stderr)
+    print(f"[startup] imports: {startup_timing['import_ms']}ms", file=sys.stderr)
+
+    # STARTUP_WARMUP=1の場合、サーバーの起動と並行してウォームアップを行う
+    if os.environ.get("STARTUP_WARMUP") == "1":
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+    # async_writeで受け付けた書き込みを送信するワーカー（別プロセスで動かす場合はOUTBOX_WORKER=0）
+    if os.environ.get("OUTBOX_WORKER", "1") != "0":
+        start_outbox_worker()
+
+    # カレンダーのプッシュ通知のチャンネルを期限切れ前に更新する
+    if CALENDAR_WEBHOOK_URL:
+        start_channel_renewal()
     
     port = int(os.environ.get("PORT", 8000))
     
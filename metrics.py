@@ -0,0 +1,40 @@
+from typing import Callable, Dict, Optional
+import threading
+
+
+# カウンター（名前 -> ラベル -> 値）と、参照時に値を計算するゲージ（名前 -> 関数）
+_counters: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, Callable[[], object]] = {}
+_lock = threading.Lock()
+
+
+def increment(name: str, label: Optional[str] = None, value: float = 1):
+    """カウンターを加算する（labelごとに集計する。省略時は'total'）"""
+    with _lock:
+        counter = _counters.setdefault(name, {})
+        key = label or 'total'
+        counter[key] = counter.get(key, 0) + value
+
+
+def register_gauge(name: str, func: Callable[[], object]):
+    """参照時にfuncを呼んで値を取得するゲージを登録する"""
+    _gauges[name] = func
+
+
+def snapshot() -> Dict:
+    """全てのカウンターとゲージの現在値を返す"""
+    with _lock:
+        counters = {name: dict(values) for name, values in _counters.items()}
+    gauges = {}
+    for name, func in list(_gauges.items()):
+        try:
+            gauges[name] = func()
+        except Exception as e:
+            gauges[name] = f"error: {type(e).__name__}: {e}"
+    return {'counters': counters, 'gauges': gauges}
+
+
+def reset():
+    """カウンターを初期化する（テスト用）"""
+    with _lock:
+        _counters.clear()
@@ -14,7 +14,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(current_dir))
 
 # モデルをインポート
-from models import Base, TodoItem, EventItem
+from models import Base
 
 # 環境変数の読み込み
 load_dotenv()
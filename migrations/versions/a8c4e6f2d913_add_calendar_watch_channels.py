@@ -0,0 +1,46 @@
+"""Add calendar watch channels table
+
+Revision ID: a8c4e6f2d913
+Revises: f7a3d9e1b256
+Create Date: 2025-06-14 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4e6f2d913'
+down_revision = 'f7a3d9e1b256'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('calendar_watch_channels',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=255), nullable=False),
+    sa.Column('calendar_id', sa.String(length=255), nullable=False),
+    sa.Column('channel_id', sa.String(length=64), nullable=False),
+    sa.Column('resource_id', sa.String(length=255), nullable=False),
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('expiration', sa.DateTime(), nullable=False),
+    sa.Column('sync_token', sa.Text(), nullable=True),
+    sa.Column('last_message_number', sa.Integer(), nullable=False),
+    sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_calendar_watch_channels_id'), 'calendar_watch_channels', ['id'], unique=False)
+    op.create_index(op.f('ix_calendar_watch_channels_user_id'), 'calendar_watch_channels', ['user_id'], unique=False)
+    op.create_index(op.f('ix_calendar_watch_channels_channel_id'), 'calendar_watch_channels', ['channel_id'], unique=True)
+    op.create_index(op.f('ix_calendar_watch_channels_expiration'), 'calendar_watch_channels', ['expiration'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_calendar_watch_channels_expiration'), table_name='calendar_watch_channels')
+    op.drop_index(op.f('ix_calendar_watch_channels_channel_id'), table_name='calendar_watch_channels')
+    op.drop_index(op.f('ix_calendar_watch_channels_user_id'), table_name='calendar_watch_channels')
+    op.drop_index(op.f('ix_calendar_watch_channels_id'), table_name='calendar_watch_channels')
+    op.drop_table('calendar_watch_channels')
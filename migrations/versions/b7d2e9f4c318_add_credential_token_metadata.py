@@ -0,0 +1,98 @@
+"""Add token expiry, scopes and revoked columns to credentials
+
+Revision ID: b7d2e9f4c318
+Revises: a8c4e6f2d913
+Create Date: 2025-06-15 10:00:00.000000
+
+"""
+from datetime import datetime
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e9f4c318'
+down_revision = 'a8c4e6f2d913'
+branch_labels = None
+depends_on = None
+
+# 既存の行のtoken_jsonから有効期限とスコープを埋める際に、1回に読み込む行数
+BACKFILL_BATCH_SIZE = 500
+
+
+def _token_metadata(token_json):
+    """token_json（Credentials.to_json()）から有効期限（naiveなUTC）とスコープ（スペース区切り）を取り出す"""
+    try:
+        token = json.loads(token_json)
+    except (TypeError, ValueError):
+        return None, None
+    expiry = None
+    if token.get('expiry'):
+        try:
+            expiry = datetime.fromisoformat(token['expiry'].rstrip('Z'))
+        except ValueError:
+            pass
+    scopes = token.get('scopes')
+    if isinstance(scopes, list):
+        scopes = ' '.join(scopes)
+    return expiry, scopes
+
+
+def _backfill():
+    connection = op.get_bind()
+    credentials = sa.table('credentials',
+        sa.column('id', sa.Integer()),
+        sa.column('token_json', sa.String()),
+        sa.column('expiry', sa.DateTime()),
+        sa.column('scopes', sa.Text()),
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(credentials.c.id, credentials.c.token_json)
+            .where(credentials.c.id > last_id)
+            .order_by(credentials.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            expiry, scopes = _token_metadata(row.token_json)
+            if expiry is not None or scopes is not None:
+                connection.execute(
+                    credentials.update().where(credentials.c.id == row.id).values(expiry=expiry, scopes=scopes)
+                )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    # credentialsテーブルはこれまでのマイグレーションでは作成していないため、ない場合はここで作成する
+    if not sa.inspect(op.get_bind()).has_table('credentials'):
+        op.create_table('credentials',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('token_json', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_credentials_id'), 'credentials', ['id'], unique=False)
+        op.create_index(op.f('ix_credentials_user_id'), 'credentials', ['user_id'], unique=True)
+
+    with op.batch_alter_table('credentials') as batch_op:
+        batch_op.add_column(sa.Column('expiry', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('scopes', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('revoked', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index('ix_credentials_revoked_expiry', 'credentials', ['revoked', 'expiry'], unique=False)
+
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_index('ix_credentials_revoked_expiry', table_name='credentials')
+    with op.batch_alter_table('credentials') as batch_op:
+        batch_op.drop_column('revoked')
+        batch_op.drop_column('scopes')
+        batch_op.drop_column('expiry')
@@ -0,0 +1,26 @@
+"""Add calendar_id to search documents
+
+Revision ID: c9f1a3e7d522
+Revises: b7d2e9f4c318
+Create Date: 2025-06-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f1a3e7d522'
+down_revision = 'b7d2e9f4c318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('search_documents', sa.Column('calendar_id', sa.String(length=255), nullable=True))
+    # 既存のイベントはメインカレンダーから同期したものとして扱う
+    op.execute("UPDATE search_documents SET calendar_id = 'primary' WHERE item_type = 'event'")
+
+
+def downgrade() -> None:
+    op.drop_column('search_documents', 'calendar_id')
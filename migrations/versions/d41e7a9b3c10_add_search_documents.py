@@ -0,0 +1,84 @@
+"""Add search documents table with full-text index
+
+Revision ID: d41e7a9b3c10
+Revises: c2345dc890ef
+Create Date: 2025-06-10 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41e7a9b3c10'
+down_revision = 'c2345dc890ef'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5(
+        title, description, location,
+        content='search_documents', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_documents_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO search_documents_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+]
+
+
+def upgrade() -> None:
+    op.create_table('search_documents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.String(length=255), nullable=False),
+    sa.Column('item_type', sa.String(length=16), nullable=False),
+    sa.Column('item_id', sa.String(length=255), nullable=False),
+    sa.Column('title', sa.Text(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('location', sa.Text(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'item_type', 'item_id', name='uq_search_documents_item')
+    )
+    op.create_index(op.f('ix_search_documents_id'), 'search_documents', ['id'], unique=False)
+    op.create_index(op.f('ix_search_documents_user_id'), 'search_documents', ['user_id'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # タイトル・説明・場所から自動生成されるtsvector列とGINインデックス
+        op.execute("""
+            ALTER TABLE search_documents ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(location, ''))
+            ) STORED
+        """)
+        op.execute("CREATE INDEX ix_search_documents_search_vector ON search_documents USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_search_documents_search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('search_documents_ai', 'search_documents_ad', 'search_documents_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS search_documents_fts")
+    op.drop_index(op.f('ix_search_documents_user_id'), table_name='search_documents')
+    op.drop_index(op.f('ix_search_documents_id'), table_name='search_documents')
+    op.drop_table('search_documents')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint, Index, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -16,19 +16,102 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# 読み取り専用のレプリカのURL（任意）。設定した場合、クレデンシャルの読み取りはレプリカに送る
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+
 # エンジンの作成
 engine = create_engine(DATABASE_URL or "sqlite:///./test.db")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# レプリカのエンジン（未設定の場合はNone）
+replica_engine = create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+
 Base = declarative_base()
 
 # Googleクレデンシャルのデータモデル
+# 有効期限・スコープ・失効フラグはtoken_jsonを読まずに判定・検索できるよう列にも保存する（google_api.pyで同期する）
 class GoogleCredentials(Base):
     __tablename__ = "credentials"
+    __table_args__ = (Index('ix_credentials_revoked_expiry', 'revoked', 'expiry'),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(255), nullable=False, unique=True, index=True)
     token_json = Column(String, nullable=False)  # Google OAuthのトークン情報をJSON文字列として保存
+    expiry = Column(DateTime, nullable=True)  # アクセストークンの有効期限（UTC）
+    scopes = Column(Text, nullable=True)  # 許可されたスコープ（スペース区切り）
+    revoked = Column(Boolean, nullable=False, default=False)  # 更新に失敗して再認証が必要になった
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# 検索用に同期したTODO/イベントのデータモデル
+# 全文検索インデックス（SQLiteはFTS5、PostgreSQLはtsvector + GIN）はsearch.pyとマイグレーションで管理する
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+    __table_args__ = (UniqueConstraint('user_id', 'item_type', 'item_id', name='uq_search_documents_item'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(255), nullable=False, index=True)
+    item_type = Column(String(16), nullable=False)  # 'todo' または 'event'
+    item_id = Column(String(255), nullable=False)  # GoogleのタスクID / イベントID
+    title = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    location = Column(Text, nullable=True)
+    start_time = Column(DateTime, nullable=True)  # UTC
+    completed = Column(Boolean, nullable=True)
+    calendar_id = Column(String(255), nullable=True)  # イベントを取得したカレンダーのID（TODOはNULL）
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Googleへの書き込みを後から送信するためのアウトボックスのデータモデル
+# ステータスは pending（送信待ち）→ processing（送信中）→ done（完了）/ failed（再試行の上限に到達）
+class OutboxOperation(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(255), nullable=False, index=True)
+    operation = Column(String(32), nullable=False)  # 'add_todo' または 'add_event'
+    payload = Column(Text, nullable=False)  # 操作の引数をJSON文字列として保存
+    status = Column(String(16), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.now)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # 送信後のTODO/イベントをJSON文字列として保存
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# 冪等キーと、そのキーで実行したツールの結果のデータモデル
+# resultがNULLの行は実行中（他のリクエストが予約済み）を表す
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(255), nullable=False)
+    key = Column(String(255), nullable=False)
+    tool = Column(String(64), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # 同じキーで異なる引数が使われていないかの確認用
+    result = Column(Text, nullable=True)  # ツールの結果をJSON文字列として保存
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# Google Calendarのプッシュ通知（events().watch）のチャンネルのデータモデル
+# sync_tokenは通知を受けたときの差分同期に使う
+class CalendarWatchChannel(Base):
+    __tablename__ = "calendar_watch_channels"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(255), nullable=False, index=True)
+    calendar_id = Column(String(255), nullable=False)
+    channel_id = Column(String(64), nullable=False, unique=True, index=True)
+    resource_id = Column(String(255), nullable=False)
+    token = Column(String(64), nullable=False)  # 通知が本物か確認するためのチャンネルごとの秘密値
+    expiration = Column(DateTime, nullable=False, index=True)
+    sync_token = Column(Text, nullable=True)
+    last_message_number = Column(Integer, nullable=False, default=0)
+    last_synced_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
@@ -39,3 +122,14 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# レプリカのセッションを取得する関数（レプリカが設定されていない場合はNoneを返す）
+def get_replica_db():
+    if ReplicaSessionLocal is None:
+        yield None
+        return
+    db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
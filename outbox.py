@@ -0,0 +1,365 @@
+from typing import List, Dict, Optional, Callable
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from sqlalchemy import and_, or_, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from models import get_db, OutboxOperation
+from google_api import (
+    get_google_tasks_service, get_google_calendar_service, new_batch_request,
+    AuthenticationRequiredException, GOOGLE_BATCH_LIMIT
+)
+from todo_service import _get_default_tasklist_id, _create_task_dict, TASK_FIELDS
+from event_service import _build_event_body, _create_event_dict, EVENT_FIELDS
+from search import index_items
+from event_cache import event_window_cache
+from todo_cache import todo_list_cache
+
+
+# 1回の送信でアウトボックスから取り出す操作の数
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+# 再試行の上限（これを超えた操作はfailedにする）
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 12))
+# 再試行の間隔（指数バックオフの初期値と上限、秒）
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 5))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 900))
+# 送信中のままこの秒数が経過した操作は、ワーカーが落ちたものとみなして再送する
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+# ワーカーがアウトボックスを確認する間隔（秒）
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2))
+
+# 再試行しても成功しないHTTPステータス（リクエスト内容の誤りなど）
+_PERMANENT_HTTP_STATUSES = {400, 404, 410}
+
+# 同じプロセスで操作が追加されたらワーカーをすぐに起こす
+_wake_worker = threading.Event()
+# このプロセスのワーカーが最後にアウトボックスを確認した時刻（monotonic）。ワーカーが動いていない場合はNone
+_last_polled_at: Optional[float] = None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _operation_dict(operation: OutboxOperation) -> Dict:
+    """アウトボックスの操作をツールの結果として返す辞書に変換する"""
+    return {
+        'id': f"outbox_{operation.id}",
+        'user_id': operation.user_id,
+        'operation': operation.operation,
+        'status': operation.status,
+        'attempts': operation.attempts,
+        'last_error': operation.last_error,
+        'request': json.loads(operation.payload),
+        'result': json.loads(operation.result) if operation.result else None,
+        'created_at': operation.created_at,
+        'updated_at': operation.updated_at,
+    }
+
+
+def _enqueue(user_id: str, operation: str, payload: Dict) -> Dict:
+    """操作をアウトボックスに保存し、受付結果（ローカルID付き）を返す"""
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        record = OutboxOperation(
+            user_id=user_id,
+            operation=operation,
+            payload=json.dumps(payload, ensure_ascii=False),
+            status='pending',
+            attempts=0,
+            next_attempt_at=datetime.now()
+        )
+        db.add(record)
+        db.commit()
+        _wake_worker.set()
+        return _operation_dict(record)
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[ERROR] Failed to enqueue {operation} for user {user_id}: {type(e).__name__}: {e}")
+        return {"error": f"Failed to enqueue {operation}: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def enqueue_add_todo(user_id: str, title: str, description: str = None) -> Dict:
+    """Google TasksへのTODO追加をアウトボックスに保存する"""
+    return _enqueue(user_id, 'add_todo', {'title': title, 'description': description})
+
+
+def enqueue_add_event(user_id: str, title: str, start_time: datetime, end_time: datetime = None, description: str = None, location: str = None) -> Dict:
+    """Google Calendarへのイベント追加をアウトボックスに保存する"""
+    # end_timeが指定されていない場合は、start_timeから1時間後に設定
+    if end_time is None:
+        end_time = start_time + timedelta(hours=1)
+
+    return _enqueue(user_id, 'add_event', {
+        # 再送時に同じイベントが二重に作成されないよう、イベントIDをこちらで決めておく
+        'event_id': uuid.uuid4().hex,
+        'title': title,
+        'start_time': start_time.isoformat(),
+        'end_time': end_time.isoformat(),
+        'description': description,
+        'location': location,
+    })
+
+
+def get_outbox_operation(user_id: str, outbox_id: str) -> Dict:
+    """アウトボックスに保存した操作の状態と送信結果を取得する"""
+    local_id = outbox_id.replace('outbox_', '') if outbox_id.startswith('outbox_') else outbox_id
+    if not local_id.isdigit():
+        return {"error": f"Invalid outbox ID: {outbox_id}"}
+
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        record = db.query(OutboxOperation).filter(
+            OutboxOperation.id == int(local_id),
+            OutboxOperation.user_id == user_id
+        ).first()
+        if record is None:
+            return {"error": f"Outbox operation {outbox_id} not found"}
+        return _operation_dict(record)
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _claim_operations(db: Session, limit: int) -> List[OutboxOperation]:
+    """送信できる操作を取り出して送信中にする"""
+    now = datetime.now()
+    ready = or_(
+        and_(OutboxOperation.status == 'pending', OutboxOperation.next_attempt_at <= now),
+        # 送信中にワーカーが落ちた操作はリースが切れたら再送する
+        and_(OutboxOperation.status == 'processing',
+             OutboxOperation.updated_at < now - timedelta(seconds=OUTBOX_LEASE_SECONDS)),
+    )
+    candidate_ids = [row.id for row in db.query(OutboxOperation.id).filter(ready).order_by(OutboxOperation.id).limit(limit)]
+
+    # 複数のワーカーが同じ操作を送らないよう、条件付きのUPDATEで確保できたものだけを処理する
+    claimed_ids = []
+    for operation_id in candidate_ids:
+        updated = db.query(OutboxOperation).filter(OutboxOperation.id == operation_id, ready).update(
+            {'status': 'processing', 'updated_at': now}, synchronize_session=False
+        )
+        if updated:
+            claimed_ids.append(operation_id)
+    db.commit()
+
+    if not claimed_ids:
+        return []
+    return db.query(OutboxOperation).filter(OutboxOperation.id.in_(claimed_ids)).order_by(OutboxOperation.id).all()
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), OUTBOX_RETRY_MAX_SECONDS))
+
+
+def _mark_done(operation: OutboxOperation, result: Dict):
+    operation.attempts += 1
+    operation.status = 'done'
+    operation.last_error = None
+    operation.result = json.dumps(result, ensure_ascii=False, default=_json_default)
+
+
+def _mark_failed(operation: OutboxOperation, error: Exception):
+    """送信に失敗した操作を再試行待ちにする（再試行できない場合はfailedにする）"""
+    operation.attempts += 1
+    operation.last_error = f"{type(error).__name__}: {error}"
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status in _PERMANENT_HTTP_STATUSES or operation.attempts >= OUTBOX_MAX_ATTEMPTS:
+        operation.status = 'failed'
+        print(f"[ERROR] Outbox operation {operation.id} ({operation.operation}) failed: {operation.last_error}")
+    else:
+        operation.status = 'pending'
+        operation.next_attempt_at = datetime.now() + _retry_delay(operation.attempts)
+
+
+def _execute_batches(service, api: str, operations: List[OutboxOperation],
+                     build_request: Callable[[OutboxOperation], object]) -> Dict[int, tuple]:
+    """操作をバッチリクエストで送信し、操作ID -> (レスポンス, 例外) を返す"""
+    responses = {}
+
+    def callback(request_id, response, exception):
+        responses[int(request_id)] = (response, exception)
+
+    for start in range(0, len(operations), GOOGLE_BATCH_LIMIT):
+        batch = new_batch_request(service, api, callback)
+        for operation in operations[start:start + GOOGLE_BATCH_LIMIT]:
+            batch.add(build_request(operation), request_id=str(operation.id))
+        batch.execute()
+    return responses
+
+
+def _send_todos(db: Session, user_id: str, operations: List[OutboxOperation]) -> List[Dict]:
+    tasks_service = get_google_tasks_service(user_id, db)
+    if not tasks_service:
+        raise AuthenticationRequiredException("Google Tasks service not available (authentication may be expired)")
+    tasklist_id = _get_default_tasklist_id(tasks_service)
+
+    def build_request(operation):
+        payload = json.loads(operation.payload)
+        return tasks_service.tasks().insert(
+            tasklist=tasklist_id,
+            body={'title': payload['title'], 'notes': payload.get('description') or ''},
+            fields=TASK_FIELDS
+        )
+
+    todos = []
+    responses = _execute_batches(tasks_service, 'tasks', operations, build_request)
+    for operation in operations:
+        response, exception = responses.get(operation.id, (None, RuntimeError("No response in batch")))
+        if exception is not None:
+            _mark_failed(operation, exception)
+            continue
+        todo = _create_task_dict(response, user_id)
+        _mark_done(operation, todo)
+        todos.append(todo)
+    if todos:
+        todo_list_cache.invalidate(user_id)
+    return todos
+
+
+def _send_events(db: Session, user_id: str, operations: List[OutboxOperation]) -> List[Dict]:
+    calendar_service = get_google_calendar_service(user_id, db)
+    if not calendar_service:
+        raise AuthenticationRequiredException("Google Calendar service not available (authentication may be expired)")
+
+    def build_request(operation):
+        payload = json.loads(operation.payload)
+        event_body = _build_event_body(
+            payload['title'],
+            datetime.fromisoformat(payload['start_time']),
+            datetime.fromisoformat(payload['end_time']),
+            payload.get('description'),
+            payload.get('location')
+        )
+        event_body['id'] = payload['event_id']
+        return calendar_service.events().insert(calendarId='primary', body=event_body, fields=EVENT_FIELDS)
+
+    events = []
+    responses = _execute_batches(calendar_service, 'calendar', operations, build_request)
+    for operation in operations:
+        response, exception = responses.get(operation.id, (None, RuntimeError("No response in batch")))
+        if exception is not None and getattr(getattr(exception, 'resp', None), 'status', None) == 409:
+            # 前回の送信で作成済み（結果を保存する前に中断した場合など）なので、作成済みのイベントを使う
+            try:
+                response = calendar_service.events().get(
+                    calendarId='primary',
+                    eventId=json.loads(operation.payload)['event_id'],
+                    fields=EVENT_FIELDS
+                ).execute()
+                exception = None
+            except Exception as e:
+                exception = e
+        if exception is not None:
+            _mark_failed(operation, exception)
+            continue
+        event = _create_event_dict(response, user_id)
+        _mark_done(operation, event)
+        events.append(event)
+    if events:
+        event_window_cache.invalidate(user_id)
+    return events
+
+
+def _send_user_operations(db: Session, user_id: str, operations: List[OutboxOperation]):
+    """1人のユーザーの操作をAPIごとにまとめて送信する"""
+    senders = [('add_todo', 'todo', _send_todos), ('add_event', 'event', _send_events)]
+    for operation_name, item_type, sender in senders:
+        group = [operation for operation in operations if operation.operation == operation_name]
+        if not group:
+            continue
+        try:
+            items = sender(db, user_id, group)
+        except Exception as e:
+            # 認証切れやGoogleの障害の場合は、まとめて再試行待ちにする
+            print(f"[WARNING] Failed to send outbox for user {user_id}: {type(e).__name__}: {e}")
+            for operation in group:
+                if operation.status == 'processing':
+                    _mark_failed(operation, e)
+            items = []
+        # 検索インデックスの更新に失敗しても送信結果が失われないよう、先に確定する
+        db.commit()
+        if items:
+            index_items(db, user_id, item_type, items)
+
+
+def drain_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> Dict[str, int]:
+    """アウトボックスの送信待ちの操作をGoogleに送信し、件数の内訳を返す"""
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        operations = _claim_operations(db, batch_size)
+        operations_by_user: Dict[str, List[OutboxOperation]] = {}
+        for operation in operations:
+            operations_by_user.setdefault(operation.user_id, []).append(operation)
+        for user_id, user_operations in operations_by_user.items():
+            _send_user_operations(db, user_id, user_operations)
+
+        counts = {'claimed': len(operations), 'done': 0, 'pending': 0, 'failed': 0}
+        for operation in operations:
+            if operation.status in counts:
+                counts[operation.status] += 1
+        return counts
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def run_outbox_worker(stop_event: Optional[threading.Event] = None, poll_interval: float = OUTBOX_POLL_INTERVAL):
+    """アウトボックスを送信し続けるワーカーのループ（stop_eventがセットされるまで実行する）"""
+    global _last_polled_at
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        _wake_worker.clear()
+        try:
+            counts = drain_outbox()
+        except Exception as e:
+            print(f"[WARNING] Outbox worker error: {type(e).__name__}: {e}", file=sys.stderr)
+            counts = {'claimed': 0}
+        _last_polled_at = time.monotonic()
+        # 取り出し切れなかった操作があればすぐに次を送信する
+        if counts['claimed'] < OUTBOX_BATCH_SIZE:
+            _wake_worker.wait(poll_interval)
+
+
+def outbox_status(db: Session) -> Dict:
+    """ヘルスチェック用のアウトボックスの状態
+
+    送信待ちの操作の数、送信予定時刻を最も過ぎている操作の遅れ（秒）、このプロセスのワーカーが最後に確認してからの秒数を返す。
+    """
+    pending, oldest_due = db.query(func.count(OutboxOperation.id), func.min(OutboxOperation.next_attempt_at)).filter(
+        OutboxOperation.status == 'pending'
+    ).one()
+    lag = max(0.0, (datetime.now() - oldest_due).total_seconds()) if oldest_due else 0.0
+    return {
+        'pending': pending,
+        'lag_seconds': round(lag, 3),
+        'worker_running': _last_polled_at is not None,
+        'seconds_since_last_poll': round(time.monotonic() - _last_polled_at, 3) if _last_polled_at is not None else None,
+    }
+
+
+def start_outbox_worker(poll_interval: float = OUTBOX_POLL_INTERVAL) -> threading.Thread:
+    """アウトボックスのワーカーをバックグラウンドスレッドで起動する"""
+    thread = threading.Thread(target=run_outbox_worker, kwargs={'poll_interval': poll_interval}, name="outbox-worker", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    # 別プロセス（Herokuのworker dynoなど）でワーカーだけを動かす場合
+    print("[outbox] worker started", file=sys.stderr)
+    run_outbox_worker()
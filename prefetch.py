@@ -0,0 +1,189 @@
+from typing import Any, Callable, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import functools
+import inspect
+import os
+import threading
+import time
+
+import metrics
+from event_service import warm_event_window
+from todo_service import warm_todos
+
+
+# 先読みを有効にするかどうか（オプトイン）
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+# ユーザーごとに1分あたりに実行できる先読みの回数
+PREFETCH_BUDGET_PER_MINUTE = float(os.getenv("PREFETCH_BUDGET_PER_MINUTE", 6))
+# 先読みを実行するスレッド数（Googleへの同時リクエスト数の上限）
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", 2))
+# 実行待ちにできる先読みの数（超えた分は捨てる）
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 100))
+# 先読みするイベントの期間の上限（日）。これより長い期間の次の期間は先読みしない
+PREFETCH_MAX_WINDOW_DAYS = int(os.getenv("PREFETCH_MAX_WINDOW_DAYS", 31))
+# 予算を保持するユーザー数の上限（超えた分は最近先読みしていないユーザーから削除する。削除されたユーザーの予算は満タンに戻る）
+PREFETCH_MAX_BUDGETS = int(os.getenv("PREFETCH_MAX_BUDGETS", 10000))
+
+
+class _Budget:
+    """ユーザーごとの先読みの回数の予算（トークンバケット）"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# ユーザーID -> 予算（最近先読みした順。LRUでPREFETCH_MAX_BUDGETS件に抑える）
+_budgets: "OrderedDict[str, _Budget]" = OrderedDict()
+# 実行待ち・実行中の先読み（同じ先読みを重ねて実行しない）
+_pending: set = set()
+# ユーザーごとの実行中のツール呼び出しの数（そのユーザーのリクエストが実行中の間は先読みを実行しない）
+_foreground: Dict[str, int] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+metrics.register_gauge('prefetch_pending', lambda: len(_pending))
+metrics.register_gauge('prefetch_budgets', lambda: len(_budgets))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix='prefetch')
+        return _executor
+
+
+def _run(key: tuple, user_id: str, warm: Callable[[], Any]):
+    try:
+        with _lock:
+            busy = _foreground.get(user_id, 0) > 0
+        if busy:
+            # ユーザーのリクエストを優先し、Googleのクォータを取り合わないようにする
+            metrics.increment('prefetch_skipped', 'busy')
+            return
+        if warm():
+            metrics.increment('prefetch_warmed', key[0])
+    except Exception as e:
+        metrics.increment('prefetch_errors', key[0])
+        print(f"[WARNING] Prefetch {key[0]} failed for user {user_id}: {type(e).__name__}: {e}")
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _take_budget(user_id: str) -> bool:
+    """ユーザーの予算から1回分を使う（_lockを保持した状態で呼ぶ）"""
+    budget = _budgets.get(user_id)
+    if budget is None:
+        budget = _budgets[user_id] = _Budget(PREFETCH_BUDGET_PER_MINUTE)
+        while len(_budgets) > PREFETCH_MAX_BUDGETS:
+            _budgets.popitem(last=False)
+    else:
+        _budgets.move_to_end(user_id)
+    return budget.take()
+
+
+def schedule(kind: str, user_id: str, warm: Callable[[], Any], *key_parts) -> bool:
+    """先読みをバックグラウンドで実行する（予算を超えた場合や同じ先読みが実行待ちの場合は実行しない）"""
+    key = (kind, user_id) + key_parts
+    with _lock:
+        if key in _pending:
+            reason = 'duplicate'
+        elif len(_pending) >= PREFETCH_MAX_PENDING:
+            reason = 'queue_full'
+        elif not _take_budget(user_id):
+            reason = 'budget'
+        else:
+            reason = None
+            _pending.add(key)
+    if reason is not None:
+        metrics.increment('prefetch_skipped', reason)
+        return False
+    metrics.increment('prefetch_scheduled', kind)
+    _get_executor().submit(_run, key, user_id, warm)
+    return True
+
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, dict):
+        return 'error' in result
+    return isinstance(result, list) and bool(result) and isinstance(result[0], dict) and 'error' in result[0]
+
+
+def _after_get_all_events(arguments: Dict, result: Any):
+    """期間を指定したイベントの取得の後は、同じ長さの次の期間（今日の次は明日）を先読みする"""
+    if not arguments.get('end_date'):
+        return
+    start = datetime.fromisoformat(arguments['start_date'])
+    end = datetime.fromisoformat(arguments['end_date'])
+    span = end - start
+    if span <= timedelta(0) or span > timedelta(days=PREFETCH_MAX_WINDOW_DAYS):
+        return
+    user_id = arguments['user_id']
+    schedule('events', user_id, lambda: warm_event_window(user_id, end, end + span), end.isoformat(), span)
+
+
+def _after_todo_write(arguments: Dict, result: Any):
+    """TODOの追加・更新の後は一覧を先読みする（非同期の書き込みは送信後にキャッシュが破棄されるので除く）"""
+    if arguments.get('async_write'):
+        return
+    user_id = arguments['user_id']
+    schedule('todos', user_id, lambda: warm_todos(user_id))
+
+
+# ツール名 -> 呼び出しの後に先読みを判断する関数
+_RULES: Dict[str, Callable[[Dict, Any], None]] = {
+    'get_all_events_endpoint': _after_get_all_events,
+    'add_todo_endpoint': _after_todo_write,
+    'update_todo_status_endpoint': _after_todo_write,
+}
+
+
+def observe_tool_calls(func: Callable) -> Callable:
+    """ツール呼び出しを監視し、次に呼ばれそうな読み取りをバックグラウンドで先読みするデコレーター
+
+    PREFETCH_ENABLED=1の場合のみ動作する。先読みはバックグラウンドのスレッドで実行し、呼び出しを遅らせない。
+    """
+    rule = _RULES.get(func.__name__)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PREFETCH_ENABLED:
+            return func(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        user_id = arguments.get('user_id')
+        with _lock:
+            _foreground[user_id] = _foreground.get(user_id, 0) + 1
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            with _lock:
+                _foreground[user_id] -= 1
+                if not _foreground[user_id]:
+                    del _foreground[user_id]
+
+        if rule is not None and not _is_error(result):
+            try:
+                rule(arguments, result)
+            except Exception as e:
+                print(f"[WARNING] Failed to schedule prefetch after {func.__name__}: {type(e).__name__}: {e}")
+        return result
+
+    return wrapper
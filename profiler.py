@@ -0,0 +1,158 @@
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+
+import metrics
+
+
+# プロファイルするツール名（カンマ区切り、"*"は全てのツール）。未設定の場合はプロファイルしない（オプトイン）
+PROFILE_TOOLS = os.getenv("PROFILE_TOOLS", "")
+# 対象のツール呼び出しのうちプロファイルする割合（0〜1）
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 1.0))
+# プロファイル（pstats形式）の保存先
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# 保存先に残すプロファイルの数（超えた分は古いものから削除する）
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+# 管理用ツール（profiling_admin_endpoint）のトークン。未設定の場合は管理用ツールを登録しない
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+
+
+def _parse_tools(value: str) -> set:
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class _Settings:
+    def __init__(self):
+        self.tools = _parse_tools(PROFILE_TOOLS)
+        self.sample_rate = PROFILE_SAMPLE_RATE
+
+
+_settings = _Settings()
+# cProfileは同時に1つしか有効にできない（Python 3.12以降は全スレッドで共有）ので、プロファイルは1件ずつ行う
+_profile_lock = threading.Lock()
+# ツールごとに集計したプロファイル（top_functionsで使う）
+_aggregated: Dict[str, pstats.Stats] = {}
+_aggregated_lock = threading.Lock()
+
+
+def configure(tools: Optional[List[str]] = None, sample_rate: Optional[float] = None):
+    """プロファイルするツールと割合を変更する（toolsに空のリストを渡すと停止する）"""
+    if tools is not None:
+        _settings.tools = set(tools)
+    if sample_rate is not None:
+        _settings.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+
+def status() -> Dict:
+    """現在の設定と、集計済みのプロファイルの件数を返す"""
+    with _aggregated_lock:
+        profiled = {tool: len(stats.files) for tool, stats in _aggregated.items()}
+    return {
+        'tools': sorted(_settings.tools),
+        'sample_rate': _settings.sample_rate,
+        'profile_dir': os.path.abspath(PROFILE_DIR),
+        'profiled_calls': profiled,
+    }
+
+
+def _should_profile(tool: str) -> bool:
+    tools = _settings.tools
+    if not tools or ('*' not in tools and tool not in tools):
+        return False
+    return random.random() < _settings.sample_rate
+
+
+def _prune(directory: str):
+    """保存先のプロファイルをPROFILE_MAX_FILES件に減らす"""
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in files[:max(len(files) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _save(tool: str, profile: cProfile.Profile) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{tool}-{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}.prof")
+    profile.dump_stats(path)
+    with _aggregated_lock:
+        if tool in _aggregated:
+            _aggregated[tool].add(path)
+        else:
+            _aggregated[tool] = pstats.Stats(path)
+    _prune(PROFILE_DIR)
+    return path
+
+
+def profile_tool_calls(func: Callable) -> Callable:
+    """設定されたツールの呼び出しを一定の割合でcProfileで計測し、PROFILE_DIRに保存するデコレーター
+
+    計測するのはツールを実行するスレッドのみ（ツールの中で別スレッドに渡した処理は含まない）。
+    他の呼び出しを計測中の場合は計測せずに実行する。
+    """
+    tool = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _should_profile(tool):
+            return func(*args, **kwargs)
+        if not _profile_lock.acquire(blocking=False):
+            metrics.increment('profile_skipped', 'busy')
+            return func(*args, **kwargs)
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            _profile_lock.release()
+            try:
+                _save(tool, profile)
+                metrics.increment('profiled_calls', tool)
+            except Exception as e:
+                print(f"[WARNING] Failed to save profile of {tool}: {type(e).__name__}: {e}")
+    return wrapper
+
+
+def top_functions(tool: Optional[str] = None, top_n: int = 20, sort_by: str = 'cumulative') -> List[Dict]:
+    """集計済みのプロファイルから時間のかかっている関数を上位top_n件返す（toolを省略した場合は全ツールの合計）
+
+    sort_byが'total'の場合は関数自体の実行時間、それ以外は呼び出し先を含む累積時間の順にする。
+    """
+    with _aggregated_lock:
+        if tool is not None:
+            selected = [_aggregated[tool]] if tool in _aggregated else []
+        else:
+            selected = list(_aggregated.values())
+        if not selected:
+            return []
+        # 集計済みのStatsを変更しないように新しいStatsにまとめる
+        stats = pstats.Stats(stream=io.StringIO())
+        stats.add(*selected)
+    key = 2 if sort_by == 'total' else 3
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)[:top_n]
+    return [{
+        'function': f"{filename}:{line}({name})",
+        'calls': calls,
+        'primitive_calls': primitive_calls,
+        'total_seconds': round(total_time, 6),
+        'cumulative_seconds': round(cumulative_time, 6),
+    } for (filename, line, name), (primitive_calls, calls, total_time, cumulative_time, _) in rows]
+
+
+def reset():
+    """集計済みのプロファイルを破棄する（保存済みのファイルは残す）"""
+    with _aggregated_lock:
+        _aggregated.clear()
@@ -0,0 +1,92 @@
+import functools
+import hashlib
+import hmac
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+
+# ツール呼び出しの記録先（JSONL）。未設定の場合は記録しない（オプトイン）
+TOOL_CALL_RECORD_PATH = os.getenv("TOOL_CALL_RECORD_PATH")
+# ユーザーIDの匿名化に使うソルト。環境ごとに秘密の値を設定すること
+# 未設定の場合は、既知のIDからハッシュを総当たりで逆算できないよう、プロセスごとにランダムな値を使う
+# （その場合、匿名IDはプロセスを再起動すると変わる）
+TOOL_CALL_RECORD_SALT = os.getenv("TOOL_CALL_RECORD_SALT") or secrets.token_hex(32)
+
+if TOOL_CALL_RECORD_PATH and not os.getenv("TOOL_CALL_RECORD_SALT"):
+    print("[WARNING] TOOL_CALL_RECORD_SALT is not set; using a random per-process salt, "
+          "so anonymized user IDs will change on restart")
+
+_write_lock = threading.Lock()
+
+
+def anonymize_user_id(user_id: str) -> str:
+    """ユーザーIDをソルト付きハッシュで匿名化する（同じIDは常に同じ値になる）"""
+    digest = hmac.new(TOOL_CALL_RECORD_SALT.encode('utf-8'), str(user_id).encode('utf-8'), hashlib.sha256)
+    return f"anon_{digest.hexdigest()[:16]}"
+
+
+def _outcome(result: Any) -> Dict:
+    """ツールの戻り値から結果の種別を判定する"""
+    if isinstance(result, dict) and 'error' in result:
+        return {'outcome': 'error', 'error': result.get('error')}
+    if isinstance(result, list) and result and isinstance(result[0], dict) and 'error' in result[0]:
+        return {'outcome': 'error', 'error': result[0].get('error')}
+    return {'outcome': 'ok'}
+
+
+def _append_record(path: str, record: Dict):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _write_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def record_tool_call(func: Callable) -> Callable:
+    """ツール呼び出しをJSONLに記録するデコレーター
+
+    TOOL_CALL_RECORD_PATHが設定されている場合のみ、ツール名、引数（user_idは匿名化）、
+    開始時刻、所要時間、結果を1行ずつ追記する。
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        path: Optional[str] = TOOL_CALL_RECORD_PATH
+        if not path:
+            return func(*args, **kwargs)
+
+        # 他のデコレーターで包まれている場合も元の関数の引数名を使う
+        arguments = dict(zip(inspect.unwrap(func).__code__.co_varnames, args))
+        arguments.update(kwargs)
+        if 'user_id' in arguments:
+            arguments['user_id'] = anonymize_user_id(arguments['user_id'])
+
+        timestamp = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        outcome = {'outcome': 'exception'}
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            outcome = {'outcome': 'exception', 'error': f"{type(e).__name__}: {e}"}
+            raise
+        else:
+            outcome = _outcome(result)
+            return result
+        finally:
+            record = {
+                'tool': func.__name__,
+                'arguments': arguments,
+                'timestamp': timestamp,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                **outcome,
+            }
+            try:
+                _append_record(path, record)
+            except OSError as e:
+                print(f"[WARNING] Failed to record tool call {func.__name__}: {e}")
+
+    return wrapper
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, Set
+from collections import Counter
+import asyncio
+import threading
+
+from mcp_types import EmptyResult, SubscribeRequestParams, UnsubscribeRequestParams, SubscriptionsListenRequestParams
+from mcp.server.subscriptions import InMemorySubscriptionBus, ListenHandler, ResourceUpdated
+
+import metrics
+
+
+TODOS_URI = "todos://{user_id}"
+EVENTS_URI = "events://{user_id}/{date}"
+
+
+def todos_uri(user_id: str) -> str:
+    return TODOS_URI.format(user_id=user_id)
+
+
+def _user_uri_prefixes(user_id: str) -> tuple:
+    return todos_uri(user_id), EVENTS_URI.format(user_id=user_id, date='')
+
+
+class ResourceSubscriptions:
+    """MCPリソース（todos:// / events://）の購読を管理し、変更をresources/updatedで通知する
+
+    2026-07-28以降のクライアントはsubscriptions/listenのストリームで、それより前のクライアントは
+    resources/subscribeで購読する。同期処理が変更を検出したら（キャッシュを破棄したら）、
+    そのユーザーの購読中のURIに通知する。同じURIへの通知は、送信するまでの間に重なったものを1回にまとめる。
+    """
+
+    def __init__(self):
+        self._bus = InMemorySubscriptionBus()
+        self._listen_handler = ListenHandler(self._bus)
+        # 購読中のURI -> 購読の数（listenのストリームとresources/subscribeの合計）
+        self._uris: Counter = Counter()
+        # resources/subscribeで購読したURI -> セッション
+        self._sessions: Dict[str, Set] = {}
+        self._pending: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def install(self, server):
+        """MCPの低レベルのサーバーに購読のリクエストハンドラーを登録する"""
+        server.add_request_handler('subscriptions/listen', SubscriptionsListenRequestParams, self._listen)
+        server.add_request_handler('resources/subscribe', SubscribeRequestParams, self._subscribe)
+        server.add_request_handler('resources/unsubscribe', UnsubscribeRequestParams, self._unsubscribe)
+
+    def subscribed_uris(self) -> List[str]:
+        with self._lock:
+            return sorted(self._uris)
+
+    def _add(self, uri: str):
+        with self._lock:
+            self._uris[uri] += 1
+            self._loop = asyncio.get_running_loop()
+
+    def _remove(self, uri: str):
+        with self._lock:
+            self._uris[uri] -= 1
+            if self._uris[uri] <= 0:
+                del self._uris[uri]
+
+    async def _listen(self, ctx, params: SubscriptionsListenRequestParams):
+        uris = list(params.notifications.resource_subscriptions or [])
+        for uri in uris:
+            self._add(uri)
+        try:
+            # ストリームはクライアントが切断するまで続く
+            return await self._listen_handler(ctx, params)
+        finally:
+            for uri in uris:
+                self._remove(uri)
+
+    async def _subscribe(self, ctx, params: SubscribeRequestParams) -> EmptyResult:
+        uri = str(params.uri)
+        with self._lock:
+            sessions = self._sessions.setdefault(uri, set())
+            is_new = ctx.session not in sessions
+            sessions.add(ctx.session)
+        if is_new:
+            self._add(uri)
+        return EmptyResult()
+
+    async def _unsubscribe(self, ctx, params: UnsubscribeRequestParams) -> EmptyResult:
+        self._drop_session(str(params.uri), ctx.session)
+        return EmptyResult()
+
+    def _drop_session(self, uri: str, session):
+        with self._lock:
+            sessions = self._sessions.get(uri, set())
+            if session not in sessions:
+                return
+            sessions.discard(session)
+            if not sessions:
+                del self._sessions[uri]
+        self._remove(uri)
+
+    def notify_user_changed(self, user_id: str, kind: str):
+        """ユーザーのTODO（kind='todos'）またはイベント（kind='events'）が変更されたことを購読者に通知する
+
+        どのスレッドからも呼べる。購読がない場合は何もしない。
+        """
+        todos, events_prefix = _user_uri_prefixes(user_id)
+        with self._lock:
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                return
+            if kind == 'todos':
+                uris = [uri for uri in self._uris if uri == todos]
+            else:
+                uris = [uri for uri in self._uris if uri.startswith(events_prefix)]
+            uris = [uri for uri in uris if uri not in self._pending]
+            self._pending.update(uris)
+        for uri in uris:
+            asyncio.run_coroutine_threadsafe(self._publish(uri), loop)
+
+    async def _publish(self, uri: str):
+        with self._lock:
+            self._pending.discard(uri)
+            sessions = list(self._sessions.get(uri, ()))
+        metrics.increment('resource_updates', uri.split('://', 1)[0])
+        await self._bus.publish(ResourceUpdated(uri=uri))
+        for session in sessions:
+            try:
+                await session.send_resource_updated(uri)
+            except Exception as e:
+                # 切断されたセッションの購読は削除する
+                print(f"[WARNING] Failed to send resources/updated for {uri}: {type(e).__name__}: {e}")
+                self._drop_session(uri, session)
+
+
+resource_subscriptions = ResourceSubscriptions()
+
+metrics.register_gauge('resource_subscriptions', lambda: len(resource_subscriptions.subscribed_uris()))
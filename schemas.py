@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, TypedDict
 from datetime import datetime
 
 
@@ -11,5 +11,31 @@ class GoogleCredentials(BaseModel):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# ツールが返すTODO/イベントの形。MCPのレスポンスとしてそのままシリアライズできるよう、
+# 実行時は追加のオブジェクトを作らない通常の辞書として扱う
+class TodoResult(TypedDict):
+    id: str
+    user_id: str
+    title: str
+    description: str
+    completed: bool
+    created_at: Optional[str]
+    due: Optional[str]
+    source: str
+    google_task_id: Optional[str]
+
+
+class EventResult(TypedDict):
+    id: str
+    user_id: str
+    title: str
+    description: str
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    location: str
+    created_at: Optional[datetime]
+    source: str
+    google_event_id: Optional[str]
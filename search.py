@@ -0,0 +1,279 @@
+from typing import Iterable, List, Dict, Optional
+import weakref
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from models import get_db, SearchDocument
+
+
+# SQLiteの全文検索インデックス（FTS5の外部コンテンツテーブル）とそれを同期するトリガー
+# trigramトークナイザーは空白で区切られない日本語の部分一致にも対応する
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5(
+        title, description, location,
+        content='search_documents', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_documents_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO search_documents_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+]
+
+# trigramトークナイザーで検索できる最小の文字数（これより短い語はLIKEで検索する）
+MIN_FTS_TERM_LENGTH = 3
+
+# ドキュメントの内容として比較・保存するフィールド
+_DOCUMENT_FIELDS = ('title', 'description', 'location', 'start_time', 'completed', 'calendar_id')
+
+# 検索用スキーマを確認済みのエンジン
+_schema_ready = weakref.WeakSet()
+
+
+def ensure_search_schema(db: Session):
+    """SQLiteの場合、検索用テーブルとFTS5インデックスがなければ作成する
+
+    PostgreSQLのtsvector列とGINインデックスはAlembicのマイグレーションで作成する。
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != 'sqlite' or bind in _schema_ready:
+        return
+    SearchDocument.__table__.create(bind, checkfirst=True)
+    for statement in SQLITE_FTS_DDL:
+        db.execute(text(statement))
+    db.commit()
+    _schema_ready.add(bind)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    """DBの方言によらず比較できるようUTCのnaive datetimeにする"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _document_values(item_type: str, item: Dict, calendar_id: str) -> Optional[Dict]:
+    """サービスが返すTODO/イベント辞書から検索ドキュメントの値を作成する"""
+    if 'error' in item:
+        return None
+    if item_type == 'todo':
+        item_id = item.get('google_task_id')
+        start_time = None
+        completed = item.get('completed')
+        calendar_id = None
+    else:
+        item_id = item.get('google_event_id')
+        start_time = item.get('start_time')
+        completed = None
+        if start_time is not None:
+            start_time = _utc_naive(start_time)
+    if not item_id:
+        return None
+    return {
+        'item_id': item_id,
+        'title': item.get('title') or None,
+        'description': item.get('description') or None,
+        'location': item.get('location') or None,
+        'start_time': start_time,
+        'completed': completed,
+        'calendar_id': calendar_id,
+    }
+
+
+def index_items(db: Session, user_id: str, item_type: str, items: List[Dict], calendar_id: str = 'primary'):
+    """同期したTODO/イベントを検索インデックスに反映する（イベントは取得したカレンダーのIDと一緒に保存する）
+
+    内容が変わっていないドキュメントは更新しない。インデックスの更新に失敗しても
+    ツールの結果には影響させず、ログに記録するだけにする。
+    """
+    values_by_id = {}
+    for item in items:
+        values = _document_values(item_type, item, calendar_id)
+        if values:
+            values_by_id[values['item_id']] = values
+    if not values_by_id:
+        return
+
+    try:
+        ensure_search_schema(db)
+        existing = {
+            document.item_id: document
+            for document in db.query(SearchDocument).filter(
+                SearchDocument.user_id == user_id,
+                SearchDocument.item_type == item_type,
+                SearchDocument.item_id.in_(list(values_by_id))
+            )
+        }
+        changed = False
+        for item_id, values in values_by_id.items():
+            document = existing.get(item_id)
+            if document is None:
+                db.add(SearchDocument(user_id=user_id, item_type=item_type, **values))
+                changed = True
+                continue
+            for field in _DOCUMENT_FIELDS:
+                if getattr(document, field) != values[field]:
+                    setattr(document, field, values[field])
+                    changed = True
+        if changed:
+            db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[WARNING] Failed to update search index for user {user_id}: {type(e).__name__}: {e}")
+
+
+def remove_items(db: Session, user_id: str, item_type: str, item_ids: List[str]):
+    """削除されたTODO/イベントを検索インデックスから取り除く"""
+    if not item_ids:
+        return
+    try:
+        ensure_search_schema(db)
+        db.query(SearchDocument).filter(
+            SearchDocument.user_id == user_id,
+            SearchDocument.item_type == item_type,
+            SearchDocument.item_id.in_(list(item_ids))
+        ).delete(synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[WARNING] Failed to update search index for user {user_id}: {type(e).__name__}: {e}")
+
+
+def prune_items(db: Session, user_id: str, item_type: str, synced_ids: Iterable[str],
+                start: Optional[datetime] = None, end: Optional[datetime] = None, calendar_id: str = 'primary'):
+    """全件を取得した一覧に含まれなかったTODO/イベントを検索インデックスから取り除く
+
+    Googleで削除されたアイテムのドキュメントを残さないために、一覧を最後まで取得した後に呼ぶ。
+    イベントは取得したカレンダーの、開始日時が取得した期間 [start, end) にあるドキュメントだけを対象にする。
+    """
+    try:
+        ensure_search_schema(db)
+        query = db.query(SearchDocument.item_id).filter(
+            SearchDocument.user_id == user_id,
+            SearchDocument.item_type == item_type
+        )
+        if item_type == 'event':
+            query = query.filter(SearchDocument.calendar_id == calendar_id)
+            if start is not None:
+                query = query.filter(SearchDocument.start_time >= _utc_naive(start))
+            if end is not None:
+                query = query.filter(SearchDocument.start_time < _utc_naive(end))
+        stale = {row.item_id for row in query} - set(synced_ids)
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"[WARNING] Failed to update search index for user {user_id}: {type(e).__name__}: {e}")
+        return
+    remove_items(db, user_id, item_type, sorted(stale))
+
+
+def _escape_like(term: str) -> str:
+    """LIKEのワイルドカード（% と _）とエスケープ文字を文字どおりに一致させる"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts5_query(query: str) -> str:
+    """検索語をFTS5のフレーズとしてエスケープし、AND検索のクエリにする"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def _search_rows(db: Session, user_id: str, query: str, item_type: Optional[str], limit: int):
+    dialect = db.get_bind().dialect.name
+    params = {'user_id': user_id, 'limit': limit}
+    type_filter = ''
+    if item_type:
+        type_filter = 'AND d.item_type = :item_type'
+        params['item_type'] = item_type
+
+    columns = 'd.item_type, d.item_id, d.title, d.description, d.location, d.start_time, d.completed'
+    terms = query.split()
+
+    if dialect == 'postgresql':
+        params['query'] = query
+        sql = f"""
+            SELECT {columns}, ts_rank(d.search_vector, websearch_to_tsquery('simple', :query)) AS score
+            FROM search_documents d
+            WHERE d.user_id = :user_id {type_filter}
+              AND d.search_vector @@ websearch_to_tsquery('simple', :query)
+            ORDER BY score DESC
+            LIMIT :limit
+        """
+    elif dialect == 'sqlite' and all(len(term) >= MIN_FTS_TERM_LENGTH for term in terms):
+        ensure_search_schema(db)
+        params['query'] = _fts5_query(query)
+        # bm25()は関連度が高いほど小さい値を返すので符号を反転してスコアにする
+        sql = f"""
+            SELECT {columns}, -bm25(search_documents_fts) AS score
+            FROM search_documents_fts
+            JOIN search_documents d ON d.id = search_documents_fts.rowid
+            WHERE search_documents_fts MATCH :query AND d.user_id = :user_id {type_filter}
+            ORDER BY bm25(search_documents_fts)
+            LIMIT :limit
+        """
+    else:
+        # 全文検索インデックスが使えない場合（短い検索語など）は部分一致で検索する
+        conditions = []
+        for index, term in enumerate(terms):
+            params[f"term{index}"] = f"%{_escape_like(term)}%"
+            conditions.append(
+                f"(d.title LIKE :term{index} ESCAPE '\\' OR d.description LIKE :term{index} ESCAPE '\\'"
+                f" OR d.location LIKE :term{index} ESCAPE '\\')"
+            )
+        sql = f"""
+            SELECT {columns}, 0 AS score
+            FROM search_documents d
+            WHERE d.user_id = :user_id {type_filter} AND {' AND '.join(conditions)}
+            ORDER BY d.updated_at DESC
+            LIMIT :limit
+        """
+    return db.execute(text(sql), params).mappings().all()
+
+
+def search(user_id: str, query: str, item_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """同期済みのTODO/イベントをタイトル・説明・場所で全文検索する"""
+    if not query or not query.strip():
+        return [{"error": "query must not be empty"}]
+    if item_type not in (None, 'todo', 'event'):
+        return [{"error": "item_type must be 'todo' or 'event'"}]
+
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        rows = _search_rows(db, user_id, query.strip(), item_type, limit)
+    except SQLAlchemyError as e:
+        print(f"[ERROR] Search failed for user {user_id}: {type(e).__name__}: {e}")
+        return [{"error": f"Search failed: {type(e).__name__}: {e}"}]
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+    result = []
+    for row in rows:
+        start_time = row['start_time']
+        if isinstance(start_time, str):
+            # SQLiteの生SQLでは日時が文字列で返る
+            start_time = datetime.fromisoformat(start_time)
+        if start_time is not None:
+            start_time = start_time.replace(tzinfo=timezone.utc)
+        result.append({
+            'id': f"google_{row['item_id']}",
+            'item_type': row['item_type'],
+            'title': row['title'] or '',
+            'description': row['description'] or '',
+            'location': row['location'] or '',
+            'start_time': start_time,
+            'completed': None if row['completed'] is None else bool(row['completed']),
+            'score': float(row['score']),
+        })
+    print(f"[search] user_id: {user_id}, query: {query!r}, {len(result)} results")
+    return result
@@ -0,0 +1,80 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import base64
+import binascii
+import json
+import os
+
+import metrics
+from compact import compact_item
+
+
+# 1回の呼び出しで返す一覧の大きさの上限（JSONのバイト数）。超える分は次のカーソルで取得する
+STREAM_MAX_RESPONSE_BYTES = int(os.getenv("STREAM_MAX_RESPONSE_BYTES", 1_000_000))
+
+
+class InvalidCursorError(ValueError):
+    """カーソルの形式が正しくない"""
+
+
+def encode_cursor(page_token: Optional[str], offset: int) -> str:
+    """続きの位置（Googleのページトークンと、そのページの中での位置）をカーソル文字列にする"""
+    raw = json.dumps({'page_token': page_token, 'offset': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Optional[str], int]:
+    """カーソル文字列を (ページトークン, ページの中での位置) に戻す（Noneの場合は先頭）"""
+    if not cursor:
+        return None, 0
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return position['page_token'], int(position['offset'])
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def _report_progress(progress: int, message: str):
+    """MCPの進捗通知を送る（MCPのツール呼び出しの外から呼ばれた場合は何もしない）"""
+    try:
+        import anyio.from_thread
+        from fastmcp.server.dependencies import get_context
+        anyio.from_thread.run(get_context().report_progress, progress, None, message)
+    except Exception:
+        pass
+
+
+def collect_pages(pages: Iterator[Tuple[Optional[str], List[Dict]]], offset: int = 0, compact: bool = False,
+                  max_bytes: Optional[int] = None, label: str = 'items') -> Dict:
+    """ページごとに取得した一覧を、JSONの大きさの上限まで集める
+
+    ページを取得するたびに進捗を通知する。上限に達した場合は残りのページを取得せずに止め、
+    続きを取得するためのnext_cursorを返す（1件だけで上限を超える場合もその1件は返す）。
+    """
+    max_bytes = STREAM_MAX_RESPONSE_BYTES if max_bytes is None else max_bytes
+    items = []
+    size = 0
+    pages_fetched = 0
+    try:
+        for page_token, page in pages:
+            pages_fetched += 1
+            for index in range(offset, len(page)):
+                item = compact_item(page[index]) if compact else page[index]
+                item_size = len(json.dumps(item, ensure_ascii=False, default=str).encode('utf-8'))
+                if items and size + item_size > max_bytes:
+                    metrics.increment('stream_truncated', label)
+                    return {
+                        'items': items,
+                        'next_cursor': encode_cursor(page_token, index),
+                        'bytes': size,
+                        'pages': pages_fetched,
+                    }
+                items.append(item)
+                size += item_size
+            offset = 0
+            _report_progress(len(items), f"{len(items)} {label} ({pages_fetched} pages)")
+    finally:
+        # 上限で止めた場合もGoogleへのページングをここで打ち切る
+        close = getattr(pages, 'close', None)
+        if close:
+            close()
+    return {'items': items, 'next_cursor': None, 'bytes': size, 'pages': pages_fetched}
@@ -11,6 +11,27 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # テストモジュールをインポート
 from tests.test_todo_service import TestTodoService
 from tests.test_mcp_endpoints import TestMCPEndpoints
+from tests.test_recorder import TestRecorder
+from tests.test_google_api import TestGoogleApi, TestReplicaRouting
+from tests.test_compact import TestCompact
+from tests.test_event_service import TestEventService
+from tests.test_search import TestSearch
+from tests.test_outbox import TestOutbox
+from tests.test_idempotency import TestIdempotency
+from tests.test_calendar_watch import TestCalendarWatch
+from tests.test_coalesce import TestCoalesce
+from tests.test_event_cache import TestEventWindowCache, TestGetAllEventsCache
+from tests.test_todo_cache import TestTodoListCache, TestGetAllTodosCache
+from tests.test_prefetch import TestPrefetch
+from tests.test_agenda_service import TestAgendaService
+from tests.test_admission import TestConcurrencyLimiter, TestUpstreamLimit, TestAdmissionMiddleware
+from tests.test_health import TestHealth
+from tests.test_profiler import TestProfiler
+from tests.test_streaming import TestCollectPages, TestStreaming
+from tests.test_delta_service import TestDeltaService
+from tests.test_export import TestExport
+from tests.test_bulk_import import TestImportParsers, TestBulkImport
+from tests.test_resource_updates import TestResourceSubscriptions, TestResourceEndpoints
 
 if __name__ == "__main__":
     # テストスイートを作成
@@ -19,6 +40,35 @@ if __name__ == "__main__":
     # テストクラスをスイートに追加
     test_suite.addTest(unittest.makeSuite(TestTodoService))
     test_suite.addTest(unittest.makeSuite(TestMCPEndpoints))
+    test_suite.addTest(unittest.makeSuite(TestRecorder))
+    test_suite.addTest(unittest.makeSuite(TestGoogleApi))
+    test_suite.addTest(unittest.makeSuite(TestReplicaRouting))
+    test_suite.addTest(unittest.makeSuite(TestCompact))
+    test_suite.addTest(unittest.makeSuite(TestEventService))
+    test_suite.addTest(unittest.makeSuite(TestSearch))
+    test_suite.addTest(unittest.makeSuite(TestOutbox))
+    test_suite.addTest(unittest.makeSuite(TestIdempotency))
+    test_suite.addTest(unittest.makeSuite(TestCalendarWatch))
+    test_suite.addTest(unittest.makeSuite(TestCoalesce))
+    test_suite.addTest(unittest.makeSuite(TestEventWindowCache))
+    test_suite.addTest(unittest.makeSuite(TestGetAllEventsCache))
+    test_suite.addTest(unittest.makeSuite(TestTodoListCache))
+    test_suite.addTest(unittest.makeSuite(TestGetAllTodosCache))
+    test_suite.addTest(unittest.makeSuite(TestPrefetch))
+    test_suite.addTest(unittest.makeSuite(TestAgendaService))
+    test_suite.addTest(unittest.makeSuite(TestConcurrencyLimiter))
+    test_suite.addTest(unittest.makeSuite(TestUpstreamLimit))
+    test_suite.addTest(unittest.makeSuite(TestAdmissionMiddleware))
+    test_suite.addTest(unittest.makeSuite(TestHealth))
+    test_suite.addTest(unittest.makeSuite(TestProfiler))
+    test_suite.addTest(unittest.makeSuite(TestCollectPages))
+    test_suite.addTest(unittest.makeSuite(TestStreaming))
+    test_suite.addTest(unittest.makeSuite(TestDeltaService))
+    test_suite.addTest(unittest.makeSuite(TestExport))
+    test_suite.addTest(unittest.makeSuite(TestImportParsers))
+    test_suite.addTest(unittest.makeSuite(TestBulkImport))
+    test_suite.addTest(unittest.makeSuite(TestResourceSubscriptions))
+    test_suite.addTest(unittest.makeSuite(TestResourceEndpoints))
     
     # テストランナーを作成して実行
     runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,230 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import metrics
+from admission import ConcurrencyLimiter, OverloadedError
+from todo_cache import todo_list_cache
+from todo_service import get_all_todos
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    """同時実行数の制限のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.limiter = ConcurrencyLimiter('test_calls', max_concurrency=1, max_queue=1, queue_timeout_seconds=0.2)
+
+    def _hold(self, release: threading.Event):
+        """別スレッドで枠を取って、releaseが設定されるまで保持する"""
+        acquired = threading.Event()
+
+        def hold():
+            with self.limiter.slot():
+                acquired.set()
+                release.wait(5)
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait(5)
+        return thread
+
+    def test_queue_full_is_rejected_immediately(self):
+        """待ち行列が一杯の場合は待たずにoverloadedになる"""
+        release = threading.Event()
+        holder = self._hold(release)
+        waiter = threading.Thread(target=self.limiter.acquire)
+        waiter.start()
+        while self.limiter.queued < 1:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with self.assertRaises(OverloadedError) as cm:
+            self.limiter.acquire()
+
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(cm.exception.reason, 'queue_full')
+        self.assertEqual(cm.exception.as_dict()['error'], "overloaded")
+        release.set()
+        holder.join(5)
+        waiter.join(5)
+        self.limiter.release()
+
+    def test_queue_timeout(self):
+        """待ち時間の上限を過ぎた呼び出しはoverloadedになり、待ち行列から外れる"""
+        release = threading.Event()
+        holder = self._hold(release)
+
+        with self.assertRaises(OverloadedError) as cm:
+            self.limiter.acquire()
+
+        self.assertEqual(cm.exception.reason, 'timeout')
+        self.assertEqual(self.limiter.queued, 0)
+        self.assertEqual(metrics.snapshot()['counters']['test_calls_rejected'], {'timeout': 1})
+        release.set()
+        holder.join(5)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_slot_is_handed_to_waiter(self):
+        """枠が空くと待っていた呼び出しが実行される"""
+        release = threading.Event()
+        holder = self._hold(release)
+        results = []
+        waiter = threading.Thread(target=lambda: (self.limiter.acquire(), results.append('acquired')))
+        waiter.start()
+        while self.limiter.queued < 1:
+            time.sleep(0.01)
+
+        snapshot = metrics.snapshot()['gauges']
+        self.assertEqual((snapshot['test_calls_in_flight'], snapshot['test_calls_queued']), (1, 1))
+        release.set()
+        holder.join(5)
+        waiter.join(5)
+
+        self.assertEqual(results, ['acquired'])
+        self.assertEqual(self.limiter.in_flight, 1)
+        self.limiter.release()
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_async_acquire(self):
+        """イベントループからは待っている間もループをブロックしない"""
+        release = threading.Event()
+        holder = self._hold(release)
+
+        async def run():
+            ticks = 0
+            acquire = asyncio.ensure_future(self.limiter.acquire_async())
+            while not acquire.done():
+                ticks += 1
+                if ticks == 5:
+                    release.set()
+                await asyncio.sleep(0.01)
+            await acquire
+            self.limiter.release()
+            return ticks
+
+        self.assertGreaterEqual(asyncio.run(run()), 5)
+        holder.join(5)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_async_timeout(self):
+        """イベントループから待つ場合も待ち時間の上限を過ぎるとoverloadedになる"""
+        release = threading.Event()
+        holder = self._hold(release)
+
+        with self.assertRaises(OverloadedError):
+            asyncio.run(self.limiter.acquire_async())
+
+        release.set()
+        holder.join(5)
+        self.assertEqual((self.limiter.in_flight, self.limiter.queued), (0, 0))
+
+
+class TestUpstreamLimit(unittest.TestCase):
+    """Google APIの呼び出しの同時実行数の制限のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.server = start_fake_google(latency_ms=300)
+        endpoints = endpoint_env(self.server)
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as db:
+            for user_id in ("user_1", "user_2"):
+                db.add(GoogleCredentials(user_id=user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.limiter = ConcurrencyLimiter('test_upstream', max_concurrency=1, max_queue=0, queue_timeout_seconds=1)
+        self.patches = [
+            patch('todo_service.get_db', get_db),
+            patch.object(google_api, 'upstream_limiter', self.limiter),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        todo_list_cache.clear()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        todo_list_cache.clear()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def test_overloaded_upstream_returns_error(self):
+        """Google APIの呼び出しが上限を超えた場合は空の一覧ではなくoverloadedを返す"""
+        results = {}
+        threads = [threading.Thread(target=lambda u=user_id: results.__setitem__(u, get_all_todos(u)))
+                   for user_id in ("user_1", "user_2")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        errors = [result[0].get('error') for result in results.values() if result]
+        self.assertIn("overloaded", errors)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    """ツール呼び出しの受付制限のテストクラス"""
+
+    def test_rejects_when_overloaded(self):
+        """同時実行数と待ち行列の上限を超えたツール呼び出しにはすぐにエラーを返す"""
+        import main
+        from fastmcp import Client, FastMCP
+
+        release = threading.Event()
+        mcp = FastMCP("Test")
+        mcp.add_middleware(main.AdmissionMiddleware())
+
+        @mcp.tool()
+        def slow_tool_for_test() -> str:
+            release.wait(5)
+            return "done"
+
+        limiter = ConcurrencyLimiter('test_tool_calls', max_concurrency=1, max_queue=0, queue_timeout_seconds=1)
+
+        async def run():
+            async with Client(mcp) as client:
+                first = asyncio.ensure_future(client.call_tool('slow_tool_for_test', {}))
+                while limiter.in_flight < 1:
+                    await asyncio.sleep(0.01)
+                second = await client.call_tool('slow_tool_for_test', {}, raise_on_error=False)
+                release.set()
+                return await first, second
+
+        with patch.object(main, 'tool_call_limiter', limiter):
+            first, second = asyncio.run(run())
+
+        self.assertEqual(first.content[0].text, "done")
+        self.assertTrue(second.is_error)
+        self.assertIn("overloaded", second.content[0].text)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+from datetime import datetime
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import agenda_service
+from agenda_service import get_agenda
+from event_cache import event_window_cache
+from todo_cache import todo_list_cache
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestAgendaService(unittest.TestCase):
+    """アジェンダのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=0, seed_events=0)
+        self.store.insert_event('primary', {
+            'summary': "朝会",
+            'start': {'dateTime': "2025-06-05T09:30:00+09:00"},
+            'end': {'dateTime': "2025-06-05T10:00:00+09:00"},
+        })
+        self.store.insert_event('primary', {
+            'summary': "打ち合わせ",
+            'start': {'dateTime': "2025-06-05T14:00:00+09:00"},
+            'end': {'dateTime': "2025-06-05T15:00:00+09:00"},
+        })
+        self.store.insert_event('primary', {
+            'summary': "翌日の予定",
+            'start': {'dateTime': "2025-06-06T10:00:00+09:00"},
+            'end': {'dateTime': "2025-06-06T11:00:00+09:00"},
+        })
+        self.store.insert_task('default', {'title': "請求書を送る", 'due': "2025-06-05T00:00:00.000Z"})
+        self.store.insert_task('default', {'title': "来週の準備", 'due': "2025-06-12T00:00:00.000Z"})
+        self.store.insert_task('default', {'title': "牛乳を買う"})
+        self.store.insert_task('default', {'title': "完了済み", 'due': "2025-06-05T00:00:00.000Z", 'status': 'completed'})
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('agenda_service.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        event_window_cache.clear()
+        todo_list_cache.clear()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        event_window_cache.clear()
+        todo_list_cache.clear()
+        google_api.clear_negative_cache()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def _agenda(self):
+        return get_agenda(self.user_id, datetime(2025, 6, 5), datetime(2025, 6, 6))
+
+    def test_merged_in_time_order(self):
+        """イベントと期限日のTODOを時刻順に並べ、期限のないTODOは別にする"""
+        agenda = self._agenda()
+
+        self.assertEqual([(item['type'], item['title']) for item in agenda['items']], [
+            ('todo', "請求書を送る"),
+            ('event', "朝会"),
+            ('event', "打ち合わせ"),
+        ])
+        self.assertEqual([todo['title'] for todo in agenda['undated_todos']], ["牛乳を買う"])
+
+    def test_single_credential_load(self):
+        """クレデンシャルの読み込みは1回だけで、TasksとCalendarは別々のサービスを使う"""
+        with patch('agenda_service.get_google_services', wraps=google_api.get_google_services) as mock_services, \
+                patch('google_api.get_google_credentials', wraps=google_api.get_google_credentials) as mock_credentials:
+            self._agenda()
+
+        mock_services.assert_called_once()
+        mock_credentials.assert_called_once()
+
+    def test_uses_caches(self):
+        """キャッシュ済みの一覧と期間はGoogleに問い合わせずに使う"""
+        self._agenda()
+
+        with patch('agenda_service.get_google_services') as mock_services:
+            agenda = self._agenda()
+
+        mock_services.assert_not_called()
+        self.assertEqual(len(agenda['items']), 3)
+
+    def test_wide_range_is_not_cached(self):
+        """長い期間はキャッシュを埋めるための全件取得をせず、上限件数だけを返す"""
+        with patch.object(agenda_service, 'AGENDA_MAX_ITEMS', 2), \
+                patch('agenda_service._list_window_events') as mock_list_window_events:
+            agenda = get_agenda(self.user_id, datetime(2020, 1, 1), datetime(2030, 1, 1))
+
+        mock_list_window_events.assert_not_called()
+        self.assertEqual(len(event_window_cache), 0)
+        self.assertEqual([item['title'] for item in agenda['items']], ["請求書を送る", "朝会"])
+        self.assertTrue(agenda['truncated'])
+
+    def test_authentication_error(self):
+        """再認証が必要な場合は認証エラーを返す"""
+        with patch('agenda_service.get_google_services',
+                   side_effect=google_api.AuthenticationRequiredException("expired")):
+            agenda = self._agenda()
+
+        self.assertEqual(agenda['error'], "authentication_required")
+
+    def test_compact(self):
+        """compactの場合は空のフィールドを除く"""
+        agenda = get_agenda(self.user_id, datetime(2025, 6, 5), datetime(2025, 6, 6), compact=True)
+
+        self.assertNotIn('due', agenda['undated_todos'][0])
+        self.assertEqual(agenda['items'][0]['type'], 'todo')
+
+
+if __name__ == "__main__":
+    unittest.main()
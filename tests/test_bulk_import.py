@@ -0,0 +1,265 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import io
+from datetime import datetime, timedelta, timezone
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+from googleapiclient.errors import HttpError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import bulk_import
+from bulk_import import parse_csv, parse_ics, import_rows, RateLimiter
+from models import Base, GoogleCredentials, SearchDocument
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+ICS = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VEVENT\r
+UID:1\r
+SUMMARY:Team meeting\\, weekly\r
+DESCRIPTION:Line one\\nLine two that is folded\r
+  across lines\r
+DTSTART:20250602T010000Z\r
+DTEND:20250602T020000Z\r
+LOCATION:Room 1\r
+BEGIN:VALARM\r
+ACTION:DISPLAY\r
+DESCRIPTION:Reminder\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Lunch\r
+DTSTART;TZID=Asia/Tokyo:20250603T120000\r
+DURATION:PT1H30M\r
+RRULE:FREQ=WEEKLY;COUNT=3\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Holiday\r
+DTSTART;VALUE=DATE:20250604\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART:20250605T010000Z\r
+END:VEVENT\r
+BEGIN:VTODO\r
+SUMMARY:Pay rent\r
+STATUS:COMPLETED\r
+DUE;VALUE=DATE:20250630\r
+END:VTODO\r
+END:VCALENDAR\r
+"""
+
+
+class TestImportParsers(unittest.TestCase):
+    """CSV / ICSの読み込みのテストクラス"""
+
+    def test_parse_csv_todos(self):
+        """start列がないCSVはTODOとして読み、不正な行はエラーにする"""
+        rows = list(parse_csv(io.StringIO(
+            "Title,Notes,Done,Due\n"
+            "Buy milk,2 bottles,yes,2025-06-30\n"
+            "\n"
+            ",no title,,\n"
+            "Bad due,,,someday\n"
+        )))
+
+        self.assertEqual(rows[0], {
+            'row': 2, 'kind': 'todo', 'title': "Buy milk", 'description': "2 bottles",
+            'completed': True, 'due': "2025-06-30T00:00:00.000Z",
+        })
+        self.assertEqual((rows[1]['row'], rows[1]['error']), (4, "title is required"))
+        self.assertIn("invalid date", rows[2]['error'])
+
+    def test_parse_csv_events(self):
+        """start列があるCSVはイベントとして読む（タイムゾーンのない日時はそのまま）"""
+        rows = list(parse_csv(io.StringIO(
+            "subject,start_time,end_time,location\n"
+            "Review,2025-06-02T10:00:00+09:00,,Office\n"
+            "Call,2025-06-03 15:00,2025-06-03 15:30,\n"
+        )))
+
+        self.assertEqual(rows[0]['kind'], 'event')
+        self.assertEqual(rows[0]['start_time'], datetime(2025, 6, 2, 1, tzinfo=timezone.utc))
+        self.assertIsNone(rows[0]['end_time'])
+        self.assertEqual(rows[1]['end_time'], datetime(2025, 6, 3, 15, 30))
+
+    def test_parse_ics(self):
+        """ICSの折り返し・エスケープ・TZID・DURATION・入れ子のコンポーネントを扱う"""
+        rows = list(parse_ics(io.StringIO(ICS)))
+
+        meeting, lunch, holiday, untitled, todo = rows
+        self.assertEqual(meeting['title'], "Team meeting, weekly")
+        self.assertEqual(meeting['description'], "Line one\nLine two that is folded across lines")
+        self.assertEqual(meeting['location'], "Room 1")
+        self.assertEqual(meeting['row'], 3)
+        self.assertEqual(lunch['end_time'] - lunch['start_time'], timedelta(hours=1, minutes=30))
+        self.assertEqual(lunch['start_time'].utcoffset(), timedelta(hours=9))
+        self.assertEqual(lunch['recurrence'], ["RRULE:FREQ=WEEKLY;COUNT=3"])
+        self.assertEqual(holiday['skipped'], "all-day events are not supported")
+        self.assertEqual(untitled['error'], "SUMMARY is required")
+        self.assertEqual((todo['kind'], todo['completed'], todo['due']), ('todo', True, "2025-06-30T00:00:00.000Z"))
+
+    def test_rate_limiter(self):
+        """1秒あたりの件数を超える分は待つ"""
+        limiter = RateLimiter(10)
+        with patch('bulk_import.time.sleep') as mock_sleep:
+            limiter.acquire(50)
+            limiter.acquire(1)
+
+        mock_sleep.assert_called_once()
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 5.0, delta=0.1)
+
+
+class TestBulkImport(unittest.TestCase):
+    """CSV / ICSからのGoogleへの一括インポートのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=3, seed_events=0)
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('bulk_import.get_db', get_db),
+            patch.object(bulk_import, 'IMPORT_REQUESTS_PER_SECOND', 0),
+            patch.object(bulk_import, 'IMPORT_RETRY_BASE_SECONDS', 0),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        google_api.clear_negative_cache()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def test_import_todos_in_batches(self):
+        """TODOをGOOGLE_BATCH_LIMIT件ずつのバッチで作成し、既存とファイル内の重複は作成しない"""
+        lines = ["title,notes"] + [f"Imported {i},note {i}" for i in range(120)]
+        lines += ["Seed task 1,", "Imported 5,again"]
+
+        with patch('bulk_import.new_batch_request', wraps=google_api.new_batch_request) as mock_batch:
+            summary = import_rows(self.user_id, parse_csv(io.StringIO("\n".join(lines))))
+
+        self.assertEqual((summary['created'], summary['duplicate'], summary['failed']), (120, 2, 0))
+        self.assertEqual(mock_batch.call_count, 3)
+        self.assertEqual([result['row'] for result in summary['results']], list(range(2, 124)))
+        titles = [task['title'] for task in self.store.tasks['default'].values()]
+        self.assertEqual(len(titles), 123)
+        with self.Session() as db:
+            self.assertEqual(db.query(SearchDocument).filter(SearchDocument.item_type == 'todo').count(), 120)
+
+    def test_import_ics_twice(self):
+        """ICSのイベントとTODOを作成し、同じファイルをもう一度インポートすると全て重複になる"""
+        first = import_rows(self.user_id, parse_ics(io.StringIO(ICS)))
+        second = import_rows(self.user_id, parse_ics(io.StringIO(ICS)))
+
+        self.assertEqual((first['created'], first['skipped'], first['invalid']), (3, 1, 1))
+        self.assertEqual((second['created'], second['duplicate']), (0, 3))
+        lunch = next(event for event in self.store.events['primary'].values() if event['summary'] == "Lunch")
+        self.assertEqual(lunch['end']['dateTime'], "2025-06-03T04:30:00Z")
+        self.assertEqual(lunch['recurrence'], ["RRULE:FREQ=WEEKLY;COUNT=3"])
+
+    def test_existing_items_lookup_is_bounded(self):
+        """既存のイベントはバッチの行の開始日時の範囲だけ取得し、非表示の完了済みタスクも重複とみなす"""
+        self.store.insert_task('default', {'title': "Cleared task", 'status': 'completed', 'hidden': True})
+        self.store.insert_event('primary', {
+            'summary': "Review",
+            'start': {'dateTime': "2025-06-02T01:00:00Z"},
+            'end': {'dateTime': "2025-06-02T02:00:00Z"},
+        })
+        csv_text = (
+            "title,start,end\n"
+            "Review,2025-06-02T10:00:00+09:00,2025-06-02T11:00:00+09:00\n"
+            "Retro,2025-06-05T10:00:00+09:00,2025-06-05T11:00:00+09:00\n"
+        )
+
+        with patch('bulk_import._iter_window_event_pages', wraps=bulk_import._iter_window_event_pages) as mock_pages:
+            events = import_rows(self.user_id, parse_csv(io.StringIO(csv_text)))
+        todos = import_rows(self.user_id, parse_csv(io.StringIO("title\nCleared task\n")))
+
+        self.assertEqual((events['created'], events['duplicate']), (1, 1))
+        _, _, start, end = mock_pages.call_args[0]
+        self.assertEqual(start, datetime(2025, 6, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(end, datetime(2025, 6, 5, 1, 0, 1, tzinfo=timezone.utc))
+        self.assertEqual((todos['created'], todos['duplicate']), (0, 1))
+
+    def test_retry_rate_limited_rows(self):
+        """レート制限で失敗した行は再送し、再試行できないエラーの行はfailedにする"""
+        real_execute = bulk_import._execute_batch
+        calls = []
+
+        def flaky(service, api, requests):
+            calls.append(len(requests))
+            if len(calls) == 1:
+                rate_limited = HttpError(httplib2.Response({'status': 403}), b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}')
+                bad_request = HttpError(httplib2.Response({'status': 400}), b'bad request')
+                return [(None, rate_limited), (None, bad_request), (None, rate_limited)]
+            return real_execute(service, api, requests)
+
+        with patch('bulk_import._execute_batch', side_effect=flaky):
+            summary = import_rows(self.user_id, parse_csv(io.StringIO("title\nA\nB\nC\n")))
+
+        self.assertEqual(calls, [3, 2])
+        self.assertEqual([result['status'] for result in summary['results']], ['created', 'failed', 'created'])
+
+    def test_retry_does_not_duplicate_created_rows(self):
+        """失敗が返ったが作成されていた行は、再送で二重に作成せずにcreatedにする"""
+        real_execute = bulk_import._execute_batch
+        calls = []
+
+        def created_but_failed(service, api, requests):
+            calls.append(len(requests))
+            responses = real_execute(service, api, requests)
+            if len(calls) in (1, 3):
+                unavailable = HttpError(httplib2.Response({'status': 503}), b'backend error')
+                return [(None, unavailable)] * len(responses)
+            return responses
+
+        csv_text = (
+            "title,start,end\n"
+            "Review,2025-06-02T10:00:00+09:00,2025-06-02T11:00:00+09:00\n"
+            "Retro,2025-06-05T10:00:00+09:00,2025-06-05T11:00:00+09:00\n"
+        )
+        with patch('bulk_import._execute_batch', side_effect=created_but_failed):
+            events = import_rows(self.user_id, parse_csv(io.StringIO(csv_text)))
+            todos = import_rows(self.user_id, parse_csv(io.StringIO("title\nA\nB\n")))
+
+        self.assertEqual(calls, [2, 2, 2])
+        self.assertEqual([result['status'] for result in events['results'] + todos['results']], ['created'] * 4)
+        self.assertEqual(sorted(event['summary'] for event in self.store.events['primary'].values()), ["Retro", "Review"])
+        titles = [task['title'] for task in self.store.tasks['default'].values()]
+        self.assertEqual((titles.count("A"), titles.count("B")), (1, 1))
+        self.assertEqual({result['id'] for result in events['results']},
+                         {f"google_{event_id}" for event_id in self.store.events['primary']})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import google_api
+import calendar_watch
+from calendar_watch import watch_calendar, stop_watching_calendar, handle_notification, renew_channels
+from models import Base, GoogleCredentials, CalendarWatchChannel, SearchDocument
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """スタブが送る通知をhandle_notificationに渡すWebhook"""
+
+    statuses = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        status = handle_notification(dict(self.headers))
+        self.statuses.append((self.headers.get('X-Goog-Resource-State'), status))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class TestCalendarWatch(unittest.TestCase):
+    """カレンダーのプッシュ通知のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=0, seed_events=3)
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        _WebhookHandler.statuses = []
+        self.webhook = ThreadingHTTPServer(('127.0.0.1', 0), _WebhookHandler)
+        threading.Thread(target=self.webhook.serve_forever, daemon=True).start()
+        webhook_url = f"http://127.0.0.1:{self.webhook.server_port}/webhooks/calendar"
+
+        # テスト用のDB（バックグラウンドの同期スレッドが別の接続を使えるようファイルにする）
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{self.db_dir.name}/test.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.invalidated = []
+        self.patches = [
+            patch('calendar_watch.get_db', get_db),
+            patch.object(calendar_watch, 'CALENDAR_WEBHOOK_URL', webhook_url),
+            patch.object(calendar_watch, '_invalidation_listeners', [lambda *key: self.invalidated.append(key)]),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self._wait_for(lambda: not calendar_watch._resync_state)
+        for p in self.patches:
+            p.stop()
+        self.webhook.shutdown()
+        self.server.shutdown()
+        self.engine.dispose()
+        self.db_dir.cleanup()
+
+    def _wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("Timed out waiting for calendar resync")
+            time.sleep(0.02)
+
+    def _channel(self):
+        with self.Session() as db:
+            return db.query(CalendarWatchChannel).filter(CalendarWatchChannel.user_id == self.user_id).first()
+
+    def _indexed_titles(self):
+        with self.Session() as db:
+            return sorted(d.title for d in db.query(SearchDocument).filter(SearchDocument.item_type == 'event'))
+
+    def _watch_and_sync(self):
+        result = watch_calendar(self.user_id)
+        # チャンネル作成直後のsyncの通知と最初の同期が終わるまで待つ
+        self._wait_for(lambda: any(state == 'sync' for state, _ in _WebhookHandler.statuses)
+                       and self._channel().sync_token is not None and not calendar_watch._resync_state)
+        return result
+
+    def test_watch_runs_initial_sync(self):
+        """チャンネルを作成すると最初の同期で既存のイベントが検索インデックスに入る"""
+        result = self._watch_and_sync()
+
+        self.assertIn(result['channel_id'], self.store.channels)
+        self.assertGreater(result['expiration'], datetime.now())
+        self.assertEqual(self._indexed_titles(), ["Seed event 0", "Seed event 1", "Seed event 2"])
+        self.assertIn((self.user_id, 'primary'), self.invalidated)
+
+    def test_notification_triggers_incremental_resync(self):
+        """変更の通知を受けると差分だけを同期する"""
+        self._watch_and_sync()
+        self.invalidated.clear()
+
+        created = self.store.insert_event('primary', {
+            'summary': "追加されたイベント",
+            'start': {'dateTime': "2025-06-05T10:00:00Z"},
+            'end': {'dateTime': "2025-06-05T11:00:00Z"},
+        })
+        self._wait_for(lambda: "追加されたイベント" in self._indexed_titles())
+
+        self.store.delete_event('primary', created['id'])
+        self._wait_for(lambda: "追加されたイベント" not in self._indexed_titles())
+        self.assertEqual(len(self._indexed_titles()), 3)
+        self.assertIn(('exists', 200), _WebhookHandler.statuses)
+
+    def test_rejects_forged_notification(self):
+        """トークンが一致しない通知や未知のチャンネルの通知は拒否する"""
+        self._watch_and_sync()
+        channel = self._channel()
+        headers = {
+            'X-Goog-Channel-ID': channel.channel_id,
+            'X-Goog-Resource-ID': channel.resource_id,
+            'X-Goog-Resource-State': 'exists',
+            'X-Goog-Message-Number': '100',
+        }
+
+        self.assertEqual(handle_notification(dict(headers, **{'X-Goog-Channel-Token': 'forged'})), 403)
+        self.assertEqual(handle_notification(dict(headers, **{'X-Goog-Channel-ID': 'unknown'})), 404)
+        self.assertEqual(handle_notification({}), 400)
+
+    def test_duplicate_notification_is_ignored(self):
+        """処理済みのメッセージ番号の通知は同期しない"""
+        self._watch_and_sync()
+        channel = self._channel()
+        self.invalidated.clear()
+
+        headers = {
+            'X-Goog-Channel-ID': channel.channel_id,
+            'X-Goog-Channel-Token': channel.token,
+            'X-Goog-Resource-ID': channel.resource_id,
+            'X-Goog-Resource-State': 'exists',
+            'X-Goog-Message-Number': '100',
+        }
+        with patch.object(calendar_watch, '_schedule_resync') as mock_schedule:
+            self.assertEqual(handle_notification(headers), 200)
+            self.assertEqual(handle_notification(headers), 200)
+            self.assertEqual(handle_notification(dict(headers, **{'X-Goog-Message-Number': '99'})), 200)
+        mock_schedule.assert_called_once_with(self.user_id, 'primary')
+
+    def test_expired_sync_token_runs_full_sync(self):
+        """同期トークンが無効になった場合は全件を同期し直し、削除されたイベントを取り除く"""
+        self._watch_and_sync()
+        self.store.events['primary'].pop(next(iter(self.store.events['primary'])))
+        with self.Session() as db:
+            db.query(CalendarWatchChannel).update({'sync_token': '999999'})
+            db.commit()
+
+        result = calendar_watch.resync_calendar(self.user_id)
+
+        self.assertTrue(result['full_sync'])
+        self.assertEqual(len(self._indexed_titles()), 2)
+        self.assertNotEqual(self._channel().sync_token, '999999')
+
+    def test_full_sync_keeps_recurring_instances_and_other_calendars(self):
+        """全件の同期は定期的な予定をインスタンスで取得し、同期したカレンダーのイベントだけを取り除く"""
+        self.store.insert_event('primary', {
+            'summary': "週次定例",
+            'start': {'dateTime': "2025-06-02T01:00:00Z"},
+            'end': {'dateTime': "2025-06-02T02:00:00Z"},
+            'recurrence': ["RRULE:FREQ=WEEKLY;COUNT=3"],
+        })
+        self._watch_and_sync()
+        self.assertEqual(self._indexed_titles().count("週次定例"), 3)
+        with self.Session() as db:
+            db.add(SearchDocument(user_id=self.user_id, item_type='event', item_id="work_event",
+                                  title="別のカレンダーの予定", calendar_id='work'))
+            db.query(CalendarWatchChannel).update({'sync_token': None})
+            db.commit()
+
+        result = calendar_watch.resync_calendar(self.user_id)
+
+        self.assertTrue(result['full_sync'])
+        self.assertEqual(result['removed'], 0)
+        self.assertEqual(self._indexed_titles().count("週次定例"), 3)
+        self.assertIn("別のカレンダーの予定", self._indexed_titles())
+
+    def test_renew_channels(self):
+        """期限切れが近いチャンネルは作り直し、古いチャンネルは停止する"""
+        self._watch_and_sync()
+        old_channel = self._channel()
+        with self.Session() as db:
+            db.query(CalendarWatchChannel).update({'expiration': datetime.now() + timedelta(minutes=5)})
+            db.commit()
+
+        self.assertEqual(renew_channels(), [self.user_id])
+
+        new_channel = self._channel()
+        self.assertNotEqual(new_channel.channel_id, old_channel.channel_id)
+        self.assertEqual(new_channel.sync_token, old_channel.sync_token)
+        self.assertNotIn(old_channel.channel_id, self.store.channels)
+        self.assertIn(new_channel.channel_id, self.store.channels)
+
+    def test_renewal_failure_drops_expired_channel(self):
+        """更新に失敗したチャンネルは期限が切れるまで再試行し、期限が切れたら削除する"""
+        self._watch_and_sync()
+        with self.Session() as db:
+            db.query(CalendarWatchChannel).update({'expiration': datetime.now() + timedelta(minutes=5)})
+            db.commit()
+
+        with patch.object(calendar_watch, 'watch_calendar', return_value={"error": "unavailable"}):
+            self.assertEqual(renew_channels(), [])
+            self.assertIsNotNone(self._channel())
+
+            with self.Session() as db:
+                db.query(CalendarWatchChannel).update({'expiration': datetime.now() - timedelta(minutes=5)})
+                db.commit()
+            self.assertEqual(renew_channels(), [])
+        self.assertIsNone(self._channel())
+
+    def test_stop_watching(self):
+        """監視を停止するとチャンネルが削除される"""
+        result = self._watch_and_sync()
+
+        self.assertEqual(stop_watching_calendar(self.user_id)['stopped'], 1)
+        self.assertIsNone(self._channel())
+        self.assertNotIn(result['channel_id'], self.store.channels)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import sys
+import os
+import threading
+import time
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from coalesce import coalesce_calls
+
+
+class TestCoalesce(unittest.TestCase):
+    """同時に実行された同じ呼び出しをまとめる処理のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.calls = []
+        self.release = threading.Event()
+
+        @coalesce_calls
+        def list_endpoint(user_id: str, filter_status: str = "all"):
+            self.calls.append((user_id, filter_status))
+            self.release.wait(5)
+            if filter_status == "invalid":
+                raise ValueError("invalid filter")
+            return [{'user_id': user_id, 'filter_status': filter_status}]
+        self.list_endpoint = list_endpoint
+
+    def _run_concurrently(self, calls):
+        results = [None] * len(calls)
+        errors = [None] * len(calls)
+
+        def run(index, args, kwargs):
+            try:
+                results[index] = self.list_endpoint(*args, **kwargs)
+            except Exception as e:
+                errors[index] = e
+
+        threads = [threading.Thread(target=run, args=(i, args, kwargs)) for i, (args, kwargs) in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        # 全ての呼び出しが実行中または待機中になってから完了させる
+        deadline = time.monotonic() + 5
+        while sum(metrics.snapshot()['counters'].get(name, {}).get('list_endpoint', 0)
+                  for name in ('coalesce_leader_calls', 'coalesce_coalesced_calls')) < len(calls):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_identical_calls_are_coalesced(self):
+        """同じ引数の同時呼び出しは1回だけ実行され、結果を共有する（省略した引数も同一視する）"""
+        results, errors = self._run_concurrently([
+            (("user_1",), {}),
+            (("user_1", "all"), {}),
+            ((), {'user_id': "user_1", 'filter_status': "all"}),
+        ])
+
+        self.assertEqual(self.calls, [("user_1", "all")])
+        self.assertEqual(errors, [None, None, None])
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[0], results[2])
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['coalesce_leader_calls']['list_endpoint'], 1)
+        self.assertEqual(counters['coalesce_coalesced_calls']['list_endpoint'], 2)
+        self.assertEqual(metrics.snapshot()['gauges']['coalesce_in_flight'], 0)
+
+    def test_different_arguments_are_not_coalesced(self):
+        """引数が異なる呼び出しはそれぞれ実行される"""
+        self._run_concurrently([
+            (("user_1",), {}),
+            (("user_2",), {}),
+            (("user_1", "active"), {}),
+        ])
+
+        self.assertEqual(sorted(self.calls), [("user_1", "active"), ("user_1", "all"), ("user_2", "all")])
+
+    def test_exception_is_shared(self):
+        """実行中に発生した例外は待機していた呼び出しにも送出される"""
+        results, errors = self._run_concurrently([
+            (("user_1", "invalid"), {}),
+            (("user_1", "invalid"), {}),
+        ])
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+
+    def test_sequential_calls_are_not_cached(self):
+        """完了した呼び出しの結果は再利用しない"""
+        self.release.set()
+        self.list_endpoint("user_1")
+        self.list_endpoint("user_1")
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import sys
+import os
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact import compact_item, compact_items
+
+
+class TestCompact(unittest.TestCase):
+    """コンパクト表示のテストクラス"""
+
+    def test_drops_empty_fields(self):
+        """空文字とNoneのフィールドは除かれ、Falseは残る"""
+        item = {"id": "google_1", "description": "", "location": None, "completed": False}
+        self.assertEqual(compact_item(item), {"id": "google_1", "completed": False})
+
+    def test_truncates_long_description(self):
+        """長い説明文は指定文字数で切り詰められる"""
+        item = {"id": "google_1", "description": "あ" * 50}
+        result = compact_item(item, description_limit=10)
+        self.assertEqual(result["description"], "あ" * 10 + "…")
+
+    def test_keeps_error_items(self):
+        """エラー辞書はそのまま返される"""
+        items = [{"error": "authentication_required", "message": "再認証してください"}]
+        self.assertEqual(compact_items(items), items)
+
+
+if __name__ == "__main__":
+    unittest.main()
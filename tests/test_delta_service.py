@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+from datetime import datetime, timezone
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+from delta_service import get_todos_changed_since, get_events_changed_since
+from models import Base, GoogleCredentials, SearchDocument
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+OLD = "2025-01-01T00:00:00Z"
+
+
+class TestDeltaService(unittest.TestCase):
+    """変更差分の取得のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=3, seed_events=3)
+        # シードしたアイテムは古い更新日時にする
+        for item in list(self.store.tasks['default'].values()) + list(self.store.events['primary'].values()):
+            item['updated'] = OLD
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('delta_service.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        self.since = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        google_api.clear_negative_cache()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def test_todos_changed_and_deleted(self):
+        """sinceより後に作成・更新・削除されたTODOだけを返す"""
+        self.assertEqual(get_todos_changed_since(self.user_id, self.since)['changed'], [])
+
+        seeded = list(self.store.tasks['default'])
+        created = self.store.insert_task('default', {'title': "新しいタスク"})
+        self.store.delete_task('default', seeded[0])
+
+        result = get_todos_changed_since(self.user_id, self.since)
+
+        self.assertEqual([todo['title'] for todo in result['changed']], ["新しいタスク"])
+        self.assertEqual(result['deleted'], [{'id': f"google_{seeded[0]}", 'google_task_id': seeded[0]}])
+        # 変更は検索インデックスにも反映する
+        with self.Session() as db:
+            indexed = {document.item_id for document in db.query(SearchDocument).filter(SearchDocument.item_type == 'todo')}
+        self.assertEqual(indexed, {created['id']})
+
+    def test_events_changed_and_deleted(self):
+        """sinceより後に作成・更新・削除されたイベントだけを返す"""
+        seeded = list(self.store.events['primary'])
+        self.store.insert_event('primary', {
+            'summary': "新しい予定",
+            'start': {'dateTime': "2025-06-05T10:00:00+09:00"},
+            'end': {'dateTime': "2025-06-05T11:00:00+09:00"},
+        })
+        self.store.delete_event('primary', seeded[1])
+
+        result = get_events_changed_since(self.user_id, self.since)
+
+        self.assertEqual([event['title'] for event in result['changed']], ["新しい予定"])
+        self.assertEqual([item['google_event_id'] for item in result['deleted']], [seeded[1]])
+
+    def test_cursor(self):
+        """返されたカーソルで続きの差分を取得でき、変更がなければ同じ位置を返す"""
+        first = get_events_changed_since(self.user_id, self.since)
+        second = get_events_changed_since(self.user_id, cursor=first['cursor'])
+
+        self.assertEqual((second['changed'], second['deleted']), ([], []))
+        self.assertEqual(second['cursor'], first['cursor'])
+
+        self.store.insert_event('primary', {
+            'summary': "あとから追加",
+            'start': {'dateTime': "2025-06-06T10:00:00+09:00"},
+            'end': {'dateTime': "2025-06-06T11:00:00+09:00"},
+        })
+        third = get_events_changed_since(self.user_id, cursor=second['cursor'])
+        self.assertEqual([event['title'] for event in third['changed']], ["あとから追加"])
+        self.assertNotEqual(third['cursor'], second['cursor'])
+
+    def test_invalid_arguments(self):
+        """sinceもcursorもない場合や、別の種類のカーソルはエラーを返す"""
+        todo_cursor = get_todos_changed_since(self.user_id, self.since)['cursor']
+
+        self.assertIn("required", get_todos_changed_since(self.user_id)['error'])
+        self.assertIn("Invalid cursor", get_events_changed_since(self.user_id, cursor=todo_cursor)['error'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+from datetime import datetime, timezone
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import event_service
+import metrics
+from event_cache import EventWindowCache, event_window_cache
+from event_service import get_all_events, add_event, warm_event_window
+from models import Base, GoogleCredentials, SearchDocument
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+def _utc(day, hour=0):
+    return datetime(2025, 6, day, hour, tzinfo=timezone.utc)
+
+
+def _event(event_id, start, end):
+    return {'google_event_id': event_id, 'start_time': start, 'end_time': end}
+
+
+class TestEventWindowCache(unittest.TestCase):
+    """期間キャッシュのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.cache = EventWindowCache(max_windows=10, max_age_seconds=60)
+
+    def test_full_hit(self):
+        """キャッシュした期間の内側の期間は全てキャッシュから返す"""
+        self.cache.store("user_1", _utc(1), _utc(8), [
+            _event("a", _utc(2, 10), _utc(2, 11)),
+            _event("b", _utc(5, 10), _utc(5, 11)),
+        ], generation=0)
+
+        events, uncovered = self.cache.lookup("user_1", _utc(2), _utc(3))
+
+        self.assertEqual([e['google_event_id'] for e in events], ["a"])
+        self.assertEqual(uncovered, [])
+        self.assertEqual(metrics.snapshot()['counters']['event_cache_requests']['hit'], 1)
+
+    def test_partial_overlap(self):
+        """一部が重なる場合は覆われていない期間だけを返す"""
+        self.cache.store("user_1", _utc(3), _utc(5), [_event("a", _utc(4, 10), _utc(4, 11))], generation=0)
+        self.cache.store("user_1", _utc(7), _utc(9), [_event("b", _utc(8, 10), _utc(8, 11))], generation=0)
+
+        events, uncovered = self.cache.lookup("user_1", _utc(1), _utc(10))
+
+        self.assertEqual(sorted(e['google_event_id'] for e in events), ["a", "b"])
+        self.assertEqual(uncovered, [(_utc(1), _utc(3)), (_utc(5), _utc(7)), (_utc(9), _utc(10))])
+        self.assertEqual(metrics.snapshot()['counters']['event_cache_requests']['partial'], 1)
+
+    def test_other_user_is_miss(self):
+        """他のユーザーのキャッシュは使わない"""
+        self.cache.store("user_1", _utc(1), _utc(8), [], generation=0)
+
+        events, uncovered = self.cache.lookup("user_2", _utc(2), _utc(3))
+
+        self.assertEqual(events, [])
+        self.assertEqual(uncovered, [(_utc(2), _utc(3))])
+
+    def test_invalidate_discards_in_flight_store(self):
+        """取得中に無効化された場合は取得した結果を保存しない"""
+        generation = self.cache.generation("user_1")
+        self.cache.invalidate("user_1")
+        self.cache.store("user_1", _utc(1), _utc(8), [], generation)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_generations_are_bounded(self):
+        """世代番号は上限までのユーザーだけ保持し、削除したユーザーの取得中の結果も保存しない"""
+        cache = EventWindowCache(max_windows=10, max_age_seconds=60, max_generations=2)
+        generation = cache.generation("user_1")
+        for user_id in ("user_1", "user_2", "user_3"):
+            cache.invalidate(user_id)
+        cache.store("user_1", _utc(1), _utc(8), [], generation)
+
+        self.assertEqual(len(cache._generations), 2)
+        self.assertEqual(len(cache), 0)
+        cache.store("user_1", _utc(1), _utc(8), [], cache.generation("user_1"))
+        self.assertEqual(len(cache), 1)
+
+    def test_expired_window(self):
+        """有効期間を過ぎた期間は使わない"""
+        self.cache.store("user_1", _utc(1), _utc(8), [], generation=0)
+
+        with patch('event_cache.time.monotonic', return_value=10 ** 9):
+            _, uncovered = self.cache.lookup("user_1", _utc(2), _utc(3))
+
+        self.assertEqual(uncovered, [(_utc(2), _utc(3))])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        """上限を超えた場合は最近使われていない期間から削除する"""
+        cache = EventWindowCache(max_windows=2, max_age_seconds=60)
+        cache.store("user_1", _utc(1), _utc(2), [], generation=0)
+        cache.store("user_1", _utc(3), _utc(4), [], generation=0)
+        cache.lookup("user_1", _utc(1), _utc(2))
+        cache.store("user_1", _utc(5), _utc(6), [], generation=0)
+
+        self.assertEqual(cache.lookup("user_1", _utc(1), _utc(2))[1], [])
+        self.assertEqual(cache.lookup("user_1", _utc(3), _utc(4))[1], [(_utc(3), _utc(4))])
+
+
+class TestGetAllEventsCache(unittest.TestCase):
+    """get_all_eventsの期間キャッシュのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=0, seed_events=0)
+        for day in range(1, 11):
+            self.store.insert_event('primary', {
+                'summary': f"イベント {day}",
+                'start': {'dateTime': f"2025-06-{day:02d}T10:00:00Z"},
+                'end': {'dateTime': f"2025-06-{day:02d}T11:00:00Z"},
+            })
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.fetched = []
+        list_window_events = event_service._list_window_events
+
+        def recording_list_window_events(calendar_service, user_id, start, end):
+            self.fetched.append((start, end))
+            return list_window_events(calendar_service, user_id, start, end)
+        self.patches = [
+            patch('event_service.get_db', get_db),
+            patch('event_service._list_window_events', recording_list_window_events),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        event_window_cache.clear()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        event_window_cache.clear()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def _titles(self, start, end):
+        return [e['title'] for e in get_all_events(self.user_id, start, end)]
+
+    def test_narrower_range_is_served_from_cache(self):
+        """取得済みの期間の内側の期間はGoogleに問い合わせない"""
+        self.assertEqual(len(self._titles(_utc(1), _utc(8))), 7)
+
+        self.assertEqual(self._titles(_utc(3), _utc(5)), ["イベント 3", "イベント 4"])
+        self.assertEqual(self.fetched, [(_utc(1), _utc(8))])
+
+    def test_wider_range_fetches_only_uncovered(self):
+        """取得済みの期間を含む広い期間では覆われていない部分だけを取得する"""
+        self._titles(_utc(3), _utc(5))
+
+        titles = self._titles(_utc(2), _utc(7))
+
+        self.assertEqual(titles, [f"イベント {day}" for day in range(2, 7)])
+        self.assertEqual(self.fetched, [(_utc(3), _utc(5)), (_utc(2), _utc(3)), (_utc(5), _utc(7))])
+
+    def test_naive_datetime_uses_local_timezone(self):
+        """naive datetimeはローカルタイムゾーンとしてキャッシュを照合する"""
+        self._titles(_utc(1), _utc(8))
+
+        titles = self._titles(datetime(2025, 6, 3, 9), datetime(2025, 6, 3, 21))
+
+        self.assertEqual(titles, ["イベント 3"])
+        self.assertEqual(len(self.fetched), 1)
+
+    def test_result_is_limited(self):
+        """キャッシュを使っても返す件数は従来どおり上限までにする"""
+        self.assertEqual(len(self._titles(_utc(1), _utc(30))), 10)
+        self.store.insert_event('primary', {
+            'summary': "追加のイベント",
+            'start': {'dateTime': "2025-06-20T10:00:00Z"},
+            'end': {'dateTime': "2025-06-20T11:00:00Z"},
+        })
+        event_window_cache.invalidate(self.user_id)
+
+        self.assertEqual(len(self._titles(_utc(1), _utc(30))), event_service.EVENT_LIST_LIMIT)
+
+    def test_wide_range_is_not_filled(self):
+        """覆われていない期間が上限より長い場合は、キャッシュを埋めずに上限件数だけを1回で取得する"""
+        with patch.object(event_service, 'EVENT_CACHE_MAX_FILL_DAYS', 3):
+            titles = self._titles(_utc(1), _utc(9))
+            self.assertEqual(self.fetched, [])
+            self.assertEqual(len(event_window_cache), 0)
+
+            self._titles(_utc(3), _utc(5))
+            self._titles(_utc(2), _utc(6))
+
+        self.assertEqual(titles, [f"イベント {day}" for day in range(1, 9)])
+        self.assertEqual(self.fetched, [(_utc(3), _utc(5)), (_utc(2), _utc(3)), (_utc(5), _utc(6))])
+
+    def test_add_event_invalidates_cache(self):
+        """イベントを追加するとキャッシュを破棄して次の取得に反映する"""
+        self._titles(_utc(1), _utc(8))
+
+        add_event(self.user_id, "新しいイベント", datetime(2025, 6, 4, 21), datetime(2025, 6, 4, 22))
+        titles = self._titles(_utc(4), _utc(5))
+
+        self.assertIn("新しいイベント", titles)
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_deleted_event_is_removed_from_index(self):
+        """取得し直した期間にないイベントは検索インデックスから取り除き、期間の外のイベントは残す"""
+        self._titles(_utc(1), _utc(8))
+        deleted = next(event_id for event_id, event in self.store.events['primary'].items()
+                       if event['summary'] == "イベント 3")
+        self.store.delete_event('primary', deleted)
+        event_window_cache.invalidate(self.user_id)
+
+        self._titles(_utc(2), _utc(5))
+
+        with self.Session() as db:
+            titles = sorted(d.title for d in db.query(SearchDocument).filter(SearchDocument.item_type == 'event'))
+        self.assertEqual(titles, sorted(f"イベント {day}" for day in range(1, 8) if day != 3))
+
+    def test_warm_event_window(self):
+        """先読みした期間はヒット率に数えずにキャッシュに入り、次の取得はGoogleに問い合わせない"""
+        metrics.reset()
+        self.assertEqual(warm_event_window(self.user_id, _utc(1), _utc(8)), 1)
+        self.assertEqual(warm_event_window(self.user_id, _utc(2), _utc(3)), 0)
+
+        self.assertEqual(self._titles(_utc(2), _utc(3)), ["イベント 2"])
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual(metrics.snapshot()['counters']['event_cache_requests'], {'hit': 1})
+
+    def test_open_ended_range_is_not_cached(self):
+        """終了日時を指定しない取得はキャッシュを使わない"""
+        get_all_events(self.user_id, _utc(1))
+        get_all_events(self.user_id, _utc(1))
+
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(len(event_window_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
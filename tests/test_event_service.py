@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timezone, timedelta, time
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_service import _parse_rfc3339, _create_event_dict, _compute_free_slots, find_free_slots, LOCAL_TZ
+
+
+def _jst(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 6, day, hour, minute, tzinfo=LOCAL_TZ)
+
+
+class TestEventService(unittest.TestCase):
+    """イベントサービスのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.user_id = "test_user"
+        self.google_event = {
+            'id': 'event_1',
+            'summary': 'テストイベント',
+            'description': 'テスト用のイベント説明',
+            'location': 'テスト会場',
+            'start': {'dateTime': '2025-06-05T10:00:00+09:00'},
+            'end': {'dateTime': '2025-06-05T01:30:00Z'},
+            'created': '2025-06-01T00:00:00.000Z',
+        }
+
+    def test_parse_rfc3339(self):
+        """'Z'表記とオフセット表記の両方を解析できる"""
+        self.assertEqual(_parse_rfc3339('2025-06-05T01:00:00Z'),
+                         datetime(2025, 6, 5, 1, 0, tzinfo=timezone.utc))
+        self.assertEqual(_parse_rfc3339('2025-06-05T10:00:00+09:00'),
+                         datetime(2025, 6, 5, 10, 0, tzinfo=timezone(timedelta(hours=9))))
+        self.assertIsNone(_parse_rfc3339(None))
+        self.assertIsNone(_parse_rfc3339(''))
+
+    def test_create_event_dict(self):
+        """Google CalendarイベントからEvent辞書を作成する"""
+        result = _create_event_dict(self.google_event, self.user_id)
+
+        self.assertEqual(result['id'], 'google_event_1')
+        self.assertEqual(result['google_event_id'], 'event_1')
+        self.assertEqual(result['title'], 'テストイベント')
+        self.assertEqual(result['start_time'], datetime(2025, 6, 5, 1, 0, tzinfo=timezone.utc))
+        self.assertEqual(result['end_time'], datetime(2025, 6, 5, 1, 30, tzinfo=timezone.utc))
+        self.assertEqual(result['created_at'], datetime(2025, 6, 1, tzinfo=timezone.utc))
+        self.assertEqual(result['source'], 'google_calendar')
+
+    def test_create_event_dict_all_day(self):
+        """終日イベント（dateのみ）は開始・終了時刻がNoneになる"""
+        self.google_event['start'] = {'date': '2025-06-05'}
+        self.google_event['end'] = {'date': '2025-06-06'}
+        del self.google_event['created']
+
+        result = _create_event_dict(self.google_event, self.user_id)
+
+        self.assertIsNone(result['start_time'])
+        self.assertIsNone(result['end_time'])
+        self.assertIsNone(result['created_at'])
+
+    def test_compute_free_slots(self):
+        """重なる予定を併合し、勤務時間内の空き時間を返す"""
+        busy = [
+            (_jst(2, 10), _jst(2, 11)),
+            (_jst(2, 10, 30), _jst(2, 12)),  # 前の予定と重なる
+            (_jst(2, 12), _jst(2, 12, 15)),  # 隣接する予定
+            (_jst(2, 17, 45), _jst(2, 19)),  # 勤務時間をまたぐ予定
+        ]
+        slots = _compute_free_slots(
+            busy, _jst(2, 0), _jst(3, 0), time(9, 0), time(18, 0), timedelta(minutes=30)
+        )
+        self.assertEqual(slots, [
+            (_jst(2, 9), _jst(2, 10)),
+            (_jst(2, 12, 15), _jst(2, 17, 45)),
+        ])
+
+    def test_compute_free_slots_min_duration_and_weekends(self):
+        """最小時間未満の空きと週末は除外される"""
+        busy = [(_jst(6, 9, 20), _jst(6, 18))]  # 2025-06-06は金曜日
+        slots = _compute_free_slots(
+            busy, _jst(6, 0), _jst(9, 0), time(9, 0), time(18, 0), timedelta(minutes=30)
+        )
+        self.assertEqual(slots, [])
+
+        slots = _compute_free_slots(
+            busy, _jst(6, 0), _jst(8, 0), time(9, 0), time(18, 0), timedelta(minutes=30),
+            include_weekends=True
+        )
+        self.assertEqual(slots, [(_jst(7, 9), _jst(7, 18))])
+
+    @patch('event_service.get_db')
+    @patch('event_service.get_google_calendar_service')
+    def test_find_free_slots(self, mock_get_service, mock_get_db):
+        """freebusy().queryの結果から空き時間を返す"""
+        mock_service = MagicMock()
+        mock_service.freebusy().query().execute.return_value = {
+            'calendars': {
+                'primary': {'busy': [{'start': '2025-06-02T01:00:00Z', 'end': '2025-06-02T08:00:00Z'}]},
+                'work': {'busy': [], 'errors': [{'reason': 'notFound'}]},
+            }
+        }
+        mock_get_service.return_value = mock_service
+
+        result = find_free_slots(
+            self.user_id, datetime(2025, 6, 2), datetime(2025, 6, 3), calendar_ids=['primary', 'work']
+        )
+
+        self.assertEqual(result, [
+            {'start_time': _jst(2, 9), 'end_time': _jst(2, 10), 'duration_minutes': 60},
+            {'start_time': _jst(2, 17), 'end_time': _jst(2, 18), 'duration_minutes': 60},
+        ])
+        body = mock_service.freebusy().query.call_args.kwargs['body']
+        self.assertEqual(body['items'], [{'id': 'primary'}, {'id': 'work'}])
+        self.assertEqual(body['timeMin'], '2025-06-01T15:00:00Z')
+
+    def test_find_free_slots_invalid_working_hours(self):
+        """勤務時間の指定が不正な場合はエラーを返す"""
+        result = find_free_slots(
+            self.user_id, datetime(2025, 6, 2), datetime(2025, 6, 3),
+            working_hours_start="18:00", working_hours_end="09:00"
+        )
+        self.assertIn("error", result[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
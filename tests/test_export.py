@@ -0,0 +1,181 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import shutil
+import tempfile
+import importlib.util
+from datetime import datetime, timedelta, timezone
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import export
+from export import run_export, CHECKPOINT_FILE
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestExport(unittest.TestCase):
+    """TODOとイベントの一括エクスポートのテストクラス"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Google APIのスタブサーバーを起動する（TODOは3ページ、イベントは2ページ）"""
+        cls.store = FakeGoogleStore(seed_tasks=230, seed_events=300)
+        cls.server = start_fake_google(store=cls.store)
+        cls.endpoints = endpoint_env(cls.server)
+        # 終わりのない定期的な予定に備えて、イベントは期間の終わりを指定してエクスポートする
+        cls.end = datetime.now(timezone.utc) + timedelta(days=90)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """テストの前準備"""
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id="user_a", token_json=_token_json()))
+            db.add(GoogleCredentials(user_id="user/b", token_json=_token_json()))
+            db.add(GoogleCredentials(user_id="revoked_user", token_json=_token_json(), revoked=True))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('export.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', self.endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', self.endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        google_api.clear_negative_cache()
+        self.engine.dispose()
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def _read_ndjson(self, kind, user_id):
+        with open(os.path.join(self.output, kind, f"{user_id}.ndjson"), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_export_all_users(self):
+        """失効していない全てのユーザーのTODOとイベントをNDJSONに書き込む"""
+        progress = []
+        summary = run_export(self.output, end=self.end, on_progress=lambda *args: progress.append(args))
+
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['count'], 2 * (230 + 300))
+        self.assertEqual({(r['user_id'], r['kind']) for r in summary['results']},
+                         {(u, k) for u in ("user_a", "user/b") for k in ("todos", "events")})
+        todos = self._read_ndjson('todos', "user_a")
+        self.assertEqual(len({todo['google_task_id'] for todo in todos}), 230)
+        events = self._read_ndjson('events', "user%2Fb")
+        self.assertEqual(len(events), 300)
+        self.assertEqual(events[0]['user_id'], "user/b")
+        self.assertTrue(events[0]['start_time'].endswith("+00:00"))
+        # ページを書き込むたびに進捗を通知する
+        self.assertEqual([count for user_id, kind, count, _ in progress if (user_id, kind) == ("user_a", "todos")], [100, 200, 230])
+
+    def test_resume_from_checkpoint(self):
+        """中断したエクスポートは、チェックポイントのページから重複なく続きを書き込み、完了したものは飛ばす"""
+        def interrupt(user_id, kind, count, pages):
+            if kind == 'todos' and pages == 2:
+                raise RuntimeError("interrupted")
+
+        first = run_export(self.output, ["user_a"], end=self.end, on_progress=interrupt)
+        self.assertEqual(first['errors'], 1)
+        with open(os.path.join(self.output, CHECKPOINT_FILE), encoding='utf-8') as f:
+            entries = json.load(f)['entries']
+        self.assertFalse(entries['todos/user_a'].get('done'))
+        self.assertTrue(entries['events/user_a']['done'])
+
+        with patch.object(export, '_iter_window_event_pages') as mock_events:
+            second = run_export(self.output, ["user_a"], end=self.end)
+
+        self.assertEqual(second['errors'], 0)
+        mock_events.assert_not_called()
+        results = {r['kind']: r for r in second['results']}
+        self.assertTrue(results['events']['skipped'])
+        # 2ページ目から取得し直す
+        self.assertEqual(results['todos']['pages'], 2)
+        todos = self._read_ndjson('todos', "user_a")
+        self.assertEqual(len(todos), 230)
+        self.assertEqual(len({todo['google_task_id'] for todo in todos}), 230)
+
+    def test_checkpoint_options_mismatch(self):
+        """別の条件で書かれたチェックポイントからは再開せず、--restartで最初からやり直せる"""
+        run_export(self.output, ["user_a"], kinds=['todos'])
+
+        with self.assertRaises(ValueError):
+            run_export(self.output, ["user_a"], kinds=['todos'], start=export.datetime(2025, 1, 1))
+        summary = run_export(self.output, ["user_a"], kinds=['todos'], start=export.datetime(2025, 1, 1), restart=True)
+        self.assertFalse(summary['results'][0].get('skipped'))
+
+    def test_export_hidden_tasks_and_all_day_events(self):
+        """非表示の完了済みタスクと終日のイベントもエクスポートする"""
+        task = self.store.insert_task('default', {'title': "Cleared task", 'status': 'completed', 'hidden': True})
+        day = (datetime.now(timezone.utc) + timedelta(days=1)).date()
+        event = self.store.insert_event('primary', {
+            'summary': "Holiday",
+            'start': {'date': day.isoformat()},
+            'end': {'date': (day + timedelta(days=1)).isoformat()},
+        })
+        try:
+            summary = run_export(self.output, ["user_a"], end=self.end)
+        finally:
+            self.store.delete_task('default', task['id'])
+            self.store.delete_event('primary', event['id'])
+
+        self.assertEqual(summary['errors'], 0)
+        todo = next(todo for todo in self._read_ndjson('todos', "user_a") if todo['title'] == "Cleared task")
+        self.assertEqual((todo['completed'], todo['hidden']), (True, True))
+        holiday = next(event for event in self._read_ndjson('events', "user_a") if event['title'] == "Holiday")
+        self.assertTrue(holiday['all_day'])
+        self.assertEqual(holiday['start_time'], f"{day.isoformat()}T00:00:00+00:00")
+
+    def test_events_require_end(self):
+        """終わりを指定しないイベントのエクスポートはエラーにする"""
+        with self.assertRaises(ValueError):
+            run_export(self.output, ["user_a"])
+        run_export(self.output, ["user_a"], kinds=['todos'])
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_export_parquet(self):
+        """Parquetにはページごとに行グループとして書き込む"""
+        import pyarrow.parquet as pq
+
+        summary = run_export(self.output, ["user_a"], fmt='parquet', end=self.end)
+
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(pq.read_table(os.path.join(self.output, 'todos', "user_a.parquet")).num_rows, 230)
+        self.assertEqual(pq.read_table(os.path.join(self.output, 'events', "user_a.parquet")).num_rows, 300)
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow'), "pyarrow is installed")
+    def test_parquet_requires_pyarrow(self):
+        """pyarrowがない場合はエクスポートを始める前にエラーにする"""
+        with self.assertRaises(RuntimeError):
+            run_export(self.output, ["user_a"], fmt='parquet', end=self.end)
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'todos')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from googleapiclient import discovery_cache
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+import google_api
+import models
+from google_api import (
+    get_google_tasks_service, get_google_calendar_service, warm_up_services,
+    get_google_credentials, save_google_credentials, find_expiring_credentials, AuthenticationRequiredException
+)
+from models import Base, GoogleCredentials
+
+
+def _token_json(token: str = "test_token", expiry: str = None) -> str:
+    token_data = {
+        "token": token,
+        "refresh_token": "test_refresh_token",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "test_client_id",
+        "client_secret": "test_client_secret",
+        "scopes": ["https://www.googleapis.com/auth/tasks", "https://www.googleapis.com/auth/calendar"],
+    }
+    if expiry:
+        token_data["expiry"] = expiry
+    return json.dumps(token_data)
+
+
+class TestGoogleApi(unittest.TestCase):
+    """google_apiモジュールのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        # テスト用のインメモリDB
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.user_id = "test_user"
+        self.db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+        self.db.commit()
+        google_api._prebuilt_services.clear()
+        google_api.clear_negative_cache()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        google_api._prebuilt_services.clear()
+        google_api.clear_negative_cache()
+        self.db.close()
+        self.engine.dispose()
+
+    def test_discovery_document_is_cached(self):
+        """ディスカバリードキュメントは一度だけ読み込まれる"""
+        google_api._discovery_documents.clear()
+        with patch.object(discovery_cache, 'get_static_doc', wraps=discovery_cache.get_static_doc) as mock_get:
+            get_google_tasks_service(self.user_id, self.db)
+            get_google_tasks_service(self.user_id, self.db)
+        mock_get.assert_called_once_with('tasks', 'v1')
+
+    def test_service_without_credentials(self):
+        """クレデンシャルがないユーザーはNoneを返す"""
+        self.assertIsNone(get_google_calendar_service("unknown_user", self.db))
+
+    def test_warm_up_prebuilds_services(self):
+        """ウォームアップで作成したサービスは一度だけ払い出される"""
+        warmed = warm_up_services(self.db, recent_users=5)
+        self.assertEqual(warmed, [self.user_id])
+
+        prebuilt = google_api._prebuilt_services[('tasks', self.user_id, 'test_token')]
+        self.assertIs(get_google_tasks_service(self.user_id, self.db), prebuilt)
+        self.assertIsNot(get_google_tasks_service(self.user_id, self.db), prebuilt)
+
+    def test_warm_up_skips_stale_token(self):
+        """トークンが変わった場合は事前作成したサービスを使わない"""
+        warm_up_services(self.db, recent_users=5)
+        prebuilt = google_api._prebuilt_services[('calendar', self.user_id, 'test_token')]
+
+        record = self.db.query(GoogleCredentials).filter(GoogleCredentials.user_id == self.user_id).first()
+        record.token_json = _token_json("new_token")
+        self.db.commit()
+
+        self.assertIsNot(get_google_calendar_service(self.user_id, self.db), prebuilt)
+
+
+    def test_missing_credentials_are_cached(self):
+        """クレデンシャルがないユーザーは一定時間DBを読まずにNoneを返し、保存されたら消去される"""
+        self.assertIsNone(get_google_credentials("new_user", self.db))
+        self.db.add(GoogleCredentials(user_id="new_user", token_json=_token_json()))
+        self.db.commit()
+        self.assertIsNone(get_google_credentials("new_user", self.db))
+
+        save_google_credentials("new_user", Credentials(
+            token="saved_token", refresh_token="test_refresh_token",
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id="test_client_id", client_secret="test_client_secret",
+            scopes=["https://www.googleapis.com/auth/tasks"]
+        ), self.db)
+        self.assertEqual(get_google_credentials("new_user", self.db).token, "saved_token")
+
+    def test_revoked_credentials_are_cached(self):
+        """更新に失敗した（失効した）クレデンシャルは、一定時間OAuthの更新を試みずに失敗する"""
+        record = self.db.query(GoogleCredentials).filter(GoogleCredentials.user_id == self.user_id).first()
+        expired = (datetime.utcnow() - timedelta(hours=1)).isoformat() + "Z"
+        record.token_json = _token_json(expiry=expired)
+        self.db.commit()
+
+        with patch.object(Credentials, 'refresh', side_effect=RefreshError("invalid_grant")) as mock_refresh:
+            for _ in range(3):
+                with self.assertRaises(AuthenticationRequiredException):
+                    get_google_credentials(self.user_id, self.db)
+        mock_refresh.assert_called_once()
+
+    def test_negative_cache_expires(self):
+        """ネガティブキャッシュは有効期間が過ぎると再びDBを読む"""
+        with patch.object(google_api, 'CREDENTIALS_NEGATIVE_CACHE_TTL_SECONDS', 0.01):
+            self.assertIsNone(get_google_credentials("new_user", self.db))
+            self.db.add(GoogleCredentials(user_id="new_user", token_json=_token_json()))
+            self.db.commit()
+            time.sleep(0.02)
+            self.assertIsNotNone(get_google_credentials("new_user", self.db))
+
+    def test_revoked_flag_is_stored(self):
+        """更新に失敗したクレデンシャルは失効フラグを保存し、キャッシュが切れてもtoken_jsonを読まずに失敗する"""
+        record = self.db.query(GoogleCredentials).filter(GoogleCredentials.user_id == self.user_id).first()
+        record.token_json = _token_json(expiry=(datetime.utcnow() - timedelta(hours=1)).isoformat() + "Z")
+        self.db.commit()
+
+        with patch.object(Credentials, 'refresh', side_effect=RefreshError("invalid_grant")):
+            with self.assertRaises(AuthenticationRequiredException):
+                get_google_credentials(self.user_id, self.db)
+        self.assertTrue(record.revoked)
+
+        google_api.clear_negative_cache()
+        with patch('google_api.json.loads') as mock_loads, patch.object(Credentials, 'refresh') as mock_refresh:
+            with self.assertRaises(AuthenticationRequiredException):
+                get_google_credentials(self.user_id, self.db)
+        mock_loads.assert_not_called()
+        mock_refresh.assert_not_called()
+        self.assertEqual(warm_up_services(self.db, recent_users=5), [])
+
+    def test_transient_refresh_error_is_not_stored(self):
+        """一時的なRefreshErrorでは失効フラグを保存せず、次の呼び出しで再び更新を試みる"""
+        record = self.db.query(GoogleCredentials).filter(GoogleCredentials.user_id == self.user_id).first()
+        record.token_json = _token_json(expiry=(datetime.utcnow() - timedelta(hours=1)).isoformat() + "Z")
+        self.db.commit()
+
+        errors = [RefreshError("Internal Server Error", retryable=True), RefreshError("503 Service Unavailable")]
+        with patch.object(Credentials, 'refresh', side_effect=errors) as mock_refresh:
+            self.assertIsNone(get_google_credentials(self.user_id, self.db))
+            self.assertIsNone(get_google_credentials(self.user_id, self.db))
+
+        self.assertEqual(mock_refresh.call_count, 2)
+        self.db.refresh(record)
+        self.assertFalse(record.revoked)
+
+    def test_saved_token_metadata(self):
+        """保存したトークンの有効期限とスコープを列にも保存し、失効フラグを解除する"""
+        record = self.db.query(GoogleCredentials).filter(GoogleCredentials.user_id == self.user_id).first()
+        record.revoked = True
+        self.db.commit()
+
+        save_google_credentials(self.user_id, Credentials(
+            token="saved_token", refresh_token="test_refresh_token",
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id="test_client_id", client_secret="test_client_secret",
+            scopes=["https://www.googleapis.com/auth/tasks", "https://www.googleapis.com/auth/calendar"],
+            expiry=datetime(2030, 1, 1, 12, 0)
+        ), self.db)
+
+        self.assertEqual(record.expiry, datetime(2030, 1, 1, 12, 0))
+        self.assertEqual(record.scopes, "https://www.googleapis.com/auth/tasks https://www.googleapis.com/auth/calendar")
+        self.assertFalse(record.revoked)
+
+    def test_find_expiring_credentials(self):
+        """有効期限が近い失効していないユーザーを期限の早い順に返す"""
+        now = datetime.utcnow()
+        for user_id, expiry, revoked in (("soon", now + timedelta(minutes=2), False),
+                                         ("expired", now - timedelta(minutes=5), False),
+                                         ("later", now + timedelta(hours=2), False),
+                                         ("revoked", now - timedelta(minutes=1), True)):
+            self.db.add(GoogleCredentials(user_id=user_id, token_json=_token_json(), expiry=expiry, revoked=revoked))
+        self.db.commit()
+
+        self.assertEqual(find_expiring_credentials(self.db, within_seconds=300), ["expired", "soon"])
+
+
+class TestReplicaRouting(unittest.TestCase):
+    """クレデンシャルの読み取りをレプリカに送るテストクラス（プライマリとレプリカは別々のSQLiteファイル）"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.primary_engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir, 'primary.db')}")
+        self.replica_engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir, 'replica.db')}")
+        for engine in (self.primary_engine, self.replica_engine):
+            Base.metadata.create_all(engine)
+        self.Primary = sessionmaker(bind=self.primary_engine)
+        self.Replica = sessionmaker(bind=self.replica_engine)
+        self.user_id = "test_user"
+        # レプリケーション済みの状態から始める
+        self._write(self.Primary, _token_json("replicated_token"))
+        self._write(self.Replica, _token_json("replicated_token"))
+        self.db = self.Primary()
+        self.patches = [patch.object(models, 'ReplicaSessionLocal', self.Replica)]
+        for p in self.patches:
+            p.start()
+        google_api._primary_pins.clear()
+        google_api._prebuilt_services.clear()
+        google_api.clear_negative_cache()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        google_api._primary_pins.clear()
+        google_api.clear_negative_cache()
+        self.db.close()
+        self.primary_engine.dispose()
+        self.replica_engine.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _write(self, Session, token_json: str, user_id: str = None, **columns):
+        with Session() as db:
+            user_id = user_id or self.user_id
+            record = db.query(GoogleCredentials).filter(GoogleCredentials.user_id == user_id).first()
+            if record is None:
+                record = GoogleCredentials(user_id=user_id, token_json=token_json)
+                db.add(record)
+            record.token_json = token_json
+            for key, value in columns.items():
+                setattr(record, key, value)
+            db.commit()
+
+    def test_reads_from_replica(self):
+        """書き込みのないユーザーのクレデンシャルはレプリカから読む"""
+        self._write(self.Primary, _token_json("primary_only_token"))
+
+        with patch.object(self.db, 'query', wraps=self.db.query) as mock_query:
+            creds = get_google_credentials(self.user_id, self.db)
+
+        self.assertEqual(creds.token, "replicated_token")
+        mock_query.assert_not_called()
+
+    def test_missing_on_replica_falls_back_to_primary(self):
+        """レプリカにまだない（作成直後の）ユーザーはプライマリから読む"""
+        self._write(self.Primary, _token_json("new_token"), user_id="new_user")
+
+        self.assertEqual(get_google_credentials("new_user", self.db).token, "new_token")
+
+    def test_refresh_writes_primary_and_reads_own_write(self):
+        """期限切れのトークンの更新はプライマリに書き込み、その後はレプリカが遅れていても更新後のトークンを読む"""
+        expired = datetime.utcnow() - timedelta(hours=1)
+        stale = _token_json("expired_token", expiry=expired.isoformat() + "Z")
+        self._write(self.Primary, stale, expiry=expired)
+        self._write(self.Replica, stale, expiry=expired)
+
+        def refresh(creds, request):
+            creds.token = "refreshed_token"
+            creds.expiry = datetime.utcnow() + timedelta(hours=1)
+        with patch.object(Credentials, 'refresh', autospec=True, side_effect=refresh) as mock_refresh:
+            self.assertEqual(get_google_credentials(self.user_id, self.db).token, "refreshed_token")
+            self.assertEqual(get_google_credentials(self.user_id, self.db).token, "refreshed_token")
+
+        mock_refresh.assert_called_once()
+        with self.Primary() as db:
+            self.assertEqual(json.loads(db.query(GoogleCredentials).first().token_json)['token'], "refreshed_token")
+        with self.Replica() as db:
+            self.assertEqual(json.loads(db.query(GoogleCredentials).first().token_json)['token'], "expired_token")
+
+    def test_stale_replica_checks_primary_before_refresh(self):
+        """レプリカのトークンが期限切れでも、他のプロセスがプライマリで更新済みなら更新しない"""
+        expired = datetime.utcnow() - timedelta(hours=1)
+        fresh = datetime.utcnow() + timedelta(hours=1)
+        self._write(self.Replica, _token_json("expired_token", expiry=expired.isoformat() + "Z"), expiry=expired)
+        self._write(self.Primary, _token_json("fresh_token", expiry=fresh.isoformat() + "Z"), expiry=fresh)
+
+        with patch.object(Credentials, 'refresh') as mock_refresh:
+            creds = get_google_credentials(self.user_id, self.db)
+
+        self.assertEqual(creds.token, "fresh_token")
+        mock_refresh.assert_not_called()
+
+    def test_save_reads_own_write(self):
+        """保存したユーザーのクレデンシャルは、レプリカに反映されるまでプライマリから読む"""
+        save_google_credentials(self.user_id, Credentials(
+            token="saved_token", refresh_token="test_refresh_token",
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id="test_client_id", client_secret="test_client_secret",
+            scopes=["https://www.googleapis.com/auth/tasks"]
+        ), self.db)
+
+        self.assertEqual(get_google_credentials(self.user_id, self.db).token, "saved_token")
+        with patch.object(google_api, 'READ_YOUR_WRITES_SECONDS', 0):
+            google_api._primary_pins.clear()
+            self.assertEqual(get_google_credentials(self.user_id, self.db).token, "replicated_token")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import health
+import metrics
+import outbox
+from admission import ConcurrencyLimiter
+from health import LoopLagMonitor, check_readiness
+from models import Base, OutboxOperation
+
+
+class TestHealth(unittest.TestCase):
+    """ヘルスチェックのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.limiter = ConcurrencyLimiter('test_tool_calls', max_concurrency=2, max_queue=10, queue_timeout_seconds=1)
+        self.patches = [
+            patch('health.get_db', get_db),
+            patch.object(health, 'tool_call_limiter', self.limiter),
+            patch.object(health, 'loop_lag_monitor', LoopLagMonitor(interval=0.05)),
+            patch.object(outbox, '_last_polled_at', None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        self.engine.dispose()
+
+    def test_ready(self):
+        """劣化していない場合は準備完了で、各項目の状態を含む"""
+        metrics.increment('event_cache_requests', 'hit')
+        metrics.increment('event_cache_requests', 'miss')
+
+        ready, report = asyncio.run(check_readiness())
+
+        self.assertTrue(ready)
+        self.assertEqual((report['status'], report['reasons']), ('ok', []))
+        self.assertEqual(report['caches']['events']['hit_ratio'], 0.5)
+        self.assertIsNone(report['caches']['todos']['hit_ratio'])
+        self.assertEqual(report['limiters']['test_tool_calls']['state'], 'ok')
+        self.assertEqual(report['workers']['outbox']['pending'], 0)
+        self.assertIn('checked_out', report['db_pool'])
+
+    def test_queue_usage(self):
+        """受付制限の待ち行列が埋まりかけている場合は準備未完了になる"""
+        self.limiter.in_flight = 2
+        self.limiter._waiters.extend(object() for _ in range(8))
+
+        ready, report = asyncio.run(check_readiness())
+
+        self.assertFalse(ready)
+        self.assertEqual(report['limiters']['test_tool_calls']['state'], 'saturated')
+        self.assertIn("test_tool_calls queue 8/10", report['reasons'])
+
+    def test_outbox_lag(self):
+        """ワーカーが動いていて送信が遅れている場合だけ準備未完了になる"""
+        with self.Session() as db:
+            db.add(OutboxOperation(user_id="test_user", operation='add_todo', payload="{}",
+                                   next_attempt_at=datetime.now() - timedelta(hours=1)))
+            db.commit()
+
+        ready, report = asyncio.run(check_readiness())
+        self.assertTrue(ready)
+        self.assertEqual(report['workers']['outbox']['pending'], 1)
+
+        with patch.object(outbox, '_last_polled_at', time.monotonic()):
+            ready, report = asyncio.run(check_readiness())
+        self.assertFalse(ready)
+        self.assertTrue(report['reasons'][0].startswith("outbox lag"))
+
+    def test_db_check_timeout(self):
+        """DBの確認が時間の上限を過ぎた場合は待たずに準備未完了を返す"""
+        with patch.object(health, '_outbox', lambda: time.sleep(1) or {}), \
+                patch.object(health, 'HEALTH_CHECK_TIMEOUT_SECONDS', 0.1):
+            started = time.monotonic()
+            ready, report = asyncio.run(check_readiness())
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertFalse(ready)
+        self.assertEqual(report['reasons'], ["outbox check failed: timeout"])
+
+    def test_loop_lag(self):
+        """イベントループがブロックされた時間を遅延として記録する"""
+        async def run():
+            health.loop_lag_monitor.ensure_started()
+            await asyncio.sleep(0.1)
+            # イベントループをブロックする
+            time.sleep(0.6)
+            await asyncio.sleep(0.1)
+            return await check_readiness()
+
+        ready, report = asyncio.run(run())
+
+        self.assertFalse(ready)
+        self.assertGreaterEqual(report['event_loop_lag']['max_seconds'], 0.5)
+
+    def test_readyz_status_code(self):
+        """/readyzは劣化している場合に503を返し、/healthzは常に200を返す"""
+        import main
+
+        self.limiter._waiters.extend(object() for _ in range(10))
+        readyz = asyncio.run(main.readyz(None))
+        healthz = asyncio.run(main.healthz(None))
+
+        self.assertEqual((readyz.status_code, healthz.status_code), (503, 200))
+        self.assertEqual(json.loads(readyz.body)['status'], 'degraded')
+        self.assertEqual(json.loads(healthz.body)['limiters']['test_tool_calls']['state'], 'shedding')
+
+
+if __name__ == "__main__":
+    unittest.main()
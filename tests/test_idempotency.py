@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import idempotency
+from idempotency import run_idempotent
+from models import Base, IdempotencyKey
+
+
+class TestIdempotency(unittest.TestCase):
+    """冪等キーのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        # テスト用のインメモリDB（全ての接続で同じDBを共有する）
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        self.calls = []
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.db_patch = patch('idempotency.get_db', get_db)
+        self.db_patch.start()
+        idempotency._cache.clear()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db_patch.stop()
+        idempotency._cache.clear()
+        self.engine.dispose()
+
+    def _add_todo(self, title="テスト"):
+        self.calls.append(title)
+        return {'id': f"google_{len(self.calls)}", 'title': title, 'created_at': datetime(2025, 6, 5, 10, 0)}
+
+    def _run(self, key, title="テスト"):
+        return run_idempotent(self.user_id, key, 'add_todo', {'title': title}, lambda: self._add_todo(title))
+
+    def test_repeat_returns_first_result(self):
+        """同じキーの再実行は処理を呼ばずに最初の結果を返す"""
+        first = self._run("key-1")
+        second = self._run("key-1")
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(second, first)
+        self.assertEqual(self._run("key-2")['id'], "google_2")
+
+    def test_repeat_from_database(self):
+        """メモリ上のキャッシュがなくてもDBに保存した結果を返す"""
+        first = self._run("key-1")
+        idempotency._cache.clear()
+
+        second = self._run("key-1")
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(second['id'], first['id'])
+        self.assertEqual(second['created_at'], "2025-06-05T10:00:00")
+
+    def test_without_key(self):
+        """キーを指定しない場合は毎回実行する"""
+        self._run(None)
+        self._run(None)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_key_reused_with_different_arguments(self):
+        """異なる引数で同じキーを使うとエラーになる"""
+        self._run("key-1", "牛乳を買う")
+        result = self._run("key-1", "卵を買う")
+
+        self.assertEqual(result['error'], "idempotency_key_reused")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_error_result_is_not_stored(self):
+        """エラーの結果は保存せず、同じキーで再実行できる"""
+        error = run_idempotent(self.user_id, "key-1", 'add_todo', {'title': "テスト"},
+                               lambda: {"error": "authentication_required"})
+        self.assertEqual(error['error'], "authentication_required")
+
+        self._run("key-1")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_expired_key(self):
+        """有効期間を過ぎたキーは再実行する"""
+        self._run("key-1")
+        idempotency._cache.clear()
+        with self.Session() as db:
+            db.query(IdempotencyKey).update({'expires_at': datetime.now() - timedelta(seconds=1)})
+            db.commit()
+
+        self._run("key-1")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_in_progress_in_other_process(self):
+        """他のプロセスが実行中のキーは処理を呼ばずにエラーを返す"""
+        with self.Session() as db:
+            db.add(IdempotencyKey(
+                user_id=self.user_id, key="key-1", tool='add_todo',
+                request_hash=idempotency._request_hash('add_todo', {'title': "テスト"}),
+                created_at=datetime.now(), expires_at=datetime.now() + timedelta(hours=1)
+            ))
+            db.commit()
+
+        result = self._run("key-1")
+
+        self.assertEqual(result['error'], "idempotency_key_in_progress")
+        self.assertEqual(self.calls, [])
+
+    def test_concurrent_requests_call_once(self):
+        """同じプロセスで同時に実行された同じキーは一度だけ処理する"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_add_todo():
+            started.set()
+            release.wait(5)
+            return self._add_todo()
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(
+            run_idempotent(self.user_id, "key-1", 'add_todo', {'title': "テスト"}, slow_add_todo)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(self._run("key-1")))
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results[0], results[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
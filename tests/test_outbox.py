@@ -0,0 +1,152 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import outbox
+from outbox import enqueue_add_todo, enqueue_add_event, get_outbox_operation, drain_outbox
+from models import Base, GoogleCredentials, OutboxOperation
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestOutbox(unittest.TestCase):
+    """書き込みアウトボックスのテストクラス"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Google APIのスタブサーバーを起動する"""
+        cls.store = FakeGoogleStore(seed_tasks=0, seed_events=0)
+        cls.server = start_fake_google(store=cls.store)
+        cls.endpoints = endpoint_env(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """テストの前準備"""
+        # テスト用のインメモリDB（全ての接続で同じDBを共有する）
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('outbox.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', self.endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', self.endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        self.engine.dispose()
+
+    def test_enqueue_returns_accepted_record(self):
+        """非同期の書き込みはGoogleに送らずローカルIDで受け付ける"""
+        tasks_before = len(self.store.tasks['default'])
+        accepted = enqueue_add_todo(self.user_id, "牛乳を買う", "スーパーで")
+
+        self.assertTrue(accepted['id'].startswith('outbox_'))
+        self.assertEqual(accepted['status'], 'pending')
+        self.assertEqual(accepted['request'], {'title': "牛乳を買う", 'description': "スーパーで"})
+        self.assertEqual(len(self.store.tasks['default']), tasks_before)
+
+    def test_drain_sends_batch(self):
+        """送信待ちの操作がバッチで送信され、結果が保存される"""
+        todo = enqueue_add_todo(self.user_id, "書類を出す")
+        event = enqueue_add_event(self.user_id, "打ち合わせ", datetime(2025, 6, 5, 10, 0), location="会議室A")
+
+        counts = drain_outbox()
+
+        self.assertEqual(counts, {'claimed': 2, 'done': 2, 'pending': 0, 'failed': 0})
+        todo_status = get_outbox_operation(self.user_id, todo['id'])
+        self.assertEqual(todo_status['status'], 'done')
+        self.assertEqual(todo_status['result']['title'], "書類を出す")
+        self.assertIn(todo_status['result']['google_task_id'], self.store.tasks['default'])
+
+        event_status = get_outbox_operation(self.user_id, event['id'])
+        self.assertEqual(event_status['status'], 'done')
+        self.assertEqual(event_status['result']['google_event_id'], event['request']['event_id'])
+        self.assertEqual(event_status['result']['location'], "会議室A")
+        self.assertEqual(drain_outbox()['claimed'], 0)
+
+    def test_resend_after_event_created(self):
+        """前回の送信で作成済みのイベントは二重に作成しない"""
+        event = enqueue_add_event(self.user_id, "再送テスト", datetime(2025, 6, 6, 10, 0))
+        self.store.insert_event('primary', {
+            'id': event['request']['event_id'],
+            'summary': "再送テスト",
+            'start': {'dateTime': "2025-06-06T10:00:00"},
+            'end': {'dateTime': "2025-06-06T11:00:00"},
+        })
+
+        drain_outbox()
+
+        status = get_outbox_operation(self.user_id, event['id'])
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['result']['google_event_id'], event['request']['event_id'])
+
+    def test_retry_with_backoff(self):
+        """認証情報がない場合は失われずに再試行待ちになり、上限に達したらfailedになる"""
+        accepted = enqueue_add_todo("unknown_user", "再試行")
+
+        self.assertEqual(drain_outbox()['pending'], 1)
+        status = get_outbox_operation("unknown_user", accepted['id'])
+        self.assertEqual(status['status'], 'pending')
+        self.assertEqual(status['attempts'], 1)
+        self.assertIn("AuthenticationRequiredException", status['last_error'])
+        # 次の再試行時刻まではワーカーに取り出されない
+        self.assertEqual(drain_outbox()['claimed'], 0)
+
+        with self.Session() as db:
+            db.query(OutboxOperation).update({'next_attempt_at': datetime.now() - timedelta(seconds=1)})
+            db.commit()
+        with patch.object(outbox, 'OUTBOX_MAX_ATTEMPTS', 2):
+            self.assertEqual(drain_outbox()['failed'], 1)
+
+    def test_reclaim_expired_lease(self):
+        """送信中のまま放置された操作はリースが切れたら再送する"""
+        accepted = enqueue_add_todo(self.user_id, "リース切れ")
+        with self.Session() as db:
+            db.query(OutboxOperation).update({
+                'status': 'processing',
+                'updated_at': datetime.now() - timedelta(seconds=outbox.OUTBOX_LEASE_SECONDS + 1)
+            })
+            db.commit()
+
+        self.assertEqual(drain_outbox()['done'], 1)
+        self.assertEqual(get_outbox_operation(self.user_id, accepted['id'])['status'], 'done')
+
+    def test_get_operation_of_other_user(self):
+        """他のユーザーの操作は取得できない"""
+        accepted = enqueue_add_todo(self.user_id, "非公開")
+        self.assertIn("error", get_outbox_operation("other_user", accepted['id']))
+        self.assertIn("error", get_outbox_operation(self.user_id, "outbox_abc"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import prefetch
+from prefetch import observe_tool_calls
+
+
+def get_all_events_endpoint(user_id: str, start_date: str, end_date: str = None, compact: bool = False):
+    return [{'title': "イベント"}]
+
+
+def add_todo_endpoint(user_id: str, title: str, async_write: bool = False):
+    if title == "":
+        return {"error": "title is required"}
+    return {'id': "google_1", 'title': title}
+
+
+class TestPrefetch(unittest.TestCase):
+    """ツール呼び出しからの先読みのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.warmed = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def warm_event_window(user_id, start, end):
+            self.release.wait(5)
+            self.warmed.append(('events', user_id, start, end))
+            return 1
+
+        def warm_todos(user_id, filter_status="all"):
+            self.release.wait(5)
+            self.warmed.append(('todos', user_id))
+            return True
+        self.patches = [
+            patch.object(prefetch, 'PREFETCH_ENABLED', True),
+            patch.object(prefetch, 'PREFETCH_BUDGET_PER_MINUTE', 2),
+            patch.object(prefetch, 'warm_event_window', warm_event_window),
+            patch.object(prefetch, 'warm_todos', warm_todos),
+            patch.object(prefetch, '_budgets', OrderedDict()),
+        ]
+        for p in self.patches:
+            p.start()
+        self.get_all_events = observe_tool_calls(get_all_events_endpoint)
+        self.add_todo = observe_tool_calls(add_todo_endpoint)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.release.set()
+        self._wait_for_idle()
+        for p in self.patches:
+            p.stop()
+
+    def _wait_for_idle(self):
+        deadline = time.monotonic() + 5
+        while prefetch._pending:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def _skipped(self, reason):
+        return metrics.snapshot()['counters'].get('prefetch_skipped', {}).get(reason, 0)
+
+    def test_next_event_window_is_prefetched(self):
+        """期間を指定したイベントの取得の後は同じ長さの次の期間を先読みする"""
+        result = self.get_all_events("user_1", "2025-06-05T00:00:00", "2025-06-06T00:00:00")
+        self._wait_for_idle()
+
+        self.assertEqual(result, [{'title': "イベント"}])
+        self.assertEqual(self.warmed, [('events', "user_1", datetime(2025, 6, 6), datetime(2025, 6, 7))])
+        self.assertEqual(metrics.snapshot()['counters']['prefetch_warmed']['events'], 1)
+
+    def test_open_ended_or_long_range_is_not_prefetched(self):
+        """終了日時がない取得や長すぎる期間の取得の後は先読みしない"""
+        self.get_all_events("user_1", "2025-06-05T00:00:00")
+        self.get_all_events("user_1", "2025-01-01T00:00:00", "2025-12-31T00:00:00")
+        self._wait_for_idle()
+
+        self.assertEqual(self.warmed, [])
+
+    def test_todo_list_is_prefetched_after_write(self):
+        """TODOの追加の後は一覧を先読みし、エラーや非同期の書き込みの後は先読みしない"""
+        self.add_todo("user_1", "牛乳を買う")
+        self._wait_for_idle()
+        self.add_todo("user_1", "")
+        self.add_todo("user_1", "卵を買う", async_write=True)
+        self._wait_for_idle()
+
+        self.assertEqual(self.warmed, [('todos', "user_1")])
+
+    def test_budget_per_user(self):
+        """ユーザーごとの予算を超えた先読みは実行しない"""
+        for day in range(1, 5):
+            self.get_all_events("user_1", f"2025-06-{day:02d}T00:00:00", f"2025-06-{day + 1:02d}T00:00:00")
+        self.get_all_events("user_2", "2025-06-01T00:00:00", "2025-06-02T00:00:00")
+        self._wait_for_idle()
+
+        self.assertEqual(sum(1 for kind, user_id, *_ in self.warmed if user_id == "user_1"), 2)
+        self.assertEqual(sum(1 for kind, user_id, *_ in self.warmed if user_id == "user_2"), 1)
+        self.assertEqual(self._skipped('budget'), 2)
+
+    def test_budgets_are_bounded(self):
+        """予算を保持するユーザー数は上限までにし、最近先読みしていないユーザーから削除する"""
+        with patch.object(prefetch, 'PREFETCH_MAX_BUDGETS', 2):
+            for user_id in ("user_1", "user_2", "user_1", "user_3"):
+                self.add_todo(user_id, "牛乳を買う")
+                self._wait_for_idle()
+
+        self.assertEqual(list(prefetch._budgets), ["user_1", "user_3"])
+
+    def test_duplicate_prefetch_is_skipped(self):
+        """同じ先読みが実行待ちの間は重ねて実行しない"""
+        self.release.clear()
+        self.get_all_events("user_1", "2025-06-05T00:00:00", "2025-06-06T00:00:00")
+        self.get_all_events("user_1", "2025-06-05T00:00:00", "2025-06-06T00:00:00")
+        self.release.set()
+        self._wait_for_idle()
+
+        self.assertEqual(len(self.warmed), 1)
+        self.assertEqual(self._skipped('duplicate'), 1)
+
+    def test_skipped_while_user_request_in_flight(self):
+        """ユーザーのリクエストが実行中の場合は先読みを実行しない"""
+        with prefetch._lock:
+            prefetch._foreground["user_1"] = 1
+        try:
+            self.add_todo("user_2", "牛乳を買う")
+            self.assertTrue(prefetch.schedule('todos', "user_1", lambda: self.warmed.append('todos')))
+            self._wait_for_idle()
+        finally:
+            with prefetch._lock:
+                del prefetch._foreground["user_1"]
+
+        self.assertEqual(self.warmed, [('todos', "user_2")])
+        self.assertEqual(self._skipped('busy'), 1)
+
+    def test_disabled(self):
+        """PREFETCH_ENABLEDが無効の場合は先読みしない"""
+        with patch.object(prefetch, 'PREFETCH_ENABLED', False):
+            self.get_all_events("user_1", "2025-06-05T00:00:00", "2025-06-06T00:00:00")
+        self._wait_for_idle()
+
+        self.assertEqual(self.warmed, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import shutil
+import tempfile
+import threading
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import profiler
+from profiler import profile_tool_calls
+
+
+def _busy_work():
+    return sum(i * i for i in range(20000))
+
+
+@profile_tool_calls
+def slow_tool_for_test(n: int) -> int:
+    return _busy_work() + n
+
+
+class TestProfiler(unittest.TestCase):
+    """ツール呼び出しのプロファイルのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.profile_dir = tempfile.mkdtemp()
+        self.patches = [
+            patch.object(profiler, 'PROFILE_DIR', self.profile_dir),
+            patch.object(profiler, '_settings', profiler._Settings()),
+        ]
+        for p in self.patches:
+            p.start()
+        profiler.reset()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        profiler.reset()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_disabled_by_default(self):
+        """対象のツールが設定されていない場合はプロファイルしない"""
+        self.assertEqual(slow_tool_for_test(1), _busy_work() + 1)
+
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_profile_saved_and_aggregated(self):
+        """対象のツールの呼び出しをプロファイルして保存し、時間のかかっている関数を集計する"""
+        profiler.configure(['slow_tool_for_test'], 1.0)
+
+        slow_tool_for_test(1)
+        slow_tool_for_test(2)
+
+        files = os.listdir(self.profile_dir)
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(name.startswith('slow_tool_for_test-') and name.endswith('.prof') for name in files))
+        self.assertEqual(profiler.status()['profiled_calls'], {'slow_tool_for_test': 2})
+        top = profiler.top_functions('slow_tool_for_test', top_n=5)
+        self.assertLessEqual(len(top), 5)
+        self.assertIn('_busy_work', " ".join(row['function'] for row in top))
+        self.assertEqual(metrics.snapshot()['counters']['profiled_calls'], {'slow_tool_for_test': 2})
+
+    def test_other_tools_and_sample_rate(self):
+        """対象外のツールと、割合が0の場合はプロファイルしない"""
+        profiler.configure(['other_tool'], 1.0)
+        slow_tool_for_test(1)
+        profiler.configure(['*'], 0.0)
+        slow_tool_for_test(1)
+
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertEqual(profiler.top_functions(), [])
+
+    def test_skipped_while_busy(self):
+        """他の呼び出しをプロファイル中の場合はプロファイルせずに実行する"""
+        profiler.configure(['*'], 1.0)
+        with profiler._profile_lock:
+            result = threading.Thread(target=slow_tool_for_test, args=(1,))
+            result.start()
+            result.join(5)
+
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertEqual(metrics.snapshot()['counters']['profile_skipped'], {'busy': 1})
+
+    def test_max_files(self):
+        """保存するプロファイルの数はPROFILE_MAX_FILESまでにする"""
+        profiler.configure(['*'], 1.0)
+        with patch.object(profiler, 'PROFILE_MAX_FILES', 2):
+            for n in range(4):
+                slow_tool_for_test(n)
+
+        self.assertEqual(len(os.listdir(self.profile_dir)), 2)
+
+    def test_admin_endpoint(self):
+        """管理用ツールはトークンが一致する場合のみプロファイルを操作できる"""
+        import main
+
+        with patch.object(main, 'PROFILE_ADMIN_TOKEN', "secret"):
+            self.assertEqual(main.profiling_admin_endpoint("wrong", "start"), {"error": "forbidden"})
+            status = main.profiling_admin_endpoint("secret", "start", tools=['slow_tool_for_test'], sample_rate=1.0)
+            slow_tool_for_test(1)
+            top = main.profiling_admin_endpoint("secret", "top", top_n=3, sort_by="total")
+            stopped = main.profiling_admin_endpoint("secret", "stop")
+
+        self.assertEqual(status['tools'], ['slow_tool_for_test'])
+        self.assertEqual(len(top['functions']), 3)
+        self.assertEqual(stopped['tools'], [])
+
+    def test_admin_endpoint_disabled_without_token(self):
+        """管理用トークンが設定されていない場合はどのトークンでも操作できない"""
+        import main
+
+        with patch.object(main, 'PROFILE_ADMIN_TOKEN', None):
+            self.assertEqual(main.profiling_admin_endpoint("", "status"), {"error": "forbidden"})
+
+
+if __name__ == "__main__":
+    unittest.main()
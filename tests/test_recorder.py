@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import importlib
+import tempfile
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recorder
+from recorder import record_tool_call, anonymize_user_id
+
+
+class TestRecorder(unittest.TestCase):
+    """ツール呼び出しレコーダーのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.path_patch = patch.object(recorder, 'TOOL_CALL_RECORD_PATH', self.path)
+        self.path_patch.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.path_patch.stop()
+        os.remove(self.path)
+
+    def _read_records(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_anonymize_user_id(self):
+        """同じユーザーIDは同じ匿名IDになり、元のIDは含まれない"""
+        self.assertEqual(anonymize_user_id("user_1"), anonymize_user_id("user_1"))
+        self.assertNotEqual(anonymize_user_id("user_1"), anonymize_user_id("user_2"))
+        self.assertNotIn("user_1", anonymize_user_id("user_1"))
+
+    def test_random_salt_without_env(self):
+        """TOOL_CALL_RECORD_SALTが未設定の場合は、プロセスごとのランダムなソルトで匿名化する"""
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('TOOL_CALL_RECORD_SALT', None)
+            try:
+                first = importlib.reload(recorder).TOOL_CALL_RECORD_SALT
+                second = importlib.reload(recorder).TOOL_CALL_RECORD_SALT
+            finally:
+                importlib.reload(recorder)
+        self.assertTrue(first)
+        self.assertNotEqual(first, second)
+
+    def test_record_ok(self):
+        """正常終了した呼び出しが記録される"""
+        @record_tool_call
+        def sample_endpoint(user_id: str, title: str):
+            return {"id": "google_1", "title": title}
+
+        result = sample_endpoint("user_1", title="テスト")
+
+        self.assertEqual(result, {"id": "google_1", "title": "テスト"})
+        records = self._read_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["tool"], "sample_endpoint")
+        self.assertEqual(records[0]["arguments"]["user_id"], anonymize_user_id("user_1"))
+        self.assertEqual(records[0]["arguments"]["title"], "テスト")
+        self.assertEqual(records[0]["outcome"], "ok")
+        self.assertIn("duration_ms", records[0])
+        self.assertIn("timestamp", records[0])
+
+    def test_record_error_result(self):
+        """エラー辞書を返した呼び出しはerrorとして記録される"""
+        @record_tool_call
+        def sample_endpoint(user_id: str):
+            return [{"error": "authentication_required"}]
+
+        sample_endpoint("user_1")
+
+        records = self._read_records()
+        self.assertEqual(records[0]["outcome"], "error")
+        self.assertEqual(records[0]["error"], "authentication_required")
+
+    def test_record_exception(self):
+        """例外が発生した呼び出しも記録され、例外はそのまま送出される"""
+        @record_tool_call
+        def sample_endpoint(user_id: str, start_date: str):
+            raise ValueError("Invalid isoformat string")
+
+        with self.assertRaises(ValueError):
+            sample_endpoint("user_1", "invalid")
+
+        records = self._read_records()
+        self.assertEqual(records[0]["outcome"], "exception")
+        self.assertIn("ValueError", records[0]["error"])
+
+    def test_disabled_without_path(self):
+        """記録先が未設定の場合は何も書き込まない"""
+        @record_tool_call
+        def sample_endpoint(user_id: str):
+            return {}
+
+        with patch.object(recorder, 'TOOL_CALL_RECORD_PATH', None):
+            sample_endpoint("user_1")
+
+        self.assertEqual(self._read_records(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
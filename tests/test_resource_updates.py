@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+import sys
+import os
+import asyncio
+import json
+import threading
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from mcp_types import SubscribeRequestParams, UnsubscribeRequestParams
+
+import google_api
+from resource_updates import ResourceSubscriptions
+from todo_cache import todo_list_cache
+from event_cache import event_window_cache
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestResourceSubscriptions(unittest.TestCase):
+    """リソースの購読と変更通知のテストクラス"""
+
+    def test_legacy_subscribe(self):
+        """resources/subscribeで購読したセッションには、別スレッドで検出した変更も1回にまとめて通知する"""
+        subscriptions = ResourceSubscriptions()
+        session = MagicMock()
+        session.send_resource_updated = AsyncMock()
+        ctx = MagicMock(session=session)
+
+        async def run():
+            await subscriptions._subscribe(ctx, SubscribeRequestParams(uri="events://user_a/2025-06-02"))
+            await subscriptions._subscribe(ctx, SubscribeRequestParams(uri="todos://user_b"))
+
+            def detect_changes():
+                subscriptions.notify_user_changed("user_a", 'events')
+                subscriptions.notify_user_changed("user_a", 'events')
+                subscriptions.notify_user_changed("user_a", 'todos')
+            thread = threading.Thread(target=detect_changes)
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0.05)
+
+            await subscriptions._unsubscribe(ctx, UnsubscribeRequestParams(uri="events://user_a/2025-06-02"))
+            subscriptions.notify_user_changed("user_a", 'events')
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+
+        session.send_resource_updated.assert_awaited_once_with("events://user_a/2025-06-02")
+        self.assertEqual(subscriptions.subscribed_uris(), ["todos://user_b"])
+
+    def test_notify_without_subscribers(self):
+        """購読がない場合は何もしない"""
+        subscriptions = ResourceSubscriptions()
+
+        subscriptions.notify_user_changed("user_a", 'todos')
+
+        self.assertEqual(subscriptions.subscribed_uris(), [])
+
+
+class TestResourceEndpoints(unittest.TestCase):
+    """todos:// / events://リソースのMCP経由の読み取りと購読のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=2, seed_events=0)
+        self.store.insert_event('primary', {
+            'summary': "Planning",
+            'start': {'dateTime': "2025-06-02T10:00:00+09:00"},
+            'end': {'dateTime': "2025-06-02T11:00:00+09:00"},
+        })
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('todo_service.get_db', get_db),
+            patch('event_service.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        todo_list_cache.clear()
+        event_window_cache.clear()
+        google_api.clear_negative_cache()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def test_read_resources(self):
+        """TODOと指定日のイベントをJSONで返す"""
+        import main
+        from fastmcp import Client
+
+        async def run():
+            async with Client(main.mcp) as client:
+                todos = await client.read_resource(f"todos://{self.user_id}")
+                events = await client.read_resource(f"events://{self.user_id}/2025-06-02")
+                other_day = await client.read_resource(f"events://{self.user_id}/2025-06-03")
+                return json.loads(todos[0].text), json.loads(events[0].text), json.loads(other_day[0].text)
+
+        todos, events, other_day = asyncio.run(run())
+
+        self.assertEqual(sorted(todo['title'] for todo in todos), ["Seed task 0", "Seed task 1"])
+        self.assertEqual([event['title'] for event in events], ["Planning"])
+        self.assertEqual(other_day, [])
+
+    def test_listen_for_updates(self):
+        """購読中のリソースは、ツールでTODO/イベントを追加するとresources/updatedが届く"""
+        import main
+        from fastmcp import Client
+        from mcp.client.subscriptions import listen
+
+        todos_uri = f"todos://{self.user_id}"
+        events_uri = f"events://{self.user_id}/2025-06-02"
+
+        async def run():
+            async with Client(main.mcp) as client:
+                async with listen(client.session, resource_subscriptions=[todos_uri, events_uri, "todos://other_user"]) as subscription:
+                    received = []
+                    await client.call_tool('add_todo_endpoint', {'user_id': self.user_id, 'title': "New task"})
+                    received.append(await asyncio.wait_for(subscription.__anext__(), 5))
+                    await client.call_tool('add_event_endpoint', {
+                        'user_id': self.user_id, 'title': "New event",
+                        'start_time': "2025-06-02T15:00:00", 'end_time': "2025-06-02T16:00:00",
+                    })
+                    received.append(await asyncio.wait_for(subscription.__anext__(), 5))
+                    return [event.uri for event in received]
+
+        self.assertEqual(asyncio.run(run()), [todos_uri, events_uri])
+
+
+if __name__ == "__main__":
+    unittest.main()
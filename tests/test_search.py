@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+from datetime import datetime, timezone
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, SearchDocument
+from search import index_items, prune_items, search
+
+
+class TestSearch(unittest.TestCase):
+    """全文検索のテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        # テスト用のインメモリDB（全ての接続で同じDBを共有する）
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.db = self.Session()
+        self.user_id = "test_user"
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.db_patch = patch('search.get_db', get_db)
+        self.db_patch.start()
+
+        index_items(self.db, self.user_id, 'todo', [
+            {'google_task_id': 't1', 'title': '歯医者の予約を取る', 'description': '', 'completed': False},
+            {'google_task_id': 't2', 'title': '牛乳を買う', 'description': 'スーパーで', 'completed': True},
+        ])
+        index_items(self.db, self.user_id, 'event', [
+            {'google_event_id': 'e1', 'title': 'Dentist appointment', 'description': 'Checkup',
+             'location': '渋谷歯科', 'start_time': datetime(2025, 6, 5, 1, 0, tzinfo=timezone.utc)},
+            {'google_event_id': 'e2', 'title': 'Team meeting', 'description': 'Weekly sync',
+             'location': 'Room A', 'start_time': datetime(2025, 6, 6, 2, 0, tzinfo=timezone.utc)},
+        ])
+        index_items(self.db, "other_user", 'todo', [
+            {'google_task_id': 'x1', 'title': '歯医者に行く', 'description': '', 'completed': False},
+        ])
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db_patch.stop()
+        self.db.close()
+        self.engine.dispose()
+
+    def test_search_full_text(self):
+        """タイトル・場所の部分一致で検索でき、他のユーザーのデータは含まれない"""
+        result = search(self.user_id, "歯医者")
+        self.assertEqual([r['id'] for r in result], ['google_t1'])
+        self.assertEqual(result[0]['item_type'], 'todo')
+
+        result = search(self.user_id, "dentist")
+        self.assertEqual([r['id'] for r in result], ['google_e1'])
+        self.assertEqual(result[0]['start_time'], datetime(2025, 6, 5, 1, 0, tzinfo=timezone.utc))
+
+    def test_search_short_term(self):
+        """trigramで扱えない短い検索語は部分一致で検索する"""
+        result = search(self.user_id, "牛乳")
+        self.assertEqual([r['id'] for r in result], ['google_t2'])
+        self.assertTrue(result[0]['completed'])
+
+    def test_search_item_type_filter(self):
+        """item_typeで対象を絞り込める"""
+        self.assertEqual(search(self.user_id, "歯科", item_type='todo'), [])
+        self.assertEqual(len(search(self.user_id, "歯科", item_type='event')), 1)
+
+    def test_index_updates_existing_document(self):
+        """同じアイテムを再度同期すると重複せずに内容が更新される"""
+        index_items(self.db, self.user_id, 'event', [
+            {'google_event_id': 'e2', 'title': 'Planning meeting', 'description': 'Quarterly',
+             'location': 'Room B', 'start_time': datetime(2025, 6, 6, 2, 0, tzinfo=timezone.utc)},
+        ])
+        self.assertEqual(self.db.query(SearchDocument).filter(SearchDocument.item_id == 'e2').count(), 1)
+        self.assertEqual([r['id'] for r in search(self.user_id, "Quarterly")], ['google_e2'])
+        self.assertEqual(search(self.user_id, "Weekly"), [])
+
+    def test_search_like_wildcards_are_literal(self):
+        """部分一致の検索では % と _ を文字どおりに扱う"""
+        index_items(self.db, self.user_id, 'todo', [
+            {'google_task_id': 't3', 'title': '割引50%', 'description': '', 'completed': False},
+        ])
+
+        self.assertEqual([r['id'] for r in search(self.user_id, "%")], ['google_t3'])
+        self.assertEqual(search(self.user_id, "_"), [])
+
+    def test_prune_items(self):
+        """全件の一覧になかったアイテムを取り除き、イベントは期間とカレンダーの内側だけを対象にする"""
+        index_items(self.db, self.user_id, 'event', [
+            {'google_event_id': 'w1', 'title': 'Work review', 'start_time': datetime(2025, 6, 5, 3, 0, tzinfo=timezone.utc)},
+        ], calendar_id='work')
+
+        prune_items(self.db, self.user_id, 'todo', ['t2'])
+        prune_items(self.db, self.user_id, 'event', [],
+                    datetime(2025, 6, 5, tzinfo=timezone.utc), datetime(2025, 6, 6, tzinfo=timezone.utc))
+
+        ids = sorted(d.item_id for d in self.db.query(SearchDocument).filter(SearchDocument.user_id == self.user_id))
+        self.assertEqual(ids, ['e2', 't2', 'w1'])
+        self.assertEqual(self.db.query(SearchDocument).filter(SearchDocument.item_id == 'x1').count(), 1)
+
+    def test_search_invalid_arguments(self):
+        """空の検索語や不正なitem_typeはエラーを返す"""
+        self.assertIn("error", search(self.user_id, "  ")[0])
+        self.assertIn("error", search(self.user_id, "dentist", item_type='note')[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
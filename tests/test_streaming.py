@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import streaming
+from streaming import collect_pages, encode_cursor, decode_cursor, InvalidCursorError
+from todo_service import stream_todos
+from event_service import stream_events
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestCollectPages(unittest.TestCase):
+    """ページごとの一覧の集約のテストクラス"""
+
+    def _pages(self, fetched):
+        for token, size in (("p1", 3), ("p2", 3), ("p3", 3)):
+            fetched.append(token)
+            yield token, [{'id': f"{token}-{i}", 'description': ""} for i in range(size)]
+
+    def test_cursor_round_trip(self):
+        """カーソルはページトークンとページの中での位置を復元できる"""
+        self.assertEqual(decode_cursor(encode_cursor("token", 5)), ("token", 5))
+        self.assertEqual(decode_cursor(None), (None, 0))
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor("not a cursor")
+
+    def test_stops_at_max_bytes(self):
+        """上限に達したら残りのページを取得せずに、続きのカーソルを返す"""
+        fetched = []
+        item_size = len(json.dumps({'id': "p1-0", 'description': ""}))
+
+        result = collect_pages(self._pages(fetched), max_bytes=item_size * 4)
+
+        self.assertEqual([item['id'] for item in result['items']], ["p1-0", "p1-1", "p1-2", "p2-0"])
+        self.assertEqual(fetched, ["p1", "p2"])
+        self.assertLessEqual(result['bytes'], item_size * 4)
+        self.assertEqual(decode_cursor(result['next_cursor']), ("p2", 1))
+
+    def test_resume_from_offset(self):
+        """カーソルの位置から続きを返し、最後まで取得したらnext_cursorはNoneになる"""
+        result = collect_pages(self._pages([]), offset=1, compact=True)
+
+        self.assertEqual(len(result['items']), 8)
+        self.assertEqual(result['items'][0], {'id': "p1-1"})
+        self.assertIsNone(result['next_cursor'])
+
+    def test_single_item_larger_than_limit(self):
+        """1件だけで上限を超える場合もその1件は返して先に進む"""
+        result = collect_pages(self._pages([]), max_bytes=1)
+
+        self.assertEqual(len(result['items']), 1)
+        self.assertEqual(decode_cursor(result['next_cursor']), ("p1", 1))
+
+
+class TestStreaming(unittest.TestCase):
+    """大きな一覧のページごとの取得のテストクラス"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Google APIのスタブサーバーを起動する"""
+        cls.store = FakeGoogleStore(seed_tasks=230, seed_events=0)
+        base = datetime(2025, 1, 1)
+        for i in range(600):
+            start = base + timedelta(hours=i * 6)
+            cls.store.insert_event('primary', {
+                'summary': f"Event {i}",
+                'description': "x" * 200,
+                'start': {'dateTime': start.isoformat() + "Z"},
+                'end': {'dateTime': (start + timedelta(hours=1)).isoformat() + "Z"},
+            })
+        cls.server = start_fake_google(store=cls.store)
+        cls.endpoints = endpoint_env(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        """テストの前準備"""
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('todo_service.get_db', get_db),
+            patch('event_service.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', self.endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+            patch.object(google_api, 'GOOGLE_CALENDAR_API_ENDPOINT', self.endpoints['GOOGLE_CALENDAR_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        google_api.clear_negative_cache()
+        self.engine.dispose()
+
+    def _stream_all(self, fetch):
+        items, responses, cursor = [], [], None
+        while True:
+            result = fetch(cursor)
+            responses.append(result)
+            items.extend(result['items'])
+            cursor = result['next_cursor']
+            if cursor is None:
+                return items, responses
+
+    def test_stream_events_bounded(self):
+        """全てのイベントを重複なく返し、1回の応答は上限の大きさを超えない"""
+        with patch.object(streaming, 'STREAM_MAX_RESPONSE_BYTES', 50_000):
+            items, responses = self._stream_all(
+                lambda cursor: stream_events(self.user_id, datetime(2025, 1, 1), datetime(2025, 12, 31), cursor)
+            )
+
+        self.assertEqual(len(items), 600)
+        self.assertEqual(len({item['google_event_id'] for item in items}), 600)
+        self.assertGreater(len(responses), 1)
+        self.assertTrue(all(response['bytes'] <= 50_000 for response in responses))
+        self.assertEqual(items[0]['title'], "Event 0")
+
+    def test_stream_todos_pages(self):
+        """Google Tasksの複数ページにわたるTODOを全て返す"""
+        result = stream_todos(self.user_id, "all")
+
+        self.assertEqual(len(result['items']), 230)
+        self.assertEqual(result['pages'], 3)
+        self.assertIsNone(result['next_cursor'])
+
+    def test_invalid_cursor(self):
+        """形式が正しくないカーソルはエラーを返す"""
+        result = stream_todos(self.user_id, "all", cursor="broken")
+
+        self.assertIn("Invalid cursor", result['error'])
+
+    def test_progress_notifications(self):
+        """MCPのツール呼び出しではページを取得するたびに進捗を通知する"""
+        import main
+        from fastmcp import Client
+
+        progress = []
+
+        async def handler(value, total, message):
+            progress.append((value, message))
+
+        async def run():
+            async with Client(main.mcp) as client:
+                return await client.call_tool('stream_events_endpoint', {
+                    'user_id': self.user_id, 'start_date': "2025-01-01T00:00:00", 'end_date': "2025-12-31T00:00:00",
+                }, progress_handler=handler)
+
+        result = asyncio.run(run())
+
+        self.assertEqual(len(result.data['items']), 600)
+        self.assertEqual([value for value, _ in progress], [250, 500, 600])
+        self.assertEqual(progress[-1][1], "600 events (3 pages)")
+
+
+if __name__ == "__main__":
+    unittest.main()
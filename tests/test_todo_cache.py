@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import google_api
+import metrics
+from todo_cache import TodoListCache, todo_list_cache
+from todo_service import get_all_todos, add_todo, warm_todos
+from models import Base, GoogleCredentials
+from benchmarks.fake_google import FakeGoogleStore, start_fake_google, endpoint_env
+from tests.test_google_api import _token_json
+
+
+class TestTodoListCache(unittest.TestCase):
+    """TODO一覧のキャッシュのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        metrics.reset()
+        self.cache = TodoListCache(max_entries=2, max_age_seconds=30)
+
+    def test_hit_and_miss(self):
+        """保存した一覧はユーザーとフィルターが一致する場合だけ返す"""
+        self.cache.store("user_1", "all", [{'id': "google_1"}], generation=0)
+
+        self.assertEqual(self.cache.get("user_1", "all"), [{'id': "google_1"}])
+        self.assertIsNone(self.cache.get("user_1", "active"))
+        self.assertIsNone(self.cache.get("user_2", "all"))
+        self.assertEqual(metrics.snapshot()['counters']['todo_cache_requests'], {'hit': 1, 'miss': 2})
+
+    def test_invalidate(self):
+        """無効化するとユーザーの一覧を削除し、取得中だった一覧も保存しない"""
+        generation = self.cache.generation("user_1")
+        self.cache.store("user_1", "all", [], generation)
+        self.cache.invalidate("user_1")
+        self.cache.store("user_1", "active", [], generation)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_generations_are_bounded(self):
+        """世代番号は上限までのユーザーだけ保持し、削除したユーザーの取得中の一覧も保存しない"""
+        cache = TodoListCache(max_entries=2, max_age_seconds=30, max_generations=2)
+        generation = cache.generation("user_1")
+        for user_id in ("user_1", "user_2", "user_3"):
+            cache.invalidate(user_id)
+        cache.store("user_1", "all", [], generation)
+
+        self.assertEqual(len(cache._generations), 2)
+        self.assertIsNone(cache.get("user_1", "all"))
+        cache.store("user_1", "all", [], cache.generation("user_1"))
+        self.assertEqual(cache.get("user_1", "all"), [])
+
+    def test_expired_entry(self):
+        """有効期間を過ぎた一覧は返さない"""
+        self.cache.store("user_1", "all", [], generation=0)
+
+        with patch('todo_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(self.cache.get("user_1", "all"))
+
+    def test_lru_eviction(self):
+        """上限を超えた場合は最近使われていない一覧から削除する"""
+        self.cache.store("user_1", "all", [], generation=0)
+        self.cache.store("user_2", "all", [], generation=0)
+        self.cache.get("user_1", "all")
+        self.cache.store("user_3", "all", [], generation=0)
+
+        self.assertIsNotNone(self.cache.get("user_1", "all"))
+        self.assertIsNone(self.cache.get("user_2", "all"))
+
+
+class TestGetAllTodosCache(unittest.TestCase):
+    """get_all_todosのキャッシュのテストクラス"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.store = FakeGoogleStore(seed_tasks=3, seed_events=0)
+        self.server = start_fake_google(store=self.store)
+        endpoints = endpoint_env(self.server)
+
+        self.engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.user_id = "test_user"
+        with self.Session() as db:
+            db.add(GoogleCredentials(user_id=self.user_id, token_json=_token_json()))
+            db.commit()
+
+        def get_db():
+            db = self.Session()
+            try:
+                yield db
+            finally:
+                db.close()
+        self.patches = [
+            patch('todo_service.get_db', get_db),
+            patch.object(google_api, 'GOOGLE_TASKS_API_ENDPOINT', endpoints['GOOGLE_TASKS_API_ENDPOINT']),
+        ]
+        for p in self.patches:
+            p.start()
+        todo_list_cache.clear()
+        metrics.reset()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for p in self.patches:
+            p.stop()
+        todo_list_cache.clear()
+        self.server.shutdown()
+        self.engine.dispose()
+
+    def test_second_call_is_served_from_cache(self):
+        """続けて取得した場合は2回目をキャッシュから返す"""
+        first = get_all_todos(self.user_id)
+        self.store.insert_task('default', {'title': "Googleで直接追加"})
+
+        second = get_all_todos(self.user_id)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(second, first)
+        self.assertEqual(metrics.snapshot()['counters']['todo_cache_requests'], {'hit': 1, 'miss': 1})
+
+    def test_add_todo_invalidates_cache(self):
+        """TODOを追加するとキャッシュを破棄して次の取得に反映する"""
+        get_all_todos(self.user_id)
+
+        add_todo(self.user_id, "牛乳を買う")
+
+        self.assertIn("牛乳を買う", [todo['title'] for todo in get_all_todos(self.user_id)])
+
+    def test_warm_todos(self):
+        """先読みした一覧はヒット率に数えずにキャッシュに入れ、キャッシュ済みの場合は取得しない"""
+        self.assertTrue(warm_todos(self.user_id))
+        self.assertFalse(warm_todos(self.user_id))
+        self.assertNotIn('todo_cache_requests', metrics.snapshot()['counters'])
+
+        self.assertEqual(len(get_all_todos(self.user_id)), 3)
+        self.assertEqual(metrics.snapshot()['counters']['todo_cache_requests'], {'hit': 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+from typing import List, Dict, Optional, Tuple, Callable
+from collections import OrderedDict
+import itertools
+import os
+import threading
+import time
+
+import metrics
+
+
+# キャッシュしたTODO一覧の有効期間（秒）。0以下の場合はキャッシュしない
+TODO_CACHE_MAX_AGE_SECONDS = float(os.getenv("TODO_CACHE_MAX_AGE_SECONDS", 30))
+# 全ユーザー合計でキャッシュするTODO一覧の数（超えた分は最近使われていないものから削除する）
+TODO_CACHE_MAX_ENTRIES = int(os.getenv("TODO_CACHE_MAX_ENTRIES", 1000))
+# 世代番号を保持するユーザーの数（超えた分は最近無効化されていないユーザーから削除する）
+TODO_CACHE_MAX_GENERATIONS = int(os.getenv("TODO_CACHE_MAX_GENERATIONS", 10000))
+
+
+class TodoListCache:
+    """ユーザーとフィルターごとにTODOの一覧を保持するキャッシュ
+
+    TODOを追加・更新したときはユーザー単位で破棄する。
+    """
+
+    def __init__(self, max_entries: int = TODO_CACHE_MAX_ENTRIES, max_age_seconds: float = TODO_CACHE_MAX_AGE_SECONDS,
+                 max_generations: int = TODO_CACHE_MAX_GENERATIONS):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[Dict]]]" = OrderedDict()
+        # 取得中に無効化された場合に古い結果を保存しないための世代番号（全ユーザーで単調に増える値）。
+        # 無効化したユーザーだけをLRUで保持し、保持していないユーザーは削除した値の最大値（_floor）とする
+        self.max_generations = max_generations
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._generation_counter = itertools.count(1)
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._invalidation_listeners: List[Callable[[str], None]] = []
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]):
+        """ユーザーのキャッシュを破棄したとき（TODOが変更されたとき）に呼ぶコールバックを登録する"""
+        self._invalidation_listeners.append(listener)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_seconds > 0 and self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def generation(self, user_id: str) -> int:
+        with self._lock:
+            return self._generations.get(user_id, self._floor)
+
+    def get(self, user_id: str, filter_status: str, record_metrics: bool = True) -> Optional[List[Dict]]:
+        """キャッシュ済みのTODO一覧を返す（ない場合や有効期間を過ぎた場合はNone）
+
+        record_metrics=Falseの場合はヒット率のメトリクスに数えない（先読みの確認など）。
+        """
+        if not self.enabled:
+            return None
+        key = (user_id, filter_status)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic() - self.max_age_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if record_metrics:
+            metrics.increment('todo_cache_requests', 'miss' if entry is None else 'hit')
+        return None if entry is None else list(entry[1])
+
+    def store(self, user_id: str, filter_status: str, todos: List[Dict], generation: int):
+        """TODO一覧を保存する（取得中に無効化された場合は保存しない）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(user_id, self._floor) != generation:
+                return
+            self._entries[(user_id, filter_status)] = (time.monotonic(), list(todos))
+            self._entries.move_to_end((user_id, filter_status))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """ユーザーのキャッシュを削除する（TODOの追加や更新のとき）"""
+        with self._lock:
+            self._generations[user_id] = next(self._generation_counter)
+            self._generations.move_to_end(user_id)
+            while len(self._generations) > self.max_generations:
+                # 削除したユーザーの取得中の結果も保存しないよう、保持していないユーザーの世代番号を引き上げる
+                _, removed = self._generations.popitem(last=False)
+                self._floor = max(self._floor, removed)
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+        for listener in self._invalidation_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                print(f"[WARNING] Cache invalidation listener failed: {type(e).__name__}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            # 取得中の結果を保存しないよう、全てのユーザーの世代番号を引き上げる
+            self._floor = next(self._generation_counter)
+
+
+todo_list_cache = TodoListCache()
+
+metrics.register_gauge('todo_cache_entries', lambda: len(todo_list_cache))
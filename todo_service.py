@@ -1,12 +1,26 @@
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
 from models import get_db
 from google_api import get_google_tasks_service, AuthenticationRequiredException
+from admission import OverloadedError
+from compact import compact_items
+from schemas import TodoResult
+from search import index_items, prune_items
+from todo_cache import todo_list_cache
+from streaming import collect_pages, decode_cursor, InvalidCursorError
+
+
+# Google Tasksから取得するフィールド（_create_task_dictで使うものだけに絞る）
+TASK_FIELDS = "id,title,notes,status,updated,due"
+TASK_LIST_FIELDS = f"items({TASK_FIELDS})"
+# 1回のリクエストで取得するタスクの数（Google Tasksの上限）
+TASK_PAGE_SIZE = 100
 
 
 def _get_default_tasklist_id(tasks_service) -> str:
     """デフォルトのタスクリストIDを取得するヘルパー関数"""
     try:
-        tasklists = tasks_service.tasklists().list().execute()
+        # 先頭のタスクリストのIDだけを取得する
+        tasklists = tasks_service.tasklists().list(maxResults=1, fields="items(id)").execute()
         if tasklists.get('items'):
             return tasklists['items'][0]['id']
         raise ValueError("No tasklists found")
@@ -15,7 +29,7 @@ def _get_default_tasklist_id(tasks_service) -> str:
         raise
 
 
-def _create_task_dict(google_task: Dict, user_id: str) -> Dict:
+def _create_task_dict(google_task: Dict, user_id: str) -> TodoResult:
     """Google TaskからTODO辞書を作成するヘルパー関数"""
     return {
         'id': f"google_{google_task.get('id')}",
@@ -24,6 +38,7 @@ def _create_task_dict(google_task: Dict, user_id: str) -> Dict:
         'description': google_task.get('notes', ''),
         'completed': google_task.get('status') == 'completed',
         'created_at': google_task.get('updated'),
+        'due': google_task.get('due'),
         'source': 'google_tasks',
         'google_task_id': google_task.get('id')
     }
@@ -46,10 +61,14 @@ def add_todo(user_id: str, title: str, description: str = None) -> Dict:
                 }
                 result = tasks_service.tasks().insert(
                     tasklist=tasklist_id,
-                    body=task_body
+                    body=task_body,
+                    fields=TASK_FIELDS
                 ).execute()
                 
-                return _create_task_dict(result, user_id)
+                todo = _create_task_dict(result, user_id)
+                index_items(db, user_id, 'todo', [todo])
+                todo_list_cache.invalidate(user_id)
+                return todo
         print(f"[ERROR] Google Tasks service not available for user {user_id}")
         return {"error": "Google Tasks service not available (authentication may be expired)"}
     except AuthenticationRequiredException as e:
@@ -60,15 +79,87 @@ def add_todo(user_id: str, title: str, description: str = None) -> Dict:
             "message": str(e),
             "action": "re-authenticate"
         }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
     except Exception as e:
         print(f"[ERROR] Google Tasks API error for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
         return {"error": f"Google Tasks API error: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def _iter_todo_pages(tasks_service, user_id: str, filter_status: str, page_token: Optional[str] = None,
+                     show_hidden: bool = False) -> Iterator[Tuple[Optional[str], List[Dict]]]:
+    """Google TasksからTODOアイテムを1ページずつ取得する
+
+    (そのページを取得したページトークン, ページのTODO) を順に返す。メモリに持つのは取得中の1ページだけ。
+    show_hiddenを指定すると、非表示（完了してクリアした）タスクも取得する。
+    """
+    tasklist_id = _get_default_tasklist_id(tasks_service)
+    if not tasklist_id:
+        return
+    # Google Tasksからタスクを取得（未完了のみの場合はAPI側で完了済みを除外する）
+    list_params = {'tasklist': tasklist_id, 'maxResults': TASK_PAGE_SIZE, 'fields': f"{TASK_LIST_FIELDS},nextPageToken"}
+    if filter_status == "active":
+        list_params['showCompleted'] = False
+    if show_hidden:
+        list_params['showHidden'] = True
+    while True:
+        if page_token:
+            list_params['pageToken'] = page_token
+        google_tasks = tasks_service.tasks().list(**list_params).execute()
+
+        page = []
+        for google_task in google_tasks.get('items', []):
+            # フィルターステータスに応じてGoogle Tasksをフィルタリング
+            is_completed = google_task.get('status') == 'completed'
+
+            if filter_status == "completed" and not is_completed:
+                continue
+            elif filter_status == "active" and is_completed:
+                continue
+
+            page.append(_create_task_dict(google_task, user_id))
+        yield page_token, page
+
+        page_token = google_tasks.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _fetch_todos(tasks_service, user_id: str, filter_status: str) -> List[Dict]:
+    """Google Tasksから全てのTODOアイテムを取得する（DBを使わないので別スレッドから呼べる）"""
+    result = []
+    for _, page in _iter_todo_pages(tasks_service, user_id, filter_status):
+        result.extend(page)
+    return result
+
 
+def _list_todos(db, tasks_service, user_id: str, filter_status: str) -> List[Dict]:
+    """Google TasksからTODOアイテムを取得し、検索インデックスとキャッシュに入れる"""
+    generation = todo_list_cache.generation(user_id)
+    result = _fetch_todos(tasks_service, user_id, filter_status)
+
+    # 検索インデックスを更新（全件の一覧にないTODOはGoogleで削除されたので取り除く）
+    index_items(db, user_id, 'todo', result)
+    if filter_status == "all":
+        prune_items(db, user_id, 'todo', [todo['google_task_id'] for todo in result])
+    todo_list_cache.store(user_id, filter_status, result, generation)
+    return result
+
+
+def get_all_todos(user_id: str, filter_status: str = "all", compact: bool = False) -> List[Dict]:
+    """Google TasksからTODOアイテムを取得する（短時間はキャッシュした一覧を返す）"""
+    result = todo_list_cache.get(user_id, filter_status)
+    if result is not None:
+        print(f"[get_all_todos] user_id: {user_id}, served {len(result)} todos from cache")
+        return compact_items(result) if compact else result
 
-def get_all_todos(user_id: str, filter_status: str = "all") -> List[Dict]:
-    """Google TasksからTODOアイテムを取得する"""
     # データベースセッションを取得
     db = next(get_db())
     
@@ -77,22 +168,7 @@ def get_all_todos(user_id: str, filter_status: str = "all") -> List[Dict]:
     try:
         tasks_service = get_google_tasks_service(user_id, db)
         if tasks_service:
-            tasklist_id = _get_default_tasklist_id(tasks_service)
-            if tasklist_id:
-                # Google Tasksからタスクを取得
-                google_tasks = tasks_service.tasks().list(tasklist=tasklist_id).execute()
-                
-                for google_task in google_tasks.get('items', []):
-                    # フィルターステータスに応じてGoogle Tasksをフィルタリング
-                    is_completed = google_task.get('status') == 'completed'
-                    
-                    if filter_status == "completed" and not is_completed:
-                        continue
-                    elif filter_status == "active" and is_completed:
-                        continue
-                    
-                    # Google Taskを結果に追加
-                    result.append(_create_task_dict(google_task, user_id))
+            result = _list_todos(db, tasks_service, user_id, filter_status)
     except AuthenticationRequiredException as e:
         # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
         print(f"[ERROR] Authentication required for user {user_id}: {e}")
@@ -101,12 +177,86 @@ def get_all_todos(user_id: str, filter_status: str = "all") -> List[Dict]:
             "message": str(e),
             "action": "re-authenticate"
         }]
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return [e.as_dict()]
     except Exception as e:
         # Google API呼び出しでエラーが発生した場合、ログに記録するが処理は継続
         print(f"[ERROR] Google Tasks API error in get_all_todos for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
     
+    if compact:
+        return compact_items(result)
+    return result
+
+
+def warm_todos(user_id: str, filter_status: str = "all") -> bool:
+    """TODOの一覧を先読みしてキャッシュに入れる（キャッシュ済みの場合は何もせずFalseを返す）"""
+    if not todo_list_cache.enabled or todo_list_cache.get(user_id, filter_status, record_metrics=False) is not None:
+        return False
+
+    # データベースセッションを取得
+    db = next(get_db())
+
+    try:
+        tasks_service = get_google_tasks_service(user_id, db)
+        if not tasks_service:
+            return False
+        _list_todos(db, tasks_service, user_id, filter_status)
+        return True
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+
+
+def stream_todos(user_id: str, filter_status: str = "all", cursor: Optional[str] = None, compact: bool = False) -> Dict:
+    """Google TasksからTODOアイテムをページごとに取得し、1回の応答の大きさの上限まで返す
+
+    一覧全体をメモリに持たないように、キャッシュと検索インデックスは使わない。
+    続きがある場合はnext_cursorを返すので、次の呼び出しのcursorに渡す。
+    """
+    try:
+        page_token, offset = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        return {"error": str(e)}
+
+    # データベースセッションを取得（Credentials用。サービスを作成したらすぐに返却する）
+    db = next(get_db())
+
+    try:
+        tasks_service = get_google_tasks_service(user_id, db)
+    except AuthenticationRequiredException as e:
+        # 認証エラーの場合は、ユーザーに再認証を促すメッセージを返す
+        print(f"[ERROR] Authentication required for user {user_id}: {e}")
+        return {
+            "error": "authentication_required",
+            "message": str(e),
+            "action": "re-authenticate"
+        }
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
+    if not tasks_service:
+        return {"error": "Google Tasks service not available"}
+
+    try:
+        result = collect_pages(_iter_todo_pages(tasks_service, user_id, filter_status, page_token), offset, compact, label='todos')
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
+    except Exception as e:
+        print(f"[ERROR] Google Tasks API error in stream_todos for user {user_id}: {type(e).__name__}: {e}")
+        if hasattr(e, 'resp') and e.resp:
+            print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
+        return {"error": f"Google API error: {type(e).__name__}: {e}"}
+
+    print(f"[stream_todos] user_id: {user_id}, returning {len(result['items'])} todos from {result['pages']} pages ({result['bytes']} bytes)")
     return result
 
 
@@ -126,7 +276,8 @@ def get_todo(user_id: str, todo_id: str) -> Dict:
                 # 指定されたIDのタスクを取得
                 google_task = tasks_service.tasks().get(
                     tasklist=tasklist_id,
-                    task=google_task_id
+                    task=google_task_id,
+                    fields=TASK_FIELDS
                 ).execute()
                 
                 return _create_task_dict(google_task, user_id)
@@ -140,11 +291,18 @@ def get_todo(user_id: str, todo_id: str) -> Dict:
             "message": str(e),
             "action": "re-authenticate"
         }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
     except Exception as e:
         print(f"[ERROR] Failed to get todo {todo_id} for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
         return {"error": f"Todo with ID {todo_id} not found: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
 
 
 def update_todo_status(user_id: str, todo_id: str, completed: bool) -> Dict:
@@ -168,10 +326,14 @@ def update_todo_status(user_id: str, todo_id: str, completed: bool) -> Dict:
                 updated_task = tasks_service.tasks().patch(
                     tasklist=tasklist_id,
                     task=google_task_id,
-                    body=task_body
+                    body=task_body,
+                    fields=TASK_FIELDS
                 ).execute()
                 
-                return _create_task_dict(updated_task, user_id)
+                todo = _create_task_dict(updated_task, user_id)
+                index_items(db, user_id, 'todo', [todo])
+                todo_list_cache.invalidate(user_id)
+                return todo
         print(f"[ERROR] Google Tasks service not available for user {user_id}")
         return {"error": "Google Tasks service not available (authentication may be expired)"}
     except AuthenticationRequiredException as e:
@@ -182,8 +344,15 @@ def update_todo_status(user_id: str, todo_id: str, completed: bool) -> Dict:
             "message": str(e),
             "action": "re-authenticate"
         }
+    except OverloadedError as e:
+        # Google APIの同時呼び出し数の上限を超えた場合は、すぐにoverloadedを返す
+        print(f"[WARNING] {e} (user {user_id})")
+        return e.as_dict()
     except Exception as e:
         print(f"[ERROR] Failed to update todo {todo_id} for user {user_id}: {type(e).__name__}: {e}")
         if hasattr(e, 'resp') and e.resp:
             print(f"[ERROR] API Response: status={e.resp.status}, reason={e.resp.reason}")
-        return {"error": f"Failed to update todo with ID {todo_id}: {type(e).__name__}: {e}"}
\ No newline at end of file
+        return {"error": f"Failed to update todo with ID {todo_id}: {type(e).__name__}: {e}"}
+    finally:
+        # コネクションプールへ確実に返却する
+        db.close()
\ No newline at end of file